@@ -1,11 +1,41 @@
-import binaryninja
+try:
+    import binaryninja
+except ImportError:
+    # headless use (library / python -m), there is nothing to register
+    binaryninja = None
 
-from .riscv import RISCV
-RISCV.register()
+if binaryninja is not None:
+    from .riscv import RISCV, watch_patches, release_file
+    RISCV.register()
 
-RISCV_ELF = 243
-binaryninja.BinaryViewType['ELF'].register_arch(
-    RISCV_ELF, 
-    binaryninja.enums.Endianness.LittleEndian, 
-    binaryninja.Architecture['riscv:hacksec']
-)
+    # patched bytes only drop their own cached decodes
+    binaryninja.BinaryViewEvent.register(
+        binaryninja.enums.BinaryViewEventType.BinaryViewFinalizationEvent,
+        watch_patches
+    )
+
+    try:
+        from binaryninjaui import UIContext, UIContextNotification
+    except ImportError:
+        # headless, call riscv.release_file(view.file) before closing a view
+        UIContext = None
+
+    if UIContext is not None:
+        class CloseListener(UIContextNotification):
+            '''lets go of the views of closed files'''
+
+            def __init__(self):
+                UIContextNotification.__init__(self)
+                UIContext.registerNotification(self)
+
+            def OnAfterCloseFile(self, context, file, frame):
+                release_file(file.getMetadata())
+
+        close_listener = CloseListener()
+
+    RISCV_ELF = 243
+    binaryninja.BinaryViewType['ELF'].register_arch(
+        RISCV_ELF,
+        binaryninja.enums.Endianness.LittleEndian,
+        binaryninja.Architecture['riscv:hacksec']
+    )
@@ -0,0 +1,42 @@
+'''headless disassembler, does not need binary ninja
+
+    python -m <plugin dir> [--raw] [--base ADDR] FILE
+'''
+import argparse
+import sys
+
+from .elf import exec_regions, is_elf
+from .sweep import decode_range
+
+def disassemble(data, regions, out=sys.stdout):
+    for name, addr, offset, size in regions:
+        out.write('\n%s:\n' % name)
+
+        base = addr - offset
+        for r in decode_range(data, base, offset, offset + size):
+            raw = data[r.addr - base:r.addr - base + r.length].hex()
+            out.write(('%08x:  %-8s  %s %s' % (r.addr, raw, r.mnemonic, r.operands)).rstrip() + '\n')
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='python -m %s' % __package__, description='linear sweep RISC-V disassembler')
+    p.add_argument('file')
+    p.add_argument('--raw', action='store_true', help='treat the file as raw code even if it is an ELF')
+    p.add_argument('--base', type=lambda x: int(x, 0), default=0, help='load address of a raw file')
+    args = p.parse_args(argv)
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+
+    if not args.raw and is_elf(data):
+        try:
+            regions = exec_regions(data)
+        except ValueError as e:
+            p.error('%s, use --raw to disassemble it anyway' % e)
+    else:
+        regions = [('raw', args.base, 0, len(data))]
+
+    disassemble(data, regions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,552 @@
+'''decoder benchmarks
+
+run from the plugins folder with: python -m <plugin dir>.bench
+
+    --output FILE       write the results as json
+    --baseline FILE     compare against an earlier --output, exit status 1
+                        if anything regressed by more than --threshold
+    --fields            field extraction micro-benchmark only
+    --stress THREADS    call the RISCV callbacks (or the decode cache) from
+                        THREADS threads and check every result, exit status
+                        1 on a wrong one
+
+corpora are generated from a fixed seed so runs are comparable. the RISCV
+callbacks are benchmarked against a stub il and only when binaryninja is
+available.
+'''
+import argparse
+import json
+import platform
+import random
+import struct
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+
+from . import instr
+from .cache import DecodeCache
+from .instr import CInstr, Instr, decode, decode_base, decode_compressed, u32, INFO, TEXT, IL, ALL
+
+# ------- field extraction -------
+
+# the primitives as they were before the fast path, kept as the baseline
+def ref_u32(dat):
+    x = 0
+    x += dat[0]
+    x += (dat[1] << 8)
+    x += (dat[2] << 16)
+    x += (dat[3] << 24)
+    return x
+
+def ref_bits(x,hi,lo):
+    return (x >> lo) & ((2 ** (hi - lo + 1)) - 1)
+
+def ref_ext(x,n):
+    if (x >> (n-1)) & 1:
+        return -((2**n) - x)
+    else:
+        return x
+
+def eager_fields(dat, u32, bits, ext):
+    '''extraction of every field, like the old Instr.__init__'''
+    x = u32(dat)
+    imm_i = bits(x,31,20)
+    imm_s = (bits(x,31,25) << 5) + (bits(x,11,7))
+    imm_b = (bits(x,31,31) << 12) + (bits(x,7,7) << 11) + (bits(x,30,25) << 5) + (bits(x,11,8) << 1)
+    imm_j = (bits(x,31,31) << 20) + (bits(x,19,12) << 12) + (bits(x,20,20) << 11) + (bits(x,30,21) << 1)
+    return (
+        bits(x,1,0), bits(x,6,2), bits(x,6,0),
+        bits(x,11,7), bits(x,19,15), bits(x,24,20),
+        bits(x,14,12), bits(x,31,25),
+        imm_i, imm_s, imm_b, (bits(x,31,12) << 12), imm_j,
+        ext(imm_i, 12), ext(imm_s, 12), ext(imm_b, 13), ext(imm_j, 21)
+    )
+
+def ref_fields(dat):
+    return eager_fields(dat, ref_u32, ref_bits, ref_ext)
+
+def prim_fields(dat):
+    return eager_fields(dat, instr.u32, instr.bits, instr.ext)
+
+def fast_fields(dat):
+    v = Instr(u32(dat))
+    return (
+        v.base, v.op, v.opcode,
+        v.rd, v.rs1, v.rs2,
+        v.funct3, v.funct7,
+        v.imm_i, v.imm_s, v.imm_b, v.imm_u, v.imm_j,
+        v.imm_i_ext, v.imm_s_ext, v.imm_b_ext, v.imm_j_ext
+    )
+
+def ref_itype(dat):
+    # the old constructor always did all the work, whatever was read after
+    return ref_fields(dat)
+
+def fast_itype(dat):
+    '''what an I-type decode actually reads'''
+    v = Instr(u32(dat))
+    return (v.op, v.funct3, v.funct7, v.rd, v.rs1, v.imm_i_ext)
+
+def random_words(n, seed=0):
+    rnd = random.Random(seed)
+    return [struct.pack('<I', rnd.getrandbits(32) | 0b11) for _ in range(n)]
+
+def per_instr_ns(fn, corpus, repeat):
+    t = min(timeit.repeat(lambda: [fn(d) for d in corpus], number=1, repeat=repeat))
+    return t / len(corpus) * 1e9
+
+def bench_fields(n=100000, repeat=5, out=sys.stdout):
+    '''per-instruction field extraction cost before and after the fast path'''
+    corpus = random_words(n)
+
+    for d in corpus:
+        assert ref_fields(d) == prim_fields(d) == fast_fields(d)
+
+    rows = [
+        ('primitives', ref_fields, prim_fields),
+        ('all fields', ref_fields, fast_fields),
+        ('i-type fields', ref_itype, fast_itype),
+    ]
+
+    out.write('%-16s %12s %12s %8s\n' % ('', 'before ns', 'after ns', 'speedup'))
+    for name, before, after in rows:
+        b = per_instr_ns(before, corpus, repeat)
+        a = per_instr_ns(after, corpus, repeat)
+        out.write('%-16s %12.1f %12.1f %7.2fx\n' % (name, b, a, b / a))
+
+# ------- corpora -------
+
+def reg(rnd):
+    return rnd.randrange(32)
+
+def enc_r(op, f3, f7, rd, rs1, rs2):
+    return (f7 << 25) | (rs2 << 20) | (rs1 << 15) | (f3 << 12) | (rd << 7) | (op << 2) | 0b11
+
+def enc_i(op, f3, rd, rs1, imm):
+    return ((imm & 0xfff) << 20) | (rs1 << 15) | (f3 << 12) | (rd << 7) | (op << 2) | 0b11
+
+def enc_s(op, f3, rs1, rs2, imm):
+    imm &= 0xfff
+    return ((imm >> 5) << 25) | (rs2 << 20) | (rs1 << 15) | (f3 << 12) | ((imm & 0x1f) << 7) | (op << 2) | 0b11
+
+def enc_b(f3, rs1, rs2, imm):
+    imm &= 0x1fff
+    return (((imm >> 12) & 1) << 31) | (((imm >> 5) & 0x3f) << 25) | (rs2 << 20) | (rs1 << 15) | (f3 << 12) \
+        | (((imm >> 1) & 0xf) << 8) | (((imm >> 11) & 1) << 7) | (0b11000 << 2) | 0b11
+
+def enc_u(op, rd, imm):
+    return (imm & 0xfffff000) | (rd << 7) | (op << 2) | 0b11
+
+def enc_j(rd, imm):
+    imm &= 0x1fffff
+    return (((imm >> 20) & 1) << 31) | (((imm >> 1) & 0x3ff) << 21) | (((imm >> 11) & 1) << 20) \
+        | (((imm >> 12) & 0xff) << 12) | (rd << 7) | (0b11011 << 2) | 0b11
+
+def enc_c(op, f3, rnd, rd=None, bit12=None):
+    '''compressed encoding with random operand bits'''
+    x = (f3 << 13) | (rnd.getrandbits(11) << 2) | op
+    if rd is not None:
+        x = (x & ~(0x1f << 7)) | (rd << 7)
+    if bit12 is not None:
+        x = (x & ~(1 << 12)) | (bit12 << 12)
+    return x
+
+def nz(rnd):
+    return rnd.randrange(1, 32)
+
+# (weight, generator) for code that looks like compiled RV64GC
+MIX = [
+    (6, lambda r: enc_c(0b10, 0b011, r, rd=nz(r))),                     # c.ldsp
+    (6, lambda r: enc_c(0b10, 0b111, r)),                               # c.sdsp
+    (8, lambda r: enc_c(0b10, 0b100, r, rd=nz(r), bit12=0) | (nz(r) << 2)),   # c.mv
+    (2, lambda r: enc_c(0b10, 0b100, r, rd=nz(r), bit12=1) | (nz(r) << 2)),   # c.add
+    (5, lambda r: enc_c(0b01, 0b010, r, rd=nz(r))),                     # c.li
+    (6, lambda r: enc_c(0b01, 0b000, r, rd=nz(r))),                     # c.addi
+    (5, lambda r: enc_c(0b00, 0b011, r)),                               # c.ld
+    (4, lambda r: enc_c(0b00, 0b111, r)),                               # c.sd
+    (3, lambda r: enc_c(0b01, 0b101, r)),                               # c.j
+    (4, lambda r: enc_c(0b01, r.choice((0b110, 0b111)), r)),            # c.beqz / c.bnez
+    (2, lambda r: enc_c(0b10, 0b100, r, rd=nz(r), bit12=0) & ~(0x1f << 2)),   # c.jr
+    (2, lambda r: enc_c(0b10, 0b000, r, rd=nz(r))),                     # c.slli
+    (6, lambda r: enc_c(0b01, 0b100, r)),                               # c.srli ... c.addw
+    (5, lambda r: enc_i(0b00000, 0b011, reg(r), reg(r), r.getrandbits(12))),  # ld
+    (2, lambda r: enc_i(0b00000, 0b010, reg(r), reg(r), r.getrandbits(12))),  # lw
+    (4, lambda r: enc_s(0b01000, 0b011, reg(r), reg(r), r.getrandbits(12))),  # sd
+    (2, lambda r: enc_s(0b01000, 0b010, reg(r), reg(r), r.getrandbits(12))),  # sw
+    (8, lambda r: enc_i(0b00100, 0b000, reg(r), reg(r), r.getrandbits(12))),  # addi
+    (2, lambda r: enc_i(0b00110, 0b000, reg(r), reg(r), r.getrandbits(12))),  # addiw
+    (1, lambda r: enc_i(0b00100, 0b001, reg(r), reg(r), r.getrandbits(6))),   # slli
+    (2, lambda r: enc_r(0b01100, 0b000, 0, reg(r), reg(r), reg(r))),          # add
+    (1, lambda r: enc_r(0b01100, 0b000, 1, reg(r), reg(r), reg(r))),          # mul
+    (3, lambda r: enc_u(0b00101, reg(r), r.getrandbits(32))),                 # auipc
+    (2, lambda r: enc_u(0b01101, reg(r), r.getrandbits(32))),                 # lui
+    (4, lambda r: enc_j(r.choice((0, 1, 1)), r.getrandbits(21) & ~1)),        # jal
+    (2, lambda r: enc_i(0b11001, 0b000, r.choice((0, 1)), reg(r), 0)),        # jalr
+    (4, lambda r: enc_b(r.choice((0b000, 0b001)), reg(r), reg(r), r.getrandbits(13) & ~1)),  # beq / bne
+    (2, lambda r: enc_b(r.choice((0b100, 0b101, 0b110, 0b111)), reg(r), reg(r), r.getrandbits(13) & ~1)),
+    (2, lambda r: enc_i(0b00001, 0b011, reg(r), reg(r), r.getrandbits(12))),  # fld
+    (1, lambda r: enc_s(0b01001, 0b011, reg(r), reg(r), r.getrandbits(12))),  # fsd
+    (1, lambda r: enc_r(0b10100, 0b111, r.choice((0x01, 0x05, 0x09)), reg(r), reg(r), reg(r))),  # fadd.d ... fmul.d
+    (1, lambda r: enc_r(0b01011, 0b011, 0, reg(r), reg(r), reg(r))),          # amoadd.d
+]
+
+BRANCHES = [
+    (4, lambda r: enc_b(r.choice((0b000, 0b001, 0b100, 0b101, 0b110, 0b111)), reg(r), reg(r), r.getrandbits(13) & ~1)),
+    (2, lambda r: enc_j(r.choice((0, 1)), r.getrandbits(21) & ~1)),
+    (1, lambda r: enc_i(0b11001, 0b000, r.choice((0, 1)), reg(r), 0)),
+    (2, lambda r: enc_c(0b01, 0b101, r)),
+    (3, lambda r: enc_c(0b01, r.choice((0b110, 0b111)), r)),
+    (1, lambda r: enc_c(0b10, 0b100, r, rd=nz(r), bit12=0) & ~(0x1f << 2)),
+]
+
+def pack(x):
+    return struct.pack('<H', x) if x & 0b11 != 0b11 else struct.pack('<I', x)
+
+def from_mix(mix, n, rnd):
+    weights = [w for w, _ in mix]
+    gens = [g for _, g in mix]
+    return [pack(g(rnd)) for g in rnd.choices(gens, weights, k=n)]
+
+def corpus_uniform(n, rnd):
+    '''uniform random 32-bit words, mostly invalid or rare encodings'''
+    return [struct.pack('<I', rnd.getrandbits(32)) for _ in range(n)]
+
+def corpus_rv64gc(n, rnd):
+    return from_mix(MIX, n, rnd)
+
+def corpus_rvc(n, rnd):
+    '''random compressed halfwords'''
+    return [struct.pack('<H', (rnd.getrandbits(14) << 2) | rnd.randrange(3)) for _ in range(n)]
+
+def corpus_branchy(n, rnd):
+    '''half branches and jumps, half the usual mix'''
+    return [x if rnd.random() < 0.5 else y for x, y in zip(from_mix(BRANCHES, n, rnd), from_mix(MIX, n, rnd))]
+
+CORPORA = {
+    'uniform': corpus_uniform,
+    'rv64gc': corpus_rv64gc,
+    'rvc': corpus_rvc,
+    'branchy': corpus_branchy,
+}
+
+def build_corpus(name, n, seed=0):
+    '''[(data, addr)] laid out as one linear block of code
+
+    data is padded to 8 bytes like the buffers binary ninja passes in
+    '''
+    rnd = random.Random('%s:%d' % (name, seed))
+    code = CORPORA[name](n, rnd)
+
+    out = []
+    addr = 0x10000
+    for c in code:
+        out.append((c + bytes(8 - len(c)), addr))
+        addr += len(c)
+    return out
+
+# ------- decoder benchmarks -------
+
+class StubExpr(object):
+    __slots__ = ('operation', 'constant')
+
+    def __init__(self, op, args):
+        self.operation = None
+        self.constant = None
+        if op in ('const', 'const_pointer'):
+            self.operation = instr.LowLevelILOperation.LLIL_CONST
+            self.constant = args[1]
+
+class StubIL(object):
+    '''stands in for LowLevelILFunction, expressions are numbered and dropped'''
+
+    def __init__(self):
+        self.exprs = []
+
+    def __getattr__(self, name):
+        def expr(*args):
+            self.exprs.append((name, args))
+            return len(self.exprs) - 1
+        return expr
+
+    def __getitem__(self, i):
+        return StubExpr(*self.exprs[i])
+
+    def append(self, expr):
+        pass
+
+    def mark_label(self, label):
+        pass
+
+    def get_label_for_address(self, arch, addr):
+        return None
+
+    def reset(self):
+        del self.exprs[:]
+
+def split(corpus):
+    '''(base, compressed) lists of (Instr / CInstr, addr)'''
+    base, comp = [], []
+    for d, a in corpus:
+        if d[0] & 0b11 == 0b11:
+            base.append((u32(d), a))
+        else:
+            comp.append((struct.unpack_from('<H', d)[0], a))
+    return base, comp
+
+def decoder_benchmarks(corpus):
+    '''name -> (fn over the corpus, item count)'''
+    base, comp = split(corpus)
+
+    b = {
+        'decode': (lambda: [decode(d, a) for d, a in corpus], len(corpus)),
+        'decode.info': (lambda: [decode(d, a, INFO) for d, a in corpus], len(corpus)),
+        'decode.text': (lambda: [decode(d, a, TEXT) for d, a in corpus], len(corpus)),
+        'decode.il': (lambda: [decode(d, a, IL) for d, a in corpus], len(corpus)),
+        'decode_base': (lambda: [decode_base(Instr(x), a) for x, a in base], len(base)),
+        'decode_compressed': (lambda: [decode_compressed(CInstr(x), a) for x, a in comp], len(comp)),
+    }
+
+    arch = riscv_arch()
+    if arch is not None:
+        il = StubIL()
+
+        def lift():
+            il.reset()
+            return [arch.get_instruction_low_level_il(d, a, il) for d, a in corpus]
+
+        def callbacks(*fns):
+            def run():
+                arch.decode_cache.clear()
+                return [fn() for fn in fns]
+            return run
+
+        b['riscv.info'] = (callbacks(lambda: [arch.get_instruction_info(d, a) for d, a in corpus]), len(corpus))
+        b['riscv.text'] = (callbacks(lambda: [arch.get_instruction_text(d, a) for d, a in corpus]), len(corpus))
+        b['riscv.il'] = (callbacks(lift), len(corpus))
+
+    return b
+
+_arch = []
+
+def riscv_arch():
+    '''RISCV instance, or None without binaryninja'''
+    if not _arch:
+        try:
+            from .riscv import RISCV
+            _arch.append(RISCV())
+        except ImportError:
+            _arch.append(None)
+    return _arch[0]
+
+def measure(fn, n, repeat):
+    fn() # warm up the lazy tables
+
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+
+    # memory still held after the run (what the results hold on to), and
+    # the peak over the run, which also counts the temporaries of decoding
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    keep = fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    size = sum(s.size_diff for s in stats if s.size_diff > 0)
+    del keep
+
+    return {
+        'ips': n / best if best else 0.0,
+        'retained': blocks / float(n or 1),
+        'retained_bytes': size / float(n or 1),
+        'peak_bytes': peak / float(n or 1),
+    }
+
+def run(corpora, n, repeat, out=sys.stdout):
+    results = {}
+    for name in corpora:
+        corpus = build_corpus(name, n)
+        results[name] = {}
+        for bench, (fn, count) in sorted(decoder_benchmarks(corpus).items()):
+            if not count:
+                continue
+            r = measure(fn, count, repeat)
+            results[name][bench] = r
+            out.write('%-8s %-18s %12.0f instr/s %8.2f retained/instr %9.1f retained bytes/instr %9.1f peak bytes/instr\n' % (
+                name, bench, r['ips'], r['retained'], r['retained_bytes'], r['peak_bytes']))
+
+    return {
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'n': n,
+        'results': results,
+    }
+
+def compare(current, baseline, threshold):
+    '''[message] for every benchmark that regressed against the baseline'''
+    regressions = []
+    for corpus, benches in current['results'].items():
+        for bench, r in benches.items():
+            b = baseline.get('results', {}).get(corpus, {}).get(bench)
+            if b is None:
+                continue
+
+            if r['ips'] < b['ips'] * (1 - threshold):
+                regressions.append('%s/%s: %.0f instr/s, baseline %.0f' % (corpus, bench, r['ips'], b['ips']))
+            # baselines from before the peak was measured only have some keys
+            if 'retained' in b and r['retained'] > b['retained'] * (1 + threshold) + 0.5:
+                regressions.append('%s/%s: %.2f retained blocks/instr, baseline %.2f' % (corpus, bench, r['retained'], b['retained']))
+            if 'peak_bytes' in b and r['peak_bytes'] > b['peak_bytes'] * (1 + threshold) + 8:
+                regressions.append('%s/%s: %.1f peak bytes/instr, baseline %.1f' % (corpus, bench, r['peak_bytes'], b['peak_bytes']))
+
+    return regressions
+
+# ------- thread stress -------
+
+def callback_results(arch, cache):
+    '''(name, fn(data, addr, il) -> comparable result) of the three callbacks
+
+    without binaryninja the shared DecodeCache is hammered directly
+    '''
+    def info_key(h):
+        return h.length, tuple((int(b.type), b.target) for b in h.branches)
+
+    if arch is not None:
+        def info(d, a, il):
+            return info_key(arch.get_instruction_info(d, a))
+
+        def text(d, a, il):
+            tok, n = arch.get_instruction_text(d, a)
+            return tuple(t.text for t in tok), n
+
+        def lift(d, a, il):
+            il.reset()
+            n = arch.get_instruction_low_level_il(d, a, il)
+            # labels are new objects on every lift
+            return n, tuple((op, tuple(x if type(x) in (int, str) else type(x).__name__ for x in args))
+                            for op, args in il.exprs)
+
+    else:
+        def info(d, a, il):
+            r = cache.decode(d, a, INFO)
+            return r and info_key(r[1])
+
+        def text(d, a, il):
+            r = cache.decode(d, a, TEXT)
+            return r and tuple(t.text for t in r[0])
+
+        def lift(d, a, il):
+            r = cache.decode(d, a, IL)
+            return r and r[2]
+
+    return [('info', info), ('text', text), ('il', lift)]
+
+def stress(name, n, threads, rounds, out=sys.stdout):
+    '''call the callbacks from many threads at once and check every result
+
+    the cache is made small so entries are evicted, replaced and invalidated
+    while other threads use them. returns the number of wrong results
+    '''
+    corpus = build_corpus(name, n)
+    arch = riscv_arch()
+    cache = DecodeCache(size=256)
+    if arch is not None:
+        saved, arch.decode_cache = arch.decode_cache, cache
+
+    try:
+        fns = callback_results(arch, cache)
+
+        # expected results, single threaded on a cold cache
+        il = StubIL()
+        expect = []
+        for d, a in corpus:
+            cache.clear()
+            expect.append([fn(d, a, il) for _, fn in fns])
+        cache.clear()
+
+        errors = []
+        def worker(seed):
+            rnd = random.Random(seed)
+            il = StubIL()
+            order = list(range(len(corpus)))
+            for _ in range(rounds):
+                rnd.shuffle(order)
+                for i in order:
+                    d, a = corpus[i]
+                    k = rnd.randrange(len(fns))
+                    if fns[k][1](d, a, il) != expect[i][k]:
+                        errors.append((fns[k][0], a))
+                    if rnd.random() < 0.01:
+                        cache.invalidate(a, 2)
+
+        pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        # switch threads often so they interleave inside the cache
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        t = time.perf_counter()
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        t = time.perf_counter() - t
+        sys.setswitchinterval(interval)
+
+    finally:
+        if arch is not None:
+            arch.decode_cache = saved
+
+    calls = threads * rounds * len(corpus)
+    out.write('%-8s %d threads %12.0f calls/s %6d errors  %s\n' % (
+        name, threads, calls / t if t else 0.0, len(errors), cache.stats()))
+    return len(errors)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='python -m %s.bench' % __package__)
+    p.add_argument('--corpus', action='append', choices=sorted(CORPORA), help='default: all of them')
+    p.add_argument('-n', type=int, default=20000, help='instructions per corpus')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--output', help='write the results to this json file')
+    p.add_argument('--baseline', help='json file from an earlier --output to compare against')
+    p.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown, default 0.1')
+    p.add_argument('--fields', action='store_true', help='only run the field extraction micro-benchmark')
+    p.add_argument('--stress', type=int, metavar='THREADS', help='only run the thread stress test')
+    args = p.parse_args(argv)
+
+    if args.fields:
+        bench_fields()
+        return 0
+
+    if args.stress:
+        errors = sum(stress(name, args.n, args.stress, args.repeat) for name in args.corpus or sorted(CORPORA))
+        return 1 if errors else 0
+
+    if riscv_arch() is None:
+        sys.stdout.write('binaryninja not available, skipping the RISCV callbacks\n')
+
+    current = run(args.corpus or sorted(CORPORA), args.n, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(current, baseline, args.threshold)
+        for r in regressions:
+            sys.stdout.write('REGRESSION %s\n' % r)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import threading
+
+from .instr import decode, ALL, INFO
+
+class Stripe(object):
+    '''one LRU of the cache with its lock and counters'''
+    __slots__ = ('lock', 'entries', 'hits', 'misses', 'invalidated')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # addr -> (raw bytes, mode, result)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+class DecodeCache(object):
+    '''bounded LRU cache of decode results keyed on the address
+
+    entries remember the raw instruction bytes they were decoded from, a
+    lookup with other bytes (patched, or another view) decodes again and
+    replaces the entry. entries also remember which decode mode built them,
+    asking for more than that decodes the missing parts and merges them in
+
+    the callbacks run on binary ninja's analysis threads, so addresses are
+    spread over lock-striped LRUs (neighbouring instructions land in
+    different stripes). hits take no lock, the lookup and the LRU move are
+    single OrderedDict operations which the GIL keeps atomic. inserts,
+    evictions and invalidations hold the stripe lock. decoding runs
+    unlocked: two threads missing the same address both decode it and the
+    last insert wins. results are never modified after they are stored, so
+    a caller always gets a complete decode of the bytes it passed. the hit
+    count can miss a few hits under contention, misses are exact
+    '''
+
+    def __init__(self, size=8192, stripes=16):
+        # stripes is rounded up to a power of two
+        n = 1 << max(0, stripes - 1).bit_length()
+        self.size = size
+        self.stripes = [Stripe() for _ in range(n)]
+        self.mask = n - 1
+        self.stripe_size = max(1, size // n)
+
+    def stripe(self, addr):
+        return self.stripes[(addr >> 1) & self.mask]
+
+    def peek(self, addr):
+        '''the entry of addr or None, without counting or touching the LRU'''
+        return self.stripe(addr).entries.get(addr)
+
+    def decode(self, dat, addr, mode=ALL):
+        # only the bytes of the instruction itself are checked
+        n = 4 if (dat[0] & 0b11) == 0b11 else 2
+        raw = bytes(dat[:n])
+
+        s = self.stripes[(addr >> 1) & self.mask]
+        e = s.entries.get(addr)
+        if e is not None and e[0] != raw:
+            e = None
+        elif e is not None and e[1] & mode == mode:
+            s.hits += 1
+            try:
+                s.entries.move_to_end(addr)
+            except KeyError:
+                # evicted since the lookup
+                pass
+            return e[2]
+
+        if e is None:
+            r = decode(dat, addr, mode)
+        else:
+            # decode only the parts missing from the entry and merge them in
+            r = decode(dat, addr, mode & ~e[1])
+            r = tuple(a if a is not None else b for a, b in zip(e[2], r))
+            mode |= e[1]
+
+        if r is None:
+            # nothing more to build for invalid instructions
+            mode = ALL
+
+        with s.lock:
+            s.misses += 1
+            s.entries[addr] = (raw, mode, r)
+            s.entries.move_to_end(addr)
+            if len(s.entries) > self.stripe_size:
+                s.entries.popitem(last=False)
+
+        return r
+
+    def decode_block(self, dat, addr, mode=INFO):
+        '''decode forward through dat up to the end of the basic block
+
+        every instruction up to the first one with branches (or an invalid
+        one) is stored, so the callbacks for the rest of the block are hits.
+        returns the result at addr
+        '''
+        dat = memoryview(dat).cast('B')
+        first = None
+
+        off = 0
+        while off + 2 <= len(dat):
+            n = 4 if (dat[off] & 0b11) == 0b11 else 2
+            if off + n > len(dat):
+                break
+
+            a = addr + off
+            e = self.peek(a)
+            if e is not None and e[0] == dat[off:off+n] and e[1] & mode == mode:
+                r = e[2]
+            else:
+                r = self.decode(dat[off:off+n], a, mode)
+
+            if off == 0:
+                first = r
+            if r is None or r[1].branches:
+                break
+            off += r[1].length
+
+        return first
+
+    def invalidate(self, start, length=None):
+        '''drop the entries of instructions overlapping [start, start+length)
+
+        without a length everything from start on is dropped, inserting or
+        removing data moves all later addresses
+        '''
+        # a 4 byte instruction up to 3 bytes before start overlaps it
+        lo = start - 3
+        if length is not None and length + 3 <= self.stripe_size:
+            for a in range(lo, start + length):
+                self.drop(self.stripe(a), a, start)
+            return
+
+        end = start + length if length is not None else None
+        for s in self.stripes:
+            with s.lock:
+                addrs = [a for a in s.entries if a >= lo and (end is None or a < end)]
+            for a in addrs:
+                self.drop(s, a, start)
+
+    def drop(self, s, a, start):
+        with s.lock:
+            e = s.entries.get(a)
+            if e is not None and a + len(e[0]) > start:
+                del s.entries[a]
+                s.invalidated += 1
+
+    def clear(self):
+        for s in self.stripes:
+            with s.lock:
+                s.entries.clear()
+                s.hits = 0
+                s.misses = 0
+                s.invalidated = 0
+
+    def stats(self):
+        return {
+            'hits': sum(s.hits for s in self.stripes),
+            'misses': sum(s.misses for s in self.stripes),
+            'invalidated': sum(s.invalidated for s in self.stripes),
+            'entries': sum(len(s.entries) for s in self.stripes),
+            'size': self.size,
+            'stripes': len(self.stripes)
+        }
@@ -0,0 +1,184 @@
+'''columnar store of decoded instructions, for bulk and headless use
+
+one array per field instead of a decode result per instruction, 32 bytes an
+instruction:
+
+    addr        u8  address
+    length      u1  2 or 4
+    mnemonic    u2  index into the mnemonics string table, the op of the
+                    decode result ('addi', 'c.lw', 'jalr' ...), 'unk' for
+                    invalid instructions
+    rd rs1 rs2  i1  register numbers, x0-x31 are 0-31, f0-f31 32-63, -1
+    rs3             when the instruction has no such operand (rs3 is only
+                    used by fmadd / fmsub / fnmadd / fnmsub)
+    imm         i8  first immediate (offset, constant, csr number), the
+                    target offset for jumps and branches
+    branch      u1  BranchType of the taken branch, NO_BRANCH for none
+    target      u8  its target, 0 for indirect branches, returns and
+                    instructions without a branch
+
+columns are array.array, to_numpy / save_npz need numpy.
+
+    store = ColumnStore.from_buffer(code, 0x80000000)
+    store.save_npz('code.npz')
+'''
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .instr import decode, BranchType, FREGS, IL, REGS
+
+NO_BRANCH = 0xff
+
+# register name -> number
+REG_NUM = {r: i for i, r in enumerate(REGS[:32])}
+REG_NUM.update((r, 32 + i) for i, r in enumerate(FREGS))
+
+# branch types with a target address
+DIRECT = {BranchType.UnconditionalBranch, BranchType.TrueBranch, BranchType.CallDestination}
+
+# ops whose first register operand is read, not written
+NO_RD = {
+    'sb', 'sh', 'sw', 'sd', 'fsw', 'fsd',
+    'c.sw', 'c.sd', 'c.swsp', 'c.sdsp', 'c.fsd', 'c.fsdsp',
+    'beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'c.beqz', 'c.bnez',
+}
+
+# name -> array typecode
+COLUMNS = [
+    ('addr', 'Q'),
+    ('length', 'B'),
+    ('mnemonic', 'H'),
+    ('rd', 'b'),
+    ('rs1', 'b'),
+    ('rs2', 'b'),
+    ('rs3', 'b'),
+    ('imm', 'q'),
+    ('branch', 'B'),
+    ('target', 'Q'),
+]
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy export needs numpy')
+
+class ColumnStore(object):
+
+    def __init__(self):
+        for name, code in COLUMNS:
+            setattr(self, name, array(code))
+
+        self.mnemonics = []
+        self.mnemonic_ids = {}
+
+    def __len__(self):
+        return len(self.addr)
+
+    def mnemonic_id(self, name):
+        i = self.mnemonic_ids.get(name)
+        if i is None:
+            i = self.mnemonic_ids[name] = len(self.mnemonics)
+            self.mnemonics.append(name)
+        return i
+
+    def append(self, addr, r):
+        '''add a decode result (IL mode at least, None if invalid) at addr'''
+        self.addr.append(addr)
+
+        if r is None or r[2] is None:
+            self.length.append(2 if r is None else r[1].length)
+            self.mnemonic.append(self.mnemonic_id('unk'))
+            self.rd.append(-1)
+            self.rs1.append(-1)
+            self.rs2.append(-1)
+            self.rs3.append(-1)
+            self.imm.append(0)
+            self.branch.append(NO_BRANCH)
+            self.target.append(0)
+            return
+
+        info = r[1]
+        op, args = r[2]
+
+        branch, target = NO_BRANCH, None
+        for b in info.branches:
+            if b.type != BranchType.FalseBranch:
+                branch = int(b.type)
+                if b.type in DIRECT:
+                    target = b.target
+                break
+
+        regs = [REG_NUM[a] for a in args if type(a) is str]
+        if op in NO_RD:
+            regs.insert(0, -1)
+        regs += [-1] * (4 - len(regs))
+
+        if target is not None:
+            imm = target - addr
+        else:
+            imm = next((a for a in args if type(a) is int), 0)
+
+        self.length.append(info.length)
+        self.mnemonic.append(self.mnemonic_id(op))
+        self.rd.append(regs[0])
+        self.rs1.append(regs[1])
+        self.rs2.append(regs[2])
+        self.rs3.append(regs[3])
+        self.imm.append(imm)
+        self.branch.append(branch)
+        self.target.append(target & 0xffffffffffffffff if target is not None else 0)
+
+    @classmethod
+    def from_buffer(cls, buf, base_addr, start=0, end=None):
+        '''linear sweep over buf[start:end] like sweep.decode_range'''
+        store = cls()
+        dat = memoryview(buf).cast('B')
+        if end is None:
+            end = len(dat)
+
+        off = start
+        while off < end:
+            addr = base_addr + off
+            r = decode(dat[off:off+4], addr, IL)
+            store.append(addr, r)
+            off += 2 if r is None else r[1].length
+
+        return store
+
+    def row(self, i):
+        '''the fields of instruction i as a dict, mnemonic as a string'''
+        d = {name: getattr(self, name)[i] for name, _ in COLUMNS}
+        d['mnemonic'] = self.mnemonics[d['mnemonic']]
+        return d
+
+    def nbytes(self):
+        return sum(getattr(self, name).itemsize * len(self) for name, _ in COLUMNS)
+
+    def to_numpy(self):
+        '''name -> numpy array, the columns are not copied'''
+        _require_numpy()
+        out = {name: np.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode) for name, _ in COLUMNS}
+        out['mnemonics'] = np.array(self.mnemonics)
+        return out
+
+    def save_npz(self, path, compressed=False):
+        _require_numpy()
+        (np.savez_compressed if compressed else np.savez)(path, **self.to_numpy())
+
+    @classmethod
+    def load_npz(cls, path):
+        _require_numpy()
+        store = cls()
+        with np.load(path) as f:
+            for name, code in COLUMNS:
+                if name in f.files:
+                    setattr(store, name, array(code, f[name].astype(code).tobytes()))
+                else:
+                    # saved before the column existed
+                    setattr(store, name, array(code, [-1]) * len(f['addr']))
+            for name in f['mnemonics']:
+                store.mnemonic_id(str(name))
+        return store
@@ -0,0 +1,71 @@
+'''just enough ELF parsing to find the code of a RISC-V image'''
+import struct
+
+SHT_NOBITS = 8
+SHF_EXECINSTR = 0x4
+
+EM_RISCV = 243
+
+PT_LOAD = 1
+PF_X = 0x1
+
+# (header, section header, program header) layouts after e_ident
+LAYOUT = {
+    1: ('<HHIIIIIHHHHHH', '<IIIIIIIIII', '<IIIIIIII'),
+    2: ('<HHIQQQIHHHHHH', '<IIQQQQIIQQ', '<IIQQQQQQ'),
+}
+
+def is_elf(data):
+    return data[:4] == b'\x7fELF'
+
+def exec_regions(data):
+    '''[(name, addr, offset, size)] of the executable parts of an ELF image
+
+    executable sections are used if there are any, otherwise executable
+    PT_LOAD segments
+    '''
+    if not is_elf(data):
+        raise ValueError('not an ELF file')
+    if data[4] not in LAYOUT:
+        raise ValueError('unknown ELF class %d' % data[4])
+    if data[5] != 1:
+        raise ValueError('only little endian ELF files are supported')
+
+    ehdr, shdr, phdr = LAYOUT[data[4]]
+    (_, e_machine, _, _, phoff, shoff, _, _, phentsize, phnum,
+        shentsize, shnum, shstrndx) = struct.unpack_from(ehdr, data, 16)
+
+    if e_machine != EM_RISCV:
+        raise ValueError('not a RISC-V ELF file (e_machine %d)' % e_machine)
+
+    sections = [struct.unpack_from(shdr, data, shoff + i * shentsize) for i in range(shnum)]
+
+    names = None
+    if shstrndx < len(sections):
+        names = sections[shstrndx][4]
+
+    def name(off):
+        if names is None:
+            return ''
+        end = data.index(b'\0', names + off)
+        return data[names + off:end].decode('ascii', 'replace')
+
+    regions = []
+    for sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, _, _, _, _ in sections:
+        if sh_flags & SHF_EXECINSTR and sh_type != SHT_NOBITS and sh_size:
+            regions.append((name(sh_name), sh_addr, sh_offset, sh_size))
+
+    if regions:
+        return regions
+
+    for i in range(phnum):
+        ph = struct.unpack_from(phdr, data, phoff + i * phentsize)
+        if data[4] == 2:
+            p_type, p_flags, p_offset, p_vaddr, _, p_filesz, _, _ = ph
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz, _, p_flags, _ = ph
+
+        if p_type == PT_LOAD and p_flags & PF_X and p_filesz:
+            regions.append(('segment_%d' % i, p_vaddr, p_offset, p_filesz))
+
+    return regions
@@ -0,0 +1,573 @@
+'''RV64IMC emulator on top of the decoder, does not need binary ninja
+
+    from riscv_hacksec.emu import Emulator
+    emu = Emulator()
+    emu.mem.write_bytes(0x80000000, firmware)
+    emu.set_reg('sp', 0x80100000)
+    emu.run(0x80000000, max_steps=10000000)    # -> why it stopped
+    emu.reg('a0')
+
+code is translated a basic block at a time: every instruction is decoded
+once (instr.decode in IL mode, the same (op, args) the lifter gets) into a
+closure bound to the register file and memory, blocks are cached by start
+address. stores to a page blocks were translated from drop those blocks,
+fence.i drops all of them. a store into the block that is running only
+takes effect once the block is left.
+
+registers hold unsigned 64 bit values. memory is sparse 4k pages, reads and
+writes of unmapped pages fault, write_bytes / map add pages. run stops on
+ecall (unless a handler is set), ebreak, faults, illegal or unsupported
+instructions and after max_steps. steps count the instructions run,
+max_steps is checked between blocks.
+'''
+from functools import partial
+import struct
+
+from .instr import decode, CSR, IL, REGS
+
+M = (1 << 64) - 1
+M32 = (1 << 32) - 1
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# longest translated block
+MAX_BLOCK = 64
+
+# register name -> index in Emulator.x
+REG = {r: i for i, r in enumerate(REGS[:32])}
+
+# csr name -> number
+CSR_NUM = {name: num for num, name in CSR.items()}
+
+# counter csrs read the step count (cycle, time, instret and the m* ones)
+COUNTERS = (0xc00, 0xc01, 0xc02, 0xb00, 0xb02)
+
+# trap return op -> csr holding the return address (uepc, sepc, mepc)
+EPC = {'uret': 0x041, 'sret': 0x141, 'mret': 0x341}
+
+UNPACK = {n: struct.Struct(f).unpack_from for n, f in ((1, '<B'), (2, '<H'), (4, '<I'), (8, '<Q'))}
+PACK = {n: struct.Struct(f).pack_into for n, f in ((1, '<B'), (2, '<H'), (4, '<I'), (8, '<Q'))}
+
+class Fault(Exception):
+    '''access to an unmapped address'''
+    def __init__(self, address):
+        Exception.__init__(self, 'unmapped address 0x%x' % address)
+        self.address = address
+
+class Stop(Exception):
+    '''raised by an instruction that ends the run'''
+    def __init__(self, reason, pc, address=None):
+        Exception.__init__(self, '%s at 0x%x' % (reason, pc))
+        self.reason = reason
+        self.pc = pc
+        self.address = address
+
+def s64(v):
+    return v - (1 << 64) if v >> 63 else v
+
+def s32(v):
+    v &= M32
+    return v - (1 << 32) if v >> 31 else v
+
+class Memory(object):
+    '''sparse little endian memory of 4k pages'''
+
+    def __init__(self):
+        self.pages = {}
+        # page -> start addresses of the blocks translated from it
+        self.code = {}
+        # called with the page number when a code page is written
+        self.code_written = None
+
+    def map(self, addr, size):
+        '''zero filled pages for [addr, addr+size), existing ones are kept'''
+        for p in range(addr >> PAGE_BITS, ((addr + size - 1) >> PAGE_BITS) + 1):
+            if p not in self.pages:
+                self.pages[p] = bytearray(PAGE_SIZE)
+
+    def write_bytes(self, addr, data):
+        '''copy data to addr, mapping pages as needed'''
+        self.map(addr, len(data))
+        off = 0
+        while off < len(data):
+            a = addr + off
+            p, o = a >> PAGE_BITS, a & PAGE_MASK
+            n = min(PAGE_SIZE - o, len(data) - off)
+            self.pages[p][o:o+n] = data[off:off+n]
+            if p in self.code:
+                self.code_written(p)
+            off += n
+
+    def read_bytes(self, addr, size):
+        out = bytearray()
+        while len(out) < size:
+            a = addr + len(out)
+            page = self.pages.get(a >> PAGE_BITS)
+            if page is None:
+                raise Fault(a)
+            o = a & PAGE_MASK
+            out += page[o:o + min(PAGE_SIZE - o, size - len(out))]
+        return bytes(out)
+
+    def load(self, size, addr):
+        page = self.pages.get(addr >> PAGE_BITS)
+        off = addr & PAGE_MASK
+        if page is None or off + size > PAGE_SIZE:
+            return int.from_bytes(self.read_bytes(addr, size), 'little')
+        return UNPACK[size](page, off)[0]
+
+    def store(self, size, addr, value):
+        p = addr >> PAGE_BITS
+        page = self.pages.get(p)
+        off = addr & PAGE_MASK
+        if page is None or off + size > PAGE_SIZE:
+            # crossing a page, all pages have to be mapped
+            for a in (addr, addr + size - 1):
+                if (a >> PAGE_BITS) not in self.pages:
+                    raise Fault(a)
+            self.write_bytes(addr, (value & ((1 << (size * 8)) - 1)).to_bytes(size, 'little'))
+            return
+        PACK[size](page, off, value)
+        if p in self.code:
+            self.code_written(p)
+
+    def fetch(self, addr):
+        '''raw bytes of the instruction at addr'''
+        h = self.read_bytes(addr, 2)
+        if h[0] & 0b11 == 0b11:
+            return self.read_bytes(addr, 4)
+        return h
+
+# ------- arithmetic on unsigned 64 bit values -------
+
+def div(a, b):
+    if b == 0:
+        return M
+    a, b = s64(a), s64(b)
+    q = abs(a) // abs(b)
+    return (-q if (a < 0) != (b < 0) else q) & M
+
+def divu(a, b):
+    return a // b if b else M
+
+def rem(a, b):
+    if b == 0:
+        return a
+    a, b = s64(a), s64(b)
+    r = abs(a) % abs(b)
+    return (-r if a < 0 else r) & M
+
+def remu(a, b):
+    return a % b if b else a
+
+OPS = {
+    'add': lambda a, b: (a + b) & M,
+    'sub': lambda a, b: (a - b) & M,
+    'xor': lambda a, b: a ^ b,
+    'or': lambda a, b: a | b,
+    'and': lambda a, b: a & b,
+    'sll': lambda a, b: (a << (b & 63)) & M,
+    'srl': lambda a, b: a >> (b & 63),
+    'sra': lambda a, b: (s64(a) >> (b & 63)) & M,
+    'slt': lambda a, b: int(s64(a) < s64(b)),
+    'sltu': lambda a, b: int(a < b),
+    'mul': lambda a, b: (a * b) & M,
+    'mulh': lambda a, b: ((s64(a) * s64(b)) >> 64) & M,
+    'mulhsu': lambda a, b: ((s64(a) * b) >> 64) & M,
+    'mulhu': lambda a, b: (a * b) >> 64,
+    'div': div,
+    'divu': divu,
+    'rem': rem,
+    'remu': remu,
+
+    # *w ops, the result is sign extended from 32 bits
+    'addw': lambda a, b: s32(a + b) & M,
+    'subw': lambda a, b: s32(a - b) & M,
+    'sllw': lambda a, b: s32(a << (b & 31)) & M,
+    'srlw': lambda a, b: s32((a & M32) >> (b & 31)) & M,
+    'sraw': lambda a, b: (s32(a) >> (b & 31)) & M,
+    'mulw': lambda a, b: s32(a * b) & M,
+    'divw': lambda a, b: s32(div(s32(a) & M, s32(b) & M)) & M,
+    'divuw': lambda a, b: s32(divu(a & M32, b & M32)) & M,
+    'remw': lambda a, b: s32(rem(s32(a) & M, s32(b) & M)) & M,
+    'remuw': lambda a, b: s32(remu(a & M32, b & M32)) & M,
+}
+
+CMPS = {
+    'beq': lambda a, b: a == b,
+    'bne': lambda a, b: a != b,
+    'blt': lambda a, b: s64(a) < s64(b),
+    'bge': lambda a, b: s64(a) >= s64(b),
+    'bltu': lambda a, b: a < b,
+    'bgeu': lambda a, b: a >= b,
+}
+
+# ------- instruction translators -------
+
+# translate(emu, addr, length, *args) returns the closure running the
+# instruction or None if it does nothing. closures return the next pc for
+# control flow, None to fall through
+
+def t_op_imm(op, emu, addr, n, rd, rs1, imm):
+    d, s, imm, x = REG[rd], REG[rs1], imm & M, emu.x
+    if d == 0:
+        return None
+    if op == 'add':
+        def run():
+            x[d] = (x[s] + imm) & M
+        return run
+    f = OPS[op]
+    def run():
+        x[d] = f(x[s], imm)
+    return run
+
+def t_op(op, emu, addr, n, rd, rs1, rs2):
+    d, s1, s2, x = REG[rd], REG[rs1], REG[rs2], emu.x
+    if d == 0:
+        return None
+    f = OPS[op]
+    def run():
+        x[d] = f(x[s1], x[s2])
+    return run
+
+def t_const(emu, addr, n, rd, value):
+    d, value, x = REG[rd], value & M, emu.x
+    if d == 0:
+        return None
+    def run():
+        x[d] = value
+    return run
+
+def t_mv(emu, addr, n, rd, rs):
+    d, s, x = REG[rd], REG[rs], emu.x
+    if d == 0:
+        return None
+    def run():
+        x[d] = x[s]
+    return run
+
+def t_load(size, signed, emu, addr, n, rd, rs1, imm):
+    d, s, x, load = REG[rd], REG[rs1], emu.x, emu.mem.load
+    sign = 1 << (size * 8 - 1)
+    def run():
+        try:
+            v = load(size, (x[s] + imm) & M)
+        except Fault as e:
+            raise Stop('fault', addr, e.address)
+        if d:
+            x[d] = ((v ^ sign) - sign) & M if signed else v
+    return run
+
+def t_store(size, emu, addr, n, rs1, rs2, imm):
+    s1, s2, x, store = REG[rs1], REG[rs2], emu.x, emu.mem.store
+    mask = (1 << (size * 8)) - 1
+    def run():
+        try:
+            store(size, (x[s1] + imm) & M, x[s2] & mask)
+        except Fault as e:
+            raise Stop('fault', addr, e.address)
+    return run
+
+def t_jal(emu, addr, n, rd, target, link):
+    d, target, link, x = REG[rd], target & M, (addr + n) & M, emu.x
+    def run():
+        if d:
+            x[d] = link
+        return target
+    return run
+
+def t_jalr(emu, addr, n, rd, rs1, imm, link):
+    d, s, link, x = REG[rd], REG[rs1], (addr + n) & M, emu.x
+    def run():
+        target = (x[s] + imm) & M & ~1
+        if d:
+            x[d] = link
+        return target
+    return run
+
+def t_branch(op, emu, addr, n, rs1, rs2, target, fallthrough):
+    s1, s2, target, x, cmp = REG[rs1], REG[rs2], target & M, emu.x, CMPS[op]
+    def run():
+        if cmp(x[s1], x[s2]):
+            return target
+    return run
+
+def t_csr(op, emu, addr, n, rd, csr, src):
+    d, x, csrs = REG[rd], emu.x, emu.csrs
+    # csrrs / csrrc with x0 or a zero immediate only read
+    write = op == 'csrrw' or src not in ('zero', 0)
+    if type(src) is str:
+        s = REG[src]
+        value = lambda: x[s]
+    else:
+        value = lambda: src
+    def run():
+        old = emu.steps if csr in COUNTERS else csrs.get(csr, 0)
+        if write:
+            v = value()
+            csrs[csr] = v if op == 'csrrw' else old | v if op == 'csrrs' else old & ~v & M
+        if d:
+            x[d] = old
+    return run
+
+def t_ecall(emu, addr, n):
+    def run():
+        if emu.ecall is None or not emu.ecall(emu):
+            raise Stop('ecall', addr)
+    return run
+
+def t_stop(reason, emu, addr, n, *args):
+    def run():
+        raise Stop(reason, addr)
+    return run
+
+def t_trap_return(op, emu, addr, n):
+    csrs, epc = emu.csrs, EPC[op]
+    def run():
+        return csrs.get(epc, 0)
+    return run
+
+def t_fence_i(emu, addr, n):
+    def run():
+        emu.flush()
+    return run
+
+def t_nop(emu, addr, n, *args):
+    return None
+
+TRANSLATORS = {
+    # loads / stores
+    'lb': partial(t_load, 1, True),
+    'lh': partial(t_load, 2, True),
+    'lw': partial(t_load, 4, True),
+    'ld': partial(t_load, 8, True),
+    'lbu': partial(t_load, 1, False),
+    'lhu': partial(t_load, 2, False),
+    'lwu': partial(t_load, 4, False),
+    'sb': partial(t_store, 1),
+    'sh': partial(t_store, 2),
+    'sw': partial(t_store, 4),
+    'sd': partial(t_store, 8),
+
+    # register / immediate
+    'addi': partial(t_op_imm, 'add'),
+    'slti': partial(t_op_imm, 'slt'),
+    'sltiu': partial(t_op_imm, 'sltu'),
+    'xori': partial(t_op_imm, 'xor'),
+    'ori': partial(t_op_imm, 'or'),
+    'andi': partial(t_op_imm, 'and'),
+    'slli': partial(t_op_imm, 'sll'),
+    'srli': partial(t_op_imm, 'srl'),
+    'srai': partial(t_op_imm, 'sra'),
+    'addiw': partial(t_op_imm, 'addw'),
+    'slliw': partial(t_op_imm, 'sllw'),
+    'srliw': partial(t_op_imm, 'srlw'),
+    'sraiw': partial(t_op_imm, 'sraw'),
+
+    'lui': t_const,
+    'auipc': t_const,
+
+    # control flow
+    'jal': t_jal,
+    'jalr': t_jalr,
+    'beq': partial(t_branch, 'beq'),
+    'bne': partial(t_branch, 'bne'),
+    'blt': partial(t_branch, 'blt'),
+    'bge': partial(t_branch, 'bge'),
+    'bltu': partial(t_branch, 'bltu'),
+    'bgeu': partial(t_branch, 'bgeu'),
+
+    # system
+    'fence': t_nop,
+    'fence.I': t_fence_i,
+    'wfi': t_nop,
+    'sfence.vma': t_nop,
+    'ecall': t_ecall,
+    'ebreak': partial(t_stop, 'ebreak'),
+    'uret': partial(t_trap_return, 'uret'),
+    'sret': partial(t_trap_return, 'sret'),
+    'mret': partial(t_trap_return, 'mret'),
+    'csrrw': partial(t_csr, 'csrrw'),
+    'csrrs': partial(t_csr, 'csrrs'),
+    'csrrc': partial(t_csr, 'csrrc'),
+    'csrrwi': partial(t_csr, 'csrrw'),
+    'csrrsi': partial(t_csr, 'csrrs'),
+    'csrrci': partial(t_csr, 'csrrc'),
+
+    # compressed
+    'illegal': partial(t_stop, 'illegal'),
+    'nop': t_nop,
+    'c.addi4spn': partial(t_op_imm, 'add'),
+    'c.addi': partial(t_op_imm, 'add'),
+    'c.addiw': partial(t_op_imm, 'addw'),
+    'c.addi16sp': partial(t_op_imm, 'add'),
+    'c.li': t_const,
+    'c.lui': t_const,
+    'c.srli': partial(t_op_imm, 'srl'),
+    'c.srai': partial(t_op_imm, 'sra'),
+    'c.andi': partial(t_op_imm, 'and'),
+    'c.slli': partial(t_op_imm, 'sll'),
+    'c.mv': t_mv,
+    'c.lw': partial(t_load, 4, True),
+    'c.ld': partial(t_load, 8, True),
+    'c.lwsp': partial(t_load, 4, True),
+    'c.ldsp': partial(t_load, 8, True),
+    'c.sw': partial(t_store, 4),
+    'c.sd': partial(t_store, 8),
+    'c.swsp': partial(t_store, 4),
+    'c.sdsp': partial(t_store, 8),
+    'c.j': t_jal,
+    'c.jr': t_jalr,
+    'c.jalr': t_jalr,
+    'c.beqz': partial(t_branch, 'beq'),
+    'c.bnez': partial(t_branch, 'bne'),
+    'c.ebreak': partial(t_stop, 'ebreak'),
+}
+
+# register / register ops, compressed ones included
+for op in ('add', 'sub', 'sll', 'slt', 'sltu', 'xor', 'srl', 'sra', 'or', 'and',
+           'addw', 'subw', 'sllw', 'srlw', 'sraw',
+           'mul', 'mulh', 'mulhsu', 'mulhu', 'div', 'divu', 'rem', 'remu',
+           'mulw', 'divw', 'divuw', 'remw', 'remuw'):
+    TRANSLATORS[op] = partial(t_op, op)
+for op in ('add', 'sub', 'xor', 'or', 'and', 'subw', 'addw'):
+    TRANSLATORS['c.' + op] = partial(t_op, op)
+
+def ends_block(t):
+    '''translators whose closures can return a pc (whatever the InstructionInfo
+    says, calls through a register have no branches), stop the run or drop
+    blocks'''
+    return getattr(t, 'func', t) in (t_jal, t_jalr, t_branch, t_trap_return, t_ecall, t_stop, t_fence_i)
+
+# ops that end a block
+BLOCK_END = {op for op, t in TRANSLATORS.items() if ends_block(t)}
+
+class Emulator(object):
+
+    def __init__(self, mem=None):
+        self.x = [0] * 32
+        self.pc = 0
+        self.csrs = {}
+        self.mem = mem if mem is not None else Memory()
+        self.mem.code_written = self.invalidate_page
+        self.steps = 0
+
+        # called with the emulator on ecall, a true result resumes after it
+        self.ecall = None
+
+        # why the last run stopped and the faulting address
+        self.stopped = None
+        self.fault = None
+
+        # start address -> (closures, fall through address, instructions,
+        # instruction addresses)
+        self.blocks = {}
+
+    def reg(self, name):
+        return self.x[REG[name]]
+
+    def set_reg(self, name, value):
+        if name != 'zero':
+            self.x[REG[name]] = value & M
+
+    def csr(self, csr):
+        '''csr value by number or name'''
+        return self.csrs.get(CSR_NUM.get(csr, csr), 0)
+
+    def set_csr(self, csr, value):
+        self.csrs[CSR_NUM.get(csr, csr)] = value & M
+
+    def translate(self, pc):
+        '''decode the block at pc into closures and cache it'''
+        fns = []
+        addrs = []
+        addr = pc
+        count = 0
+
+        while count < MAX_BLOCK:
+            addrs.append(addr)
+            try:
+                dat = self.mem.fetch(addr)
+            except Fault as e:
+                fns.append(t_stop('fault', self, addr, 2))
+                count += 1
+                break
+
+            r = decode(dat, addr, IL)
+            if r is None or r[2] is None:
+                fns.append(t_stop('illegal', self, addr, 2))
+                count += 1
+                break
+
+            op, args = r[2]
+            n = r[1].length
+            t = TRANSLATORS.get(op)
+            fn = t_stop('unsupported', self, addr, n) if t is None else t(self, addr, n, *args)
+            if fn is not None:
+                fns.append(fn)
+
+            addr += n
+            count += 1
+            if t is None or r[1].branches or op in BLOCK_END:
+                break
+
+        block = self.blocks[pc] = (fns, addr, count, addrs)
+        for p in range(pc >> PAGE_BITS, ((addr - 1) >> PAGE_BITS) + 1):
+            self.mem.code.setdefault(p, set()).add(pc)
+        return block
+
+    def invalidate_page(self, page):
+        '''drop the blocks translated from a page'''
+        for pc in self.mem.code.pop(page, ()):
+            self.blocks.pop(pc, None)
+
+    def flush(self):
+        '''drop all translated blocks'''
+        self.blocks.clear()
+        self.mem.code.clear()
+
+    def run(self, pc=None, max_steps=None):
+        '''run from pc (default the current one), returns why it stopped
+
+        'ecall', 'ebreak', 'fault', 'illegal', 'unsupported' or 'steps',
+        self.pc is the address of the instruction that stopped the run
+        (the next one to run for 'steps')
+        '''
+        if pc is not None:
+            self.pc = pc
+        pc = self.pc & M
+
+        blocks = self.blocks
+        translate = self.translate
+        limit = self.steps + max_steps if max_steps is not None else None
+
+        self.stopped = self.fault = None
+        b = None
+        try:
+            while limit is None or self.steps < limit:
+                b = blocks.get(pc)
+                if b is None:
+                    b = translate(pc)
+
+                fns, end, count, _ = b
+                t = None
+                for fn in fns:
+                    t = fn()
+
+                pc = end if t is None else t
+                self.steps += count
+
+            self.stopped = 'steps'
+        except Stop as e:
+            self.stopped = e.reason
+            self.fault = e.address
+            pc = e.pc
+
+            # the instructions of the block before the one that stopped ran
+            if b is not None and pc in b[3]:
+                self.steps += b[3].index(pc)
+
+        self.pc = pc
+        return self.stopped
@@ -0,0 +1,64 @@
+'''lightweight stand-ins for the binaryninja types used by the decoder
+
+instr.py falls back to these when binaryninja can't be imported, so the
+decoder (and sweep / parallel / vector) works without a Binary Ninja
+install. only what decoding needs is provided, lifting still needs
+binaryninja.
+'''
+from collections import namedtuple
+from enum import IntEnum
+
+# same values as binaryninja.enums
+class InstructionTextTokenType(IntEnum):
+    TextToken = 0
+    InstructionToken = 1
+    OperandSeparatorToken = 2
+    RegisterToken = 3
+    IntegerToken = 4
+    PossibleAddressToken = 5
+    BeginMemoryOperandToken = 6
+    EndMemoryOperandToken = 7
+
+class BranchType(IntEnum):
+    UnconditionalBranch = 0
+    FalseBranch = 1
+    TrueBranch = 2
+    CallDestination = 3
+    FunctionReturn = 4
+    SystemCall = 5
+    IndirectBranch = 6
+    ExceptionBranch = 7
+    UnresolvedBranch = 127
+
+class LowLevelILOperation(IntEnum):
+    LLIL_CONST = 3
+    LLIL_CONST_PTR = 4
+
+InstructionBranch = namedtuple('InstructionBranch', ['type', 'target', 'arch'])
+
+class InstructionInfo(object):
+    __slots__ = ('length', 'branch_delay', 'branches')
+
+    def __init__(self):
+        self.length = 0
+        self.branch_delay = False
+        self.branches = []
+
+    def add_branch(self, branch_type, target=0, arch=None):
+        self.branches.append(InstructionBranch(branch_type, target, arch))
+
+class InstructionTextToken(object):
+    __slots__ = ('type', 'text', 'value')
+
+    def __init__(self, token_type, text, value=0):
+        self.type = token_type
+        self.text = text
+        self.value = value
+
+    def __repr__(self):
+        return '<token %s %r>' % (self.type.name, self.text)
+
+# only used while lifting
+Architecture = None
+LowLevelILLabel = None
+LLIL_TEMP = None
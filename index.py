@@ -0,0 +1,309 @@
+'''persistent decode index of a code region
+
+an index file holds, for every halfword of a region, what get_instruction_info
+needs (length, mnemonic and branches), so a reopened image can skip decoding
+for the info callback. files are named after the region address and the
+sha256 of its bytes, an index whose hash doesn't match the bytes any more is
+rebuilt and the stale file removed. the region bytes are kept in the file as
+well, a lookup only answers for the bytes the region was indexed from.
+
+    from riscv_hacksec import index
+    index.enabled = True            # index the views opened from now on
+
+or by hand, for a region:
+
+    idx = index.load_or_build(index.cache_dir('firmware'), code, 0x80000000)
+    index.attach(idx)
+
+layout (little endian): header, json shape table, one u2 shape id per
+halfword, then the sorted halfword numbers (u4) and target offsets (i4) of
+the instructions with a branch target, then the region bytes. a shape is (mnemonic, length,
+branches), a branch is (type, kind) where kind says where the target is:
+TARGET the stored offset, NEXT the next instruction, NONE no target.
+operand fields are not stored, they come from the bytes of the image
+(instr.Instr / instr.CInstr).
+'''
+from array import array
+from bisect import bisect_left
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from .instr import decode, InstructionInfo, TEXT
+
+MAGIC = b'RVIDX\x00\x00\x02'
+
+# magic, sha256, base address, halfwords, branch targets, json length
+HEADER = struct.Struct('<8s32sQQQQ')
+
+# shape id of halfwords that have to be decoded (not indexed / patched)
+UNINDEXED = 0xffff
+
+# branch target kinds
+NONE = 0
+TARGET = 1
+NEXT = 2
+
+# loaded indexes used by the RISCV callbacks, see attach(). the list is
+# replaced rather than modified, callbacks on other threads may be iterating
+indexes = []
+
+# index the riscv views when they are opened (see riscv.watch_patches)
+enabled = False
+
+def digest(buf):
+    return hashlib.sha256(buf).digest()
+
+def cache_dir(name):
+    '''per user cache directory for the index files of name (e.g. a file path)'''
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        root = os.path.expanduser('~/Library/Caches')
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+
+    key = hashlib.sha256(name.encode('utf-8', 'surrogateescape')).hexdigest()[:32]
+    return os.path.join(root, 'riscv_hacksec', 'index', key)
+
+def index_path(directory, base_addr, sha):
+    return os.path.join(directory, '%x-%s.idx' % (base_addr, sha.hex()))
+
+def shape_of(r, addr):
+    '''(shape, target offset or None) of a decode result, None if it doesn't fit'''
+    if r is None:
+        return ('unk', 2, ()), None
+
+    info = r[1]
+    offset = None
+    branches = []
+    for b in info.branches:
+        if b.target == addr + info.length:
+            kind = NEXT
+        elif b.target == 0:
+            kind = NONE
+        elif offset is None:
+            kind = TARGET
+            offset = b.target - addr
+        else:
+            # a second explicit target
+            return None, None
+        branches.append((int(b.type), kind))
+
+    if offset is not None and not -0x80000000 <= offset < 0x80000000:
+        return None, None
+
+    return (r[0][0].text, info.length, tuple(branches)), offset
+
+def build(buf, base_addr):
+    '''decode every halfword of buf, returns the index file contents'''
+    dat = memoryview(buf).cast('B')
+    n = len(dat) // 2
+
+    shapes = []
+    ids = {}
+    shape_ids = array('H')
+    target_at = array('I')
+    target_off = array('i')
+
+    for i in range(n):
+        off = i * 2
+        addr = base_addr + off
+
+        if off + 4 > len(dat) and dat[off] & 0b11 == 0b11:
+            # may continue past the region
+            shape_ids.append(UNINDEXED)
+            continue
+
+        shape, offset = shape_of(decode(dat[off:off+4], addr, TEXT), addr)
+
+        if shape is None:
+            shape_ids.append(UNINDEXED)
+            continue
+
+        sid = ids.get(shape)
+        if sid is None:
+            sid = ids[shape] = len(shapes)
+            shapes.append(shape)
+        shape_ids.append(sid)
+
+        if offset is not None:
+            target_at.append(i)
+            target_off.append(offset)
+
+    table = json.dumps(shapes, separators=(',', ':')).encode()
+    table += b'\0' * (-len(table) % 8)
+
+    out = [HEADER.pack(MAGIC, digest(dat), base_addr, n, len(target_at), len(table)), table]
+    out.append(shape_ids.tobytes() + b'\0' * (-2 * n % 4))
+    out.append(target_at.tobytes())
+    out.append(target_off.tobytes())
+    out.append(bytes(dat[:n * 2]))
+    return b''.join(out)
+
+class DecodeIndex(object):
+    '''read side of an index file, mapped copy-on-write'''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, self.sha, self.base, n, m, size = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a decode index' % path)
+
+        self.path = path
+        self.end = self.base + n * 2
+
+        pos = HEADER.size
+        self.shapes = [
+            (mnemonic, length, tuple(tuple(b) for b in branches))
+            for mnemonic, length, branches in json.loads(bytes(self.map[pos:pos+size]).rstrip(b'\0'))
+        ]
+        pos += size
+
+        mv = memoryview(self.map)
+        self.shape_ids = mv[pos:pos + n * 2].cast('H')
+        pos += n * 2 + (-2 * n % 4)
+        self.target_at = mv[pos:pos + m * 4].cast('I')
+        pos += m * 4
+        self.target_off = mv[pos:pos + m * 4].cast('i')
+        pos += m * 4
+        self.raw = mv[pos:pos + n * 2]
+
+        # who attached it, see attach_view / detach_owner
+        self.owner = None
+
+    def entry(self, addr):
+        '''(mnemonic, length, [(BranchType, target), ...]) or None if not indexed'''
+        i = (addr - self.base) >> 1
+        sid = self.shape_ids[i]
+        if sid == UNINDEXED:
+            return None
+
+        mnemonic, length, branches = self.shapes[sid]
+
+        out = []
+        for t, kind in branches:
+            if kind == TARGET:
+                j = bisect_left(self.target_at, i)
+                out.append((t, addr + self.target_off[j]))
+            else:
+                out.append((t, addr + length if kind == NEXT else 0))
+
+        return mnemonic, length, out
+
+    def info(self, data, addr):
+        '''InstructionInfo of the instruction in data at addr, None if it
+        has to be decoded (not indexed, or data isn't the indexed bytes)'''
+        e = self.entry(addr)
+        if e is None:
+            return None
+
+        off = addr - self.base
+        if data[:e[1]] != self.raw[off:off + e[1]]:
+            return None
+
+        info = InstructionInfo()
+        info.length = e[1]
+        for t, target in e[2]:
+            info.add_branch(t, target)
+        return info
+
+    def invalidate(self, start, length):
+        '''patched bytes, their halfwords are decoded again (the file is not touched)'''
+        lo = max(start - 2, self.base)
+        hi = min(start + length, self.end)
+        for a in range(lo - (lo - self.base) % 2, hi, 2):
+            self.shape_ids[(a - self.base) >> 1] = UNINDEXED
+
+    def close(self):
+        self.shape_ids.release()
+        self.target_at.release()
+        self.target_off.release()
+        self.raw.release()
+        self.map.close()
+
+def load_or_build(directory, buf, base_addr):
+    '''the index of buf at base_addr, built (and saved) when there is none for its bytes'''
+    sha = digest(buf)
+    path = index_path(directory, base_addr, sha)
+
+    idx = None
+    if os.path.exists(path):
+        try:
+            idx = DecodeIndex(path)
+        except ValueError:
+            # written by another version
+            pass
+
+    if idx is None:
+        # the bytes changed, drop the index of the old ones
+        for stale in glob.glob(os.path.join(directory, '%x-*.idx' % base_addr)):
+            os.remove(stale)
+
+        os.makedirs(directory, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(build(buf, base_addr))
+        os.replace(tmp, path)
+        idx = DecodeIndex(path)
+    if idx.sha != sha:
+        idx.close()
+        raise ValueError('%s does not match its name' % path)
+    return idx
+
+def attach(idx):
+    global indexes
+    indexes = indexes + [idx]
+
+def detach(idx):
+    '''stop using idx, it is unmapped once the last lookup let go of it'''
+    global indexes
+    indexes = [i for i in indexes if i is not idx]
+
+def detach_owner(owner):
+    '''detach the indexes attach_view attached for owner'''
+    global indexes
+    indexes = [i for i in indexes if i.owner != owner]
+
+def lookup(data, addr):
+    '''InstructionInfo of data at addr from the attached indexes, None if it
+    has to be decoded'''
+    if addr & 1:
+        return None
+    for idx in indexes:
+        if idx.base <= addr < idx.end:
+            h = idx.info(data, addr)
+            if h is not None:
+                return h
+    return None
+
+def invalidate(start, length=None):
+    '''patched bytes, without a length every index past start is dropped'''
+    for idx in list(indexes):
+        if length is None:
+            if idx.end > start:
+                detach(idx)
+        elif idx.base < start + length and start < idx.end:
+            idx.invalidate(start, length)
+
+def attach_view(view, owner=None, directory=None):
+    '''index the executable sections of a binary view
+
+    the files go to the cache_dir of the file name by default. the indexes
+    are attached for owner, detach_owner(owner) drops them again
+    '''
+    if directory is None:
+        directory = cache_dir(view.file.filename)
+
+    for s in view.sections.values():
+        if not view.is_offset_executable(s.start):
+            continue
+        idx = load_or_build(directory, view.read(s.start, s.length), s.start)
+        idx.owner = owner
+        attach(idx)
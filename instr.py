@@ -1,19 +1,48 @@
 
-from binaryninja.function import RegisterInfo, InstructionInfo, InstructionTextToken
-from binaryninja.enums import InstructionTextTokenType, BranchType, LowLevelILOperation
-from binaryninja.architecture import Architecture
-from binaryninja.lowlevelil import LowLevelILLabel
+from functools import partial
+import struct
+
+try:
+    from binaryninja.function import InstructionInfo, InstructionTextToken
+    from binaryninja.enums import InstructionTextTokenType, BranchType, LowLevelILOperation
+    from binaryninja.architecture import Architecture
+    from binaryninja.lowlevelil import LowLevelILLabel, LLIL_TEMP
+except ImportError:
+    # no binary ninja, decode with the lightweight records
+    from .headless import InstructionInfo, InstructionTextToken, InstructionTextTokenType, \
+        BranchType, LowLevelILOperation, Architecture, LowLevelILLabel, LLIL_TEMP
+
+def interned(token_type):
+    '''token helper that hands out one shared token per text
+
+    for the tokens without a value (mnemonics, registers, separators), they
+    are only read when binary ninja renders them, so never modify one
+    '''
+    pool = {}
+    def t(x):
+        tok = pool.get(x)
+        if tok is None:
+            tok = pool[x] = InstructionTextToken(token_type, x)
+        return tok
+    t.pool = pool
+    return t
 
 # binary ninja text helpers
-def tI(x): return InstructionTextToken(InstructionTextTokenType.InstructionToken, x)
-def tR(x): return InstructionTextToken(InstructionTextTokenType.RegisterToken, x)
-def tS(x): return InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, x)
-def tM(x): return InstructionTextToken(InstructionTextTokenType.BeginMemoryOperandToken, x)
-def tE(x): return InstructionTextToken(InstructionTextTokenType.EndMemoryOperandToken, x)
+tI = interned(InstructionTextTokenType.InstructionToken)
+tR = interned(InstructionTextTokenType.RegisterToken)
+tS = interned(InstructionTextTokenType.OperandSeparatorToken)
+tM = interned(InstructionTextTokenType.BeginMemoryOperandToken)
+tE = interned(InstructionTextTokenType.EndMemoryOperandToken)
 def tA(x,d): return InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, x, d)
-def tT(x): return InstructionTextToken(InstructionTextTokenType.TextToken, x)
+tT = interned(InstructionTextTokenType.TextToken)
 def tN(x,d): return InstructionTextToken(InstructionTextTokenType.IntegerToken, x, d)
 
+# decode modes, the InstructionInfo (length and branches) is always built
+INFO = 0
+TEXT = 1
+IL = 2
+ALL = TEXT | IL
+
 REGS = [
     'zero', 'ra', 'sp', 'gp', 'tp',
     't0', 't1', 't2',
@@ -30,6 +59,17 @@ RVC = [
     'a2', 'a3', 'a4', 'a5'
 ]
 
+# floating point registers (F / D extensions)
+FREGS = [
+    'ft0', 'ft1', 'ft2', 'ft3', 'ft4', 'ft5', 'ft6', 'ft7',
+    'fs0', 'fs1',
+    'fa0', 'fa1', 'fa2', 'fa3', 'fa4', 'fa5', 'fa6', 'fa7',
+    'fs2', 'fs3', 'fs4', 'fs5', 'fs6', 'fs7', 'fs8', 'fs9', 'fs10', 'fs11',
+    'ft8', 'ft9', 'ft10', 'ft11'
+]
+
+FRVC = FREGS[8:16]
+
 CSR = {
     0xf11: 'mvendorid',
     0xf12: 'marchid',
@@ -53,877 +93,1319 @@ CSR = {
     0x34b: 'mtval2'
 }
 
+_U32 = struct.Struct('<I').unpack_from
+_U16 = struct.Struct('<H').unpack_from
+
 def u32(dat):
-    x = 0
-    x += dat[0]
-    x += (dat[1] << 8)
-    x += (dat[2] << 16)
-    x += (dat[3] << 24)
-    return x
+    return _U32(dat)[0]
 
 def u16(dat):
-    x = 0
-    x += dat[0]
-    x += (dat[1] << 8)
-    return x
+    return _U16(dat)[0]
+
+# MASKS[n] has the low n bits set
+MASKS = [(1 << n) - 1 for n in range(65)]
 
 def bits(x,hi,lo):
     '''bits hi to lo inclusive'''
-    return (x >> lo) & ((2 ** (hi - lo + 1)) - 1)
+    return (x >> lo) & MASKS[hi - lo + 1]
 
 def ext(x,n):
     '''sign extend x as an "n" bit number'''
-    if (x >> (n-1)) & 1:
-        # invert
-        return -((2**n) - x)
-    else:
-        return x
+    m = 1 << (n-1)
+    return (x ^ m) - m
 
 class Instr(object):
+    # fields are extracted on demand, each format only reads a few of them
+    __slots__ = ('x',)
+
     def __init__(self, x):
         self.x = x
-        
-        self.base = bits(x,1,0)
-        self.op = bits(x,6,2)
-        self.opcode = bits(x,6,0)
-
-        self.rd = bits(x,11,7)
-        self.rs1 = bits(x,19,15)
-        self.rs2 = bits(x,24,20)
-
-        self.funct3 = bits(x,14,12)
-        self.funct7 = bits(x,31,25)
-
-        # immediate values
-        self.imm_i = bits(x,31,20)
-        self.imm_s = (bits(x,31,25) << 5) + (bits(x,11,7))
-        self.imm_b = (bits(x,31,31) << 12) + (bits(x,7,7) << 11) + (bits(x,30,25) << 5) + (bits(x,11,8) << 1)
-        self.imm_u = (bits(x,31,12) << 12)
-        self.imm_j = (bits(x,31,31) << 20) + (bits(x,19,12) << 12) + (bits(x,20,20) << 11) + (bits(x,30,21) << 1)
-
-        # sign extended immediates
-        self.imm_i_ext = ext(self.imm_i, 12)
-        self.imm_s_ext = ext(self.imm_s, 12)
-        self.imm_b_ext = ext(self.imm_b, 13)
-        self.imm_j_ext = ext(self.imm_j, 21)
+
+    base = property(lambda self: self.x & 0b11)                 # 1:0
+    op = property(lambda self: (self.x >> 2) & 0x1f)            # 6:2
+    opcode = property(lambda self: self.x & 0x7f)               # 6:0
+
+    rd = property(lambda self: (self.x >> 7) & 0x1f)            # 11:7
+    rs1 = property(lambda self: (self.x >> 15) & 0x1f)          # 19:15
+    rs2 = property(lambda self: (self.x >> 20) & 0x1f)          # 24:20
+    rs3 = property(lambda self: (self.x >> 27) & 0x1f)          # 31:27
+
+    funct3 = property(lambda self: (self.x >> 12) & 0b111)      # 14:12
+    funct7 = property(lambda self: (self.x >> 25) & 0x7f)       # 31:25
+
+    # immediate values
+    imm_i = property(lambda self: (self.x >> 20) & 0xfff)
+    imm_s = property(lambda self: ((self.x >> 20) & 0xfe0) | ((self.x >> 7) & 0x1f))
+    imm_u = property(lambda self: self.x & 0xfffff000)
+
+    @property
+    def imm_b(self):
+        x = self.x
+        return ((x >> 19) & 0x1000) | ((x << 4) & 0x800) | ((x >> 20) & 0x7e0) | ((x >> 7) & 0x1e)
+
+    @property
+    def imm_j(self):
+        x = self.x
+        return ((x >> 11) & 0x100000) | (x & 0xff000) | ((x >> 9) & 0x800) | ((x >> 20) & 0x7fe)
+
+    # sign extended immediates
+    imm_i_ext = property(lambda self: (((self.x >> 20) & 0xfff) ^ 0x800) - 0x800)
+    imm_s_ext = property(lambda self: (self.imm_s ^ 0x800) - 0x800)
+    imm_b_ext = property(lambda self: (self.imm_b ^ 0x1000) - 0x1000)
+    imm_j_ext = property(lambda self: (self.imm_j ^ 0x100000) - 0x100000)
+    imm_u_ext = property(lambda self: ((self.x & 0xfffff000) ^ 0x80000000) - 0x80000000)
 
 class CInstr(object):
+    # see Instr, fields are extracted on demand
+    __slots__ = ('x',)
+
     def __init__(self, x):
         self.x = x
 
-        self.op = bits(x,1,0)
-        
-        # 5-bit register id
-        self.rd = bits(x,11,7)
-        self.rs1 = bits(x,11,7)
-        self.rs2 = bits(x,6,2)
-
-        # 3-bit register id
-        self.rd_c = bits(x,4,2)
-        self.rs1_c = bits(x,9,7)
-        self.rs2_c = bits(x,4,2)
-
-        self.funct2 = bits(x,6,5)
-        self.funct3 = bits(x,15,13)
-        self.funct4 = bits(x,15,12)
-        self.funct6 = bits(x,15,10)
-        
-        # immediate values
-        self.imm_ci = (bits(x,12,12) << 5) + (bits(x,6,2))
-        self.imm_css = bits(x,12,7)
-        self.imm_ciw = bits(x,12,5)
-        self.imm_cl = (bits(x,12,10) << 2) + (bits(x,6,5))
-        self.imm_cs = (bits(x,12,10) << 2) + (bits(x,6,5))
-
-        self.offset = (bits(x,12,10) << 5) + (bits(x,6,2))
-        self.jump_target = bits(x,12,2)
-
-# LLIL branching util
-
-def il_jump(il, dest, is_call=False):
-
-    if is_call:
-        il.append(il.call(dest))
-    else:
-        # lookup label 
-        t = None
-        if il[dest].operation == LowLevelILOperation.LLIL_CONST:
-            t = il.get_label_for_address(Architecture['riscv:hacksec'], il[dest].constant)
-
-        # if the label doesn't exist, create a new one
-        indirect = False
-        if t is None:
-            t = LowLevelILLabel()
-            indirect = True
-
-        # if it doesn't exist, create and jump
-        if indirect:
-            il.mark_label(t)
-            il.append(il.jump(dest))
-        else:
-            # just goto label
-            il.append(il.goto(t))
+    op = property(lambda self: self.x & 0b11)                   # 1:0
+
+    # 5-bit register id
+    rd = property(lambda self: (self.x >> 7) & 0x1f)            # 11:7
+    rs1 = property(lambda self: (self.x >> 7) & 0x1f)           # 11:7
+    rs2 = property(lambda self: (self.x >> 2) & 0x1f)           # 6:2
 
+    # 3-bit register id
+    rd_c = property(lambda self: (self.x >> 2) & 0b111)         # 4:2
+    rs1_c = property(lambda self: (self.x >> 7) & 0b111)        # 9:7
+    rs2_c = property(lambda self: (self.x >> 2) & 0b111)        # 4:2
 
-def il_branch(il, cond, tdest, fdest):
-    
-    # lookup the true branch
-    t_target = None
-    if il[tdest].operation == LowLevelILOperation.LLIL_CONST:
-        t_target = il.get_label_for_address(Architecture['riscv:hacksec'], il[tdest].constant)
+    funct2 = property(lambda self: (self.x >> 5) & 0b11)        # 6:5
+    funct3 = property(lambda self: (self.x >> 13) & 0b111)      # 15:13
+    funct4 = property(lambda self: (self.x >> 12) & 0xf)        # 15:12
+    funct6 = property(lambda self: (self.x >> 10) & 0x3f)       # 15:10
 
-    # if the label doesn't exist, create a new one
-    indirect = False
-    if t_target is None:
-        t_target = LowLevelILLabel()
-        indirect = True
+    # immediate values
+    imm_ci = property(lambda self: ((self.x >> 7) & 0x20) | ((self.x >> 2) & 0x1f))
+    imm_css = property(lambda self: (self.x >> 7) & 0x3f)
+    imm_ciw = property(lambda self: (self.x >> 5) & 0xff)
+    imm_cl = property(lambda self: ((self.x >> 8) & 0x1c) | ((self.x >> 5) & 0b11))
+    imm_cs = property(lambda self: ((self.x >> 8) & 0x1c) | ((self.x >> 5) & 0b11))
 
-    # create the false branch
-    f_target = LowLevelILLabel()
+    offset = property(lambda self: ((self.x >> 5) & 0xe0) | ((self.x >> 2) & 0x1f))
+    jump_target = property(lambda self: (self.x >> 2) & 0x7ff)
 
-    # create the if_expr
-    il.append(il.if_expr(cond, t_target, f_target))
+def load_instr(op, v, mode):
+    info = InstructionInfo()
+    info.length = 4
 
-    # handle true target if indirect
-    if indirect:
-        il.mark_label(t_target)
-        il.append(il.jump(tdest))
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), v.imm_i_ext), tE(']')]
 
-    # mark false branch
-    il.mark_label(f_target)
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], REGS[v.rs1], v.imm_i_ext))
 
+    return (tok, info, lift)
 
-def load_instr(op, v): 
+def store_instr(op, v, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), v.imm_i_ext), tE(']')]
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(REGS[v.rs2]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_s_ext), v.imm_s_ext), tE(']')]
 
-    mem = lambda il: il.add(8, il.reg(8, REGS[v.rs1]), il.const(8, v.imm_i_ext))
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rs1], REGS[v.rs2], v.imm_s_ext))
 
-    fn = None
-    if op == 'lb':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.sign_extend(8, il.load(1, mem(il))))
-    elif op == 'lbu':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.zero_extend(8, il.load(1, mem(il))))
-    elif op == 'lh':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.sign_extend(8, il.load(2, mem(il))))
-    elif op == 'lhu':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.zero_extend(8, il.load(2, mem(il))))
-    elif op == 'lw':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.sign_extend(8, il.load(4, mem(il))))
-    elif op == 'lwu':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.zero_extend(8, il.load(4, mem(il))))
-    elif op == 'ld':
-        fn = lambda il: il.set_reg(8, REGS[v.rd], il.load(8, mem(il)))
+    return (tok, info, lift)
 
-    return (tok, info, fn)
+def itype_instr(op, v, mode):
+    info = InstructionInfo()
+    info.length = 4
 
-def store_instr(op, v): 
+    tok = None
+    if mode & TEXT:
+        if op == 'addi' and v.rs1 == 0:
+            tok = [tI('li'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
+        elif op == 'addiw' and v.rs1 == 0:
+            tok = [tI('liw'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
+        else:
+            tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], REGS[v.rs1], v.imm_i_ext))
+
+    return (tok, info, lift)
+
+def itype_shift_instr(op, v, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = [tI(op), tT(' '), tR(REGS[v.rs2]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_s_ext), v.imm_s_ext), tE(']')]
+    # 6 bit shift amount, 5 bits for the *w ops
+    shamt = v.rs2 if op[-1] == 'w' else v.imm_i & 0x3f
 
-    mem = lambda il: il.add(8, il.reg(8, REGS[v.rs1]), il.const(8, v.imm_s_ext))
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tN(hex(shamt), shamt)]
 
-    fn = None
-    if op == 'sb':
-        fn = lambda il: il.store(1, mem(il), il.low_part(1, il.reg(8, REGS[v.rs2])))
-    elif op == 'sh':
-        fn = lambda il: il.store(2, mem(il), il.low_part(2, il.reg(8, REGS[v.rs2])))
-    elif op == 'sw':
-        fn = lambda il: il.store(4, mem(il), il.low_part(4, il.reg(8, REGS[v.rs2])))
-    elif op == 'sd':
-        fn = lambda il: il.store(8, mem(il), il.reg(8, REGS[v.rs2]))
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], REGS[v.rs1], shamt))
 
-    return (tok, info, fn)
+    return (tok, info, lift)
 
-def itype_instr(op, v):
+def rtype_instr(op, v, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = []
-    if op == 'addi' and v.rs1 == 0: 
-        tok = [tI('li'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
-    elif op == 'addiw' and v.rs1 == 0: 
-        tok = [tI('liw'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
-    else: 
-        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tN(hex(v.imm_i_ext), v.imm_i_ext)]
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tR(REGS[v.rs2])]
 
-    src = (lambda il: il.reg(8, REGS[v.rs1]))
-    if v.rs1 == 0:
-        src = (lambda il: il.const(8, 0))
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], REGS[v.rs1], REGS[v.rs2]))
 
-    fn = None
-    if op == 'addi': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.add(8, src(il), il.const(8, v.imm_i_ext))))
-    elif op == 'subi': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.sub(8, src(il), il.const(8, v.imm_i_ext))))
-    elif op == 'xori': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.xor_expr(8, src(il), il.const(8, v.imm_i_ext))))
-    elif op == 'ori': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.or_expr(8, src(il), il.const(8, v.imm_i_ext))))
-    elif op == 'andi': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.and_expr(8, src(il), il.const(8, v.imm_i_ext))))
+    return (tok, info, lift)
 
-    elif op == 'addiw': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.add(8, src(il), il.const(8, v.imm_i_ext))))
-    elif op == 'subiw': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.sub(8, src(il), il.const(8, v.imm_i_ext))))
+def jal(v, addr, mode):
+    info = InstructionInfo()
+    info.length = 4
 
-    return (tok, info, fn)
+    target = v.imm_j_ext + addr
 
-def itype_shift_instr(op, v):
+    if v.rd == 0:
+        info.add_branch(BranchType.UnconditionalBranch, target)
+    else:
+        info.add_branch(BranchType.CallDestination, target)
+
+    tok = None
+    if mode & TEXT:
+        if v.rd == 0:
+            tok = [tI('j'), tT(' '), tA(hex(target), target)]
+        elif v.rd == 1:
+            tok = [tI('call'), tT(' '), tA(hex(target), target)]
+        else:
+            tok = [tI('jal'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(target), target)]
+
+    lift = None
+    if mode & IL:
+        lift = ('jal', (REGS[v.rd], target, addr + 4))
+
+    return (tok, info, lift)
+
+def jalr(v, addr, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tN(hex(v.rs2), v.rs2)]
+    # jalr zero, 0(ra) returns, with a link register it's a call
+    ret = v.rd == 0 and v.rs1 == 1 and v.imm_i_ext == 0
+    if ret:
+        info.add_branch(BranchType.FunctionReturn)
+    elif v.rd == 0:
+        info.add_branch(BranchType.UnresolvedBranch)
 
-    fn = None
-    if op == 'slli':
-        fn = (lambda il: il.set_reg(8, REGS[v.rd], il.shift_left(8, il.reg(8, REGS[v.rs1]), il.const(8, v.imm_i_ext))))
+    tok = None
+    if mode & TEXT:
+        if ret:
+            tok = [tI('ret')]
+        elif v.rd == 0:
+            if v.imm_i_ext == 0:
+                tok = [tI('jr'), tT(' '), tR(REGS[v.rs1])]
+            else:
+                tok = [tI('jr'), tT(' '), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), (v.imm_i_ext))]
+        else:
+            tok = [tI('jalr'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), (v.imm_i_ext))]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = ('jalr', (REGS[v.rd], REGS[v.rs1], v.imm_i_ext, addr + 4))
 
-def rtype_instr(op, v):
+    return (tok, info, lift)
+
+def lui(v, mode):
     info = InstructionInfo()
     info.length = 4
-    
-    tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tR(REGS[v.rs2])]
 
-    fn = None
-    if op == 'add': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.add(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
-    elif op == 'sub': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.sub(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
-    elif op == 'sll': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.shift_left(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
-    elif op == 'xor': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.xor_expr(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
-    elif op == 'and': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.and_expr(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
-    elif op == 'or': fn = (lambda il: il.set_reg(8, REGS[v.rd], il.or_expr(8, il.reg(8, REGS[v.rs1]), il.reg(8, REGS[v.rs2]))))
+    tok = None
+    if mode & TEXT:
+        tok = [tI('lui'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(v.imm_u), v.imm_u)]
+
+    lift = None
+    if mode & IL:
+        lift = ('lui', (REGS[v.rd], v.imm_u_ext))
 
-    return (tok, info, fn)
+    return (tok, info, lift)
 
-def jal(v, addr):
+def auipc(v, addr, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = []
-    if v.rd == 0:
-        tok = [tI('j'), tT(' '), tA(hex(v.imm_j_ext + addr), (v.imm_j_ext + addr))]
-        info.add_branch(BranchType.UnconditionalBranch, v.imm_j_ext + addr) 
-    elif v.rd == 1:
-        tok = [tI('call'), tT(' '), tA(hex(v.imm_j_ext + addr), (v.imm_j_ext + addr))]
-        info.add_branch(BranchType.CallDestination, v.imm_j_ext + addr)
-    else:
-        tok = [tI('jal'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(v.imm_j_ext + addr), (v.imm_j_ext + addr))]
-        info.add_branch(BranchType.CallDestination, v.imm_j_ext + addr) 
+    target = v.imm_u_ext + addr
 
-    fn = [
-        lambda il: il.set_reg(8, REGS[v.rd], il.add(8, il.reg(8, 'pc'), il.const(8, 4))), # link
-        lambda il: il_jump(il, il.const(8, v.imm_j_ext + addr), is_call=(v.rd==1))
-    ]
-    
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('auipc'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(target), target)]
 
-def jalr(v, addr):
+    lift = None
+    if mode & IL:
+        lift = ('auipc', (REGS[v.rd], target))
+
+    return (tok, info, lift)
+
+def branch_instr(op, v, addr, mode):
     info = InstructionInfo()
-    info.length = 4 
+    info.length = 4
+    info.add_branch(BranchType.TrueBranch, v.imm_b_ext + addr)
+    info.add_branch(BranchType.FalseBranch, addr + 4)
 
-    tok = []
-    if v.rd == 1 and v.imm_i_ext == 0:
-        tok = [tI('ret')]
-        info.add_branch(BranchType.FunctionReturn)
-    elif v.rd == 0:
-        if v.imm_i_ext == 0:
-            tok = [tI('jr'), tT(' '), tR(REGS[v.rs1])]
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(REGS[v.rs1]), tS(', '), tR(REGS[v.rs2]), tS(', '), tA(hex(v.imm_b_ext + addr), (v.imm_b_ext + addr))]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rs1], REGS[v.rs2], v.imm_b_ext + addr, addr + 4))
+
+    return (tok, info, lift)
+
+def simple(op, mode):
+    info = InstructionInfo()
+    info.length = 4
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, ())
+
+    return (tok, info, lift)
+
+def csr(op, v, mode):
+    info = InstructionInfo()
+    info.length = 4
+
+    tok = None
+    if mode & TEXT:
+        csr_nm = 'csr_%X' % v.imm_i
+        if v.imm_i in CSR:
+            csr_nm = CSR[v.imm_i]
+
+        if op == 'csrrs' and v.rs1 == 0:
+            tok = [tI('csrr'), tT(' '), tR(REGS[v.rd]), tS(', '), tT(csr_nm)]
         else:
-            tok = [tI('jr'), tT(' '), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), (v.imm_i_ext))]
-        info.add_branch(BranchType.UnresolvedBranch)
-    else:
-        tok = [tI('jalr'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), (v.imm_i_ext))]
-        info.add_branch(BranchType.UnresolvedBranch)
-    
-    fn = []
+            tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tT(csr_nm)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], v.imm_i, REGS[v.rs1]))
+
+    return (tok, info, lift)
+
+def csr_i(op, v, mode):
+    info = InstructionInfo()
+    info.length = 4
+
+    tok = None
+    if mode & TEXT:
+        csr_nm = 'csr_%X' % v.imm_i
+        if v.imm_i in CSR:
+            csr_nm = CSR[v.imm_i]
+
+        # the immediate is zero extended
+        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tN(str(v.rs1), v.rs1), tS(', '), tT(csr_nm)]
 
-    rs1 = (lambda il: il.reg(8, REGS[v.rs1])) if v.rs1 != 0 else (lambda il: il.const(8, 0))
-    target = (lambda il: il.add(8, rs1(il), il.const(8, v.imm_i_ext)))
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], v.imm_i, v.rs1))
 
-    if v.rd != 0:
-        # link
-        fn.append((lambda il: il.set_reg(8, REGS[v.rd], il.add(8, rs1(il), il.const(8, v.imm_i_ext + addr)))))
-    
-    # jump
-    fn.append((lambda il: il.jump(target(il))))
+    return (tok, info, lift)
 
-    return (tok, info, fn)
+def decode_system(v, addr, mode):
+    if   v.imm_i == 0b000000000000: return simple('ecall', mode)
+    elif v.imm_i == 0b000000000001: return simple('ebreak', mode)
 
-def lui(v):
+    # privileged:
+    if v.funct7 == 0b0000000:
+        if v.rs2 == 0b00010: return simple('uret', mode)
+    elif v.funct7 == 0b0001000:
+        if   v.rs2 == 0b00010: return simple('sret', mode)
+        elif v.rs2 == 0b00101: return simple('wfi', mode)
+    elif v.funct7 == 0b0011000:
+        if v.rs2 == 0b00010: return simple('mret', mode)
+    elif v.funct7 == 0b0001001:
+        return simple('sfence.vma', mode)
+
+# ------- F / D / A extensions -------
+
+def fp_load(op, v, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = [tI('lui'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(v.imm_u), v.imm_u)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.const(8, v.imm_u))
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(FREGS[v.rd]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_i_ext), v.imm_i_ext), tE(']')]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = (op, (FREGS[v.rd], REGS[v.rs1], v.imm_i_ext))
 
-def auipc(v, addr):
+    return (tok, info, lift)
+
+def fp_store(op, v, mode):
     info = InstructionInfo()
     info.length = 4
 
-    tok = [tI('auipc'), tT(' '), tR(REGS[v.rd]), tS(', '), tA(hex(v.imm_u + addr), (v.imm_u + addr))]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.const(8, v.imm_u + addr))
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(FREGS[v.rs2]), tS(', '), tM('['), tR(REGS[v.rs1]), tT('+'), tA(hex(v.imm_s_ext), v.imm_s_ext), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rs1], FREGS[v.rs2], v.imm_s_ext))
 
-    return (tok, info, fn)
+    return (tok, info, lift)
 
-def branch_instr(op, v, addr):
+def fp_rtype(op, v, mode, rd=FREGS):
+    '''fd, fs1, fs2, the comparisons write an integer rd'''
     info = InstructionInfo()
     info.length = 4
-    info.add_branch(BranchType.TrueBranch, v.imm_b_ext + addr) 
-    info.add_branch(BranchType.FalseBranch, addr + 4)
 
-    tok = [tI(op), tT(' '), tR(REGS[v.rs1]), tS(', '), tR(REGS[v.rs2]), tS(', '), tA(hex(v.imm_b_ext + addr), (v.imm_b_ext + addr))]
-    
-    fn = []
-    r1 = lambda il: il.reg(8, REGS[v.rs1])
-    r2 = lambda il: il.reg(8, REGS[v.rs2])
-    tdest = lambda il: il.const(8, v.imm_b_ext + addr)
-    fdest = lambda il: il.const(8, addr + 4)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(rd[v.rd]), tS(', '), tR(FREGS[v.rs1]), tS(', '), tR(FREGS[v.rs2])]
 
-    if op == 'beq': fn.append(lambda il: il_branch(il, il.compare_equal(8, r1(il), r2(il)), tdest(il), fdest(il)))
-    elif op == 'bne': fn.append(lambda il: il_branch(il, il.compare_not_equal(8, r1(il), r2(il)), tdest(il), fdest(il)))
-    elif op == 'blt': fn.append(lambda il: il_branch(il, il.compare_signed_less_than(8, r1(il), r2(il)), tdest(il), fdest(il)))
-    elif op == 'bltu': fn.append(lambda il: il_branch(il, il.compare_unsigned_less_than(8, r1(il), r2(il)), tdest(il), fdest(il)))
-    elif op == 'bge': fn.append(lambda il: il_branch(il, il.compare_signed_greater_than(8, r1(il), r2(il)), tdest(il), fdest(il)))
-    elif op == 'bgeu': fn.append(lambda il: il_branch(il, il.compare_unsigned_greater_than(8, r1(il), r2(il)), tdest(il), fdest(il)))
+    lift = None
+    if mode & IL:
+        lift = (op, (rd[v.rd], FREGS[v.rs1], FREGS[v.rs2]))
 
-    return (tok, info, fn)
+    return (tok, info, lift)
 
-def simple(op):
+def fp_r4(op, v, mode):
+    '''fused multiply-add, fd, fs1, fs2, fs3'''
     info = InstructionInfo()
     info.length = 4
-    
-    tok = [tI(op)]
-    
-    return (tok, info)
 
-def csr(op, v):
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(FREGS[v.rd]), tS(', '), tR(FREGS[v.rs1]), tS(', '), tR(FREGS[v.rs2]), tS(', '), tR(FREGS[v.rs3])]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (FREGS[v.rd], FREGS[v.rs1], FREGS[v.rs2], FREGS[v.rs3]))
+
+    return (tok, info, lift)
+
+def fp_unary(op, v, mode, rd=FREGS, rs=FREGS):
+    '''rd, rs1 from the given register files'''
     info = InstructionInfo()
     info.length = 4
 
-    csr_nm = 'csr_%X' % v.imm_i
-    if v.imm_i in CSR:
-        csr_nm = CSR[v.imm_i]
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(rd[v.rd]), tS(', '), tR(rs[v.rs1])]
 
-    tok = []
-    if op == 'csrrs' and v.rs1 == 0:
-        tok = [tI('csrr'), tT(' '), tR(REGS[v.rd]), tS(', '), tT(csr_nm)]
-    else:
-        tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs1]), tS(', '), tT(csr_nm)]
-    
-    return (tok, info)
+    lift = None
+    if mode & IL:
+        lift = (op, (rd[v.rd], rs[v.rs1]))
+
+    return (tok, info, lift)
 
-def csr_i(op, v):
+# aq / rl suffix by the low two funct7 bits
+AQRL = ['', '.rl', '.aq', '.aqrl']
+
+def amo(op, v, addr, mode):
     info = InstructionInfo()
     info.length = 4
 
-    csr_nm = 'csr_%X' % v.imm_i
-    if v.imm_i in CSR:
-        csr_nm = CSR[v.imm_i]
-    
-    tok = [tI(op), tT(' '), tR(REGS[v.rd]), tS(', '), tN(str(ext(v.rs1, 5)), ext(v.rs1, 5)), tS(', '), tT(csr_nm)]
-    
-    return (tok, info)
+    tok = None
+    if mode & TEXT:
+        name = op + AQRL[v.funct7 & 0b11]
+        if op[:2] == 'lr':
+            tok = [tI(name), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR(REGS[v.rs1]), tE(']')]
+        else:
+            tok = [tI(name), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs2]), tS(', '), tM('['), tR(REGS[v.rs1]), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (REGS[v.rd], REGS[v.rs1], REGS[v.rs2]))
+
+    return (tok, info, lift)
+
+def on(handler, op, *args):
+    '''table handler calling handler(op, v, mode, *args)'''
+    return lambda v, addr, mode: handler(op, v, mode, *args)
+
+def fcvt_int(ops, rd, rs, v, addr, mode):
+    '''fcvt to / from an integer, rs2 selects the integer type (ops[rs2])'''
+    if v.rs2 < len(ops):
+        return fp_unary(ops[v.rs2], v, mode, rd, rs)
+
+FMA_OPS = [(0b10000, 'fmadd'), (0b10001, 'fmsub'), (0b10010, 'fnmsub'), (0b10011, 'fnmadd')]
+
+def fp_ops(fmt, f):
+    '''BASE_OPS entries of one format, f is the fmt field (low funct7 bits)'''
+    mv = 'w' if fmt == 's' else 'd'
+    to_int = ['fcvt.%s.%s' % (i, fmt) for i in ('w', 'wu', 'l', 'lu')]
+    from_int = ['fcvt.%s.%s' % (fmt, i) for i in ('w', 'wu', 'l', 'lu')]
+
+    return [
+        (0b10100, None,  0b0000000 | f, on(fp_rtype, 'fadd.' + fmt)),
+        (0b10100, None,  0b0000100 | f, on(fp_rtype, 'fsub.' + fmt)),
+        (0b10100, None,  0b0001000 | f, on(fp_rtype, 'fmul.' + fmt)),
+        (0b10100, None,  0b0001100 | f, on(fp_rtype, 'fdiv.' + fmt)),
+        (0b10100, None,  0b0101100 | f, on(fp_unary, 'fsqrt.' + fmt)),
+        (0b10100, 0b000, 0b0010000 | f, on(fp_rtype, 'fsgnj.' + fmt)),
+        (0b10100, 0b001, 0b0010000 | f, on(fp_rtype, 'fsgnjn.' + fmt)),
+        (0b10100, 0b010, 0b0010000 | f, on(fp_rtype, 'fsgnjx.' + fmt)),
+        (0b10100, 0b000, 0b0010100 | f, on(fp_rtype, 'fmin.' + fmt)),
+        (0b10100, 0b001, 0b0010100 | f, on(fp_rtype, 'fmax.' + fmt)),
+        (0b10100, 0b010, 0b1010000 | f, on(fp_rtype, 'feq.' + fmt, REGS)),
+        (0b10100, 0b001, 0b1010000 | f, on(fp_rtype, 'flt.' + fmt, REGS)),
+        (0b10100, 0b000, 0b1010000 | f, on(fp_rtype, 'fle.' + fmt, REGS)),
+        (0b10100, 0b000, 0b1110000 | f, on(fp_unary, 'fmv.x.' + mv, REGS, FREGS)),
+        (0b10100, 0b001, 0b1110000 | f, on(fp_unary, 'fclass.' + fmt, REGS, FREGS)),
+        (0b10100, 0b000, 0b1111000 | f, on(fp_unary, 'fmv.%s.x' % mv, FREGS, REGS)),
+
+        (0b10100, None,  0b1100000 | f, partial(fcvt_int, to_int, REGS, FREGS)),
+        (0b10100, None,  0b1101000 | f, partial(fcvt_int, from_int, FREGS, REGS)),
+    ] + [
+        (op, None, range(f, 128, 4), on(fp_r4, name + '.' + fmt)) for op, name in FMA_OPS
+    ]
+
+# (funct5, op)
+AMO_OPS = [
+    (0b00010, 'lr'), (0b00011, 'sc'), (0b00001, 'amoswap'),
+    (0b00000, 'amoadd'), (0b00100, 'amoxor'), (0b01100, 'amoand'), (0b01000, 'amoor'),
+    (0b10000, 'amomin'), (0b10100, 'amomax'), (0b11000, 'amominu'), (0b11100, 'amomaxu'),
+]
 
-def decode_base(v, addr):
+# funct7 of the M extension and of the base R-type ops, other values are
+# other extensions (Zba / Zbb ...) and don't decode
+F7_M = 0b0000001
+F7_BASE = 0b0000000
+
+# the low funct7 bit of the rv64 immediate shifts is shamt[5]
+F7_SHIFT = (0b0000000, 0b0000001)
+F7_SHIFT_A = (0b0100000, 0b0100001)
+
+# (op, funct3, funct7, handler)
+# funct3 / funct7 may be None to match anything, more specific entries win
+BASE_OPS = [
+    # load
+    (0b00000, 0b000, None, lambda v, addr, mode: load_instr('lb', v, mode)),
+    (0b00000, 0b001, None, lambda v, addr, mode: load_instr('lh', v, mode)),
+    (0b00000, 0b010, None, lambda v, addr, mode: load_instr('lw', v, mode)),
+    (0b00000, 0b011, None, lambda v, addr, mode: load_instr('ld', v, mode)),
+    (0b00000, 0b100, None, lambda v, addr, mode: load_instr('lbu', v, mode)),
+    (0b00000, 0b101, None, lambda v, addr, mode: load_instr('lhu', v, mode)),
+    (0b00000, 0b110, None, lambda v, addr, mode: load_instr('lwu', v, mode)),
+
+    (0b00011, 0b000, None, lambda v, addr, mode: simple('fence', mode)),
+    (0b00011, 0b001, None, lambda v, addr, mode: simple('fence.I', mode)),
+
+    # I-type math
+    (0b00100, 0b000, None, lambda v, addr, mode: itype_instr('addi', v, mode)),
+    (0b00100, 0b001, F7_SHIFT, lambda v, addr, mode: itype_shift_instr('slli', v, mode)),
+    (0b00100, 0b010, None, lambda v, addr, mode: itype_instr('slti', v, mode)),
+    (0b00100, 0b011, None, lambda v, addr, mode: itype_instr('sltiu', v, mode)),
+    (0b00100, 0b100, None, lambda v, addr, mode: itype_instr('xori', v, mode)),
+    (0b00100, 0b101, F7_SHIFT, lambda v, addr, mode: itype_shift_instr('srli', v, mode)),
+    (0b00100, 0b101, F7_SHIFT_A, lambda v, addr, mode: itype_shift_instr('srai', v, mode)),
+    (0b00100, 0b110, None, lambda v, addr, mode: itype_instr('ori', v, mode)),
+    (0b00100, 0b111, None, lambda v, addr, mode: itype_instr('andi', v, mode)),
+
+    (0b00101, None,  None, lambda v, addr, mode: auipc(v, addr, mode)),
+
+    (0b00110, 0b000, None, lambda v, addr, mode: itype_instr('addiw', v, mode)),
+    (0b00110, 0b001, 0b0000000, lambda v, addr, mode: itype_shift_instr('slliw', v, mode)),
+    (0b00110, 0b101, 0b0000000, lambda v, addr, mode: itype_shift_instr('srliw', v, mode)),
+    (0b00110, 0b101, 0b0100000, lambda v, addr, mode: itype_shift_instr('sraiw', v, mode)),
+
+    # store
+    (0b01000, 0b000, None, lambda v, addr, mode: store_instr('sb', v, mode)),
+    (0b01000, 0b001, None, lambda v, addr, mode: store_instr('sh', v, mode)),
+    (0b01000, 0b010, None, lambda v, addr, mode: store_instr('sw', v, mode)),
+    (0b01000, 0b011, None, lambda v, addr, mode: store_instr('sd', v, mode)),
+
+    # M extension
+    (0b01100, 0b000, F7_M, lambda v, addr, mode: rtype_instr('mul', v, mode)),
+    (0b01100, 0b001, F7_M, lambda v, addr, mode: rtype_instr('mulh', v, mode)),
+    (0b01100, 0b010, F7_M, lambda v, addr, mode: rtype_instr('mulhsu', v, mode)),
+    (0b01100, 0b011, F7_M, lambda v, addr, mode: rtype_instr('mulhu', v, mode)),
+    (0b01100, 0b100, F7_M, lambda v, addr, mode: rtype_instr('div', v, mode)),
+    (0b01100, 0b101, F7_M, lambda v, addr, mode: rtype_instr('divu', v, mode)),
+    (0b01100, 0b110, F7_M, lambda v, addr, mode: rtype_instr('rem', v, mode)),
+    (0b01100, 0b111, F7_M, lambda v, addr, mode: rtype_instr('remu', v, mode)),
+
+    # R-type math
+    (0b01100, 0b000, 0b0000000, lambda v, addr, mode: rtype_instr('add', v, mode)),
+    (0b01100, 0b000, 0b0100000, lambda v, addr, mode: rtype_instr('sub', v, mode)),
+    (0b01100, 0b001, F7_BASE, lambda v, addr, mode: rtype_instr('sll', v, mode)),
+    (0b01100, 0b010, F7_BASE, lambda v, addr, mode: rtype_instr('slt', v, mode)),
+    (0b01100, 0b011, F7_BASE, lambda v, addr, mode: rtype_instr('sltu', v, mode)),
+    (0b01100, 0b100, F7_BASE, lambda v, addr, mode: rtype_instr('xor', v, mode)),
+    (0b01100, 0b101, 0b0000000, lambda v, addr, mode: rtype_instr('srl', v, mode)),
+    (0b01100, 0b101, 0b0100000, lambda v, addr, mode: rtype_instr('sra', v, mode)),
+    (0b01100, 0b110, F7_BASE, lambda v, addr, mode: rtype_instr('or', v, mode)),
+    (0b01100, 0b111, F7_BASE, lambda v, addr, mode: rtype_instr('and', v, mode)),
+
+    (0b01101, None,  None, lambda v, addr, mode: lui(v, mode)),
+
+    # rv64 extension (M)
+    (0b01110, 0b000, F7_M, lambda v, addr, mode: rtype_instr('mulw', v, mode)),
+    (0b01110, 0b100, F7_M, lambda v, addr, mode: rtype_instr('divw', v, mode)),
+    (0b01110, 0b101, F7_M, lambda v, addr, mode: rtype_instr('divuw', v, mode)),
+    (0b01110, 0b110, F7_M, lambda v, addr, mode: rtype_instr('remw', v, mode)),
+    (0b01110, 0b111, F7_M, lambda v, addr, mode: rtype_instr('remuw', v, mode)),
+
+    # rv64 extension
+    (0b01110, 0b000, 0b0000000, lambda v, addr, mode: rtype_instr('addw', v, mode)),
+    (0b01110, 0b000, 0b0100000, lambda v, addr, mode: rtype_instr('subw', v, mode)),
+    (0b01110, 0b001, F7_BASE, lambda v, addr, mode: rtype_instr('sllw', v, mode)),
+    (0b01110, 0b101, 0b0000000, lambda v, addr, mode: rtype_instr('srlw', v, mode)),
+    (0b01110, 0b101, 0b0100000, lambda v, addr, mode: rtype_instr('sraw', v, mode)),
+
+    # branches
+    (0b11000, 0b000, None, lambda v, addr, mode: branch_instr('beq', v, addr, mode)),
+    (0b11000, 0b001, None, lambda v, addr, mode: branch_instr('bne', v, addr, mode)),
+    (0b11000, 0b100, None, lambda v, addr, mode: branch_instr('blt', v, addr, mode)),
+    (0b11000, 0b101, None, lambda v, addr, mode: branch_instr('bge', v, addr, mode)),
+    (0b11000, 0b110, None, lambda v, addr, mode: branch_instr('bltu', v, addr, mode)),
+    (0b11000, 0b111, None, lambda v, addr, mode: branch_instr('bgeu', v, addr, mode)),
+
+    (0b11001, None,  None, jalr),
+    (0b11011, None,  None, jal),
+
+    (0b11100, 0b000, None, decode_system),
+    (0b11100, 0b001, None, lambda v, addr, mode: csr('csrrw', v, mode)),
+    (0b11100, 0b010, None, lambda v, addr, mode: csr('csrrs', v, mode)),
+    (0b11100, 0b011, None, lambda v, addr, mode: csr('csrrc', v, mode)),
+    (0b11100, 0b101, None, lambda v, addr, mode: csr_i('csrrwi', v, mode)),
+    (0b11100, 0b110, None, lambda v, addr, mode: csr_i('csrrsi', v, mode)),
+    (0b11100, 0b111, None, lambda v, addr, mode: csr_i('csrrci', v, mode)),
+
+    # F / D extensions
+    (0b00001, 0b010, None, lambda v, addr, mode: fp_load('flw', v, mode)),
+    (0b00001, 0b011, None, lambda v, addr, mode: fp_load('fld', v, mode)),
+    (0b01001, 0b010, None, lambda v, addr, mode: fp_store('fsw', v, mode)),
+    (0b01001, 0b011, None, lambda v, addr, mode: fp_store('fsd', v, mode)),
+    (0b10100, None,  0b0100000, lambda v, addr, mode: fp_unary('fcvt.s.d', v, mode)),
+    (0b10100, None,  0b0100001, lambda v, addr, mode: fp_unary('fcvt.d.s', v, mode)),
+] + fp_ops('s', 0b00) + fp_ops('d', 0b01) + [
+    # A extension, the low two funct7 bits are aq / rl
+    (0b01011, f3, range(f5 << 2, (f5 << 2) + 4), partial(amo, '%s.%s' % (op, w)))
+    for f5, op in AMO_OPS for f3, w in ((0b010, 'w'), (0b011, 'd'))
+]
+
+def may_reject(fn):
+    '''whether a BASE_TABLE handler looks at fields outside the dispatch key
+    and can return None for some words of its slot'''
+    return fn is decode_system or getattr(fn, 'func', None) is fcvt_int
+
+def base_index(op, funct3, funct7):
+    return (op << 10) | (funct3 << 7) | funct7
+
+def build_base_table():
+    '''flat (op, funct3, funct7) -> handler table'''
+    table = [None] * (1 << 15)
+
+    def expand(f, n):
+        if f is None: return range(n)
+        if type(f) is int: return (f,)
+        return f
+
+    def specificity(e):
+        return (e[1] is not None) + (type(e[2]) is int)
+
+    for op, funct3, funct7, fn in sorted(BASE_OPS, key=specificity):
+        for f3 in expand(funct3, 8):
+            for f7 in expand(funct7, 128):
+                table[base_index(op, f3, f7)] = fn
+
+    return table
+
+BASE_TABLE = build_base_table()
+
+def decode_base(v, addr, mode=ALL):
     '''base ISA'''
+    # index straight from the raw word, same as base_index(v.op, v.funct3, v.funct7)
+    x = v.x
+    fn = BASE_TABLE[(((x >> 2) & 0x1f) << 10) | (((x >> 12) & 0b111) << 7) | (x >> 25)]
+    if fn is None:
+        return None
 
-    if v.op == 0b00000:
-        # load
-        if   v.funct3 == 0b000: return load_instr('lb', v)
-        elif v.funct3 == 0b001: return load_instr('lh', v)
-        elif v.funct3 == 0b010: return load_instr('lw', v)
-        elif v.funct3 == 0b011: return load_instr('ld', v)
-        elif v.funct3 == 0b100: return load_instr('lbu', v)
-        elif v.funct3 == 0b101: return load_instr('lhu', v)
-        elif v.funct3 == 0b110: return load_instr('lwu', v)
-        return load_instr('load?%d' % v.funct3, v)
-
-    elif v.op == 0b00011:
-        if   v.funct3 == 0b000: return simple('fence')
-        elif v.funct3 == 0b001: return simple('fence.I')
-        
-    elif v.op == 0b00100:
-        # I-type math
-        if   v.funct3 == 0b000: return itype_instr('addi', v)
-        elif v.funct3 == 0b001: return itype_shift_instr('slli', v)
-        elif v.funct3 == 0b010: return itype_instr('slti', v)
-        elif v.funct3 == 0b011: return itype_instr('sltiu', v)
-        elif v.funct3 == 0b100: return itype_instr('xori', v)
-        elif v.funct3 == 0b101:
-            if   v.funct7 == 0b0000000: return itype_shift_instr('srli', v)
-            elif v.funct7 == 0b0100000: return itype_shift_instr('srai', v)
-        elif v.funct3 == 0b110: return itype_instr('ori', v)
-        elif v.funct3 == 0b111: return itype_instr('andi', v)
-        return itype_instr('itype?%d' % v.funct3, v)
-
-    elif v.op == 0b00101:
-        return auipc(v, addr)
-
-    elif v.op == 0b00110:
-        if   v.funct3 == 0b000: return itype_instr('addiw', v)
-        elif v.funct3 == 0b001: return itype_shift_instr('slliw', v)
-        elif v.funct3 == 0b101:
-            if   v.funct7 == 0b0000000: return itype_shift_instr('srliw', v)
-            elif v.funct7 == 0b0100000: return itype_shift_instr('sraiw', v)
-
-    elif v.op == 0b01000:
-        # store
-        if   v.funct3 == 0b000: return store_instr('sb', v)
-        elif v.funct3 == 0b001: return store_instr('sh', v)
-        elif v.funct3 == 0b010: return store_instr('sw', v)
-        elif v.funct3 == 0b011: return store_instr('sd', v)
-        return store_instr('store?%d' % v.funct3, v)
-
-    elif v.op == 0b01100:
-        if v.funct7 & 1:
-            # M extension
-            if   v.funct3 == 0b000: return rtype_instr('mul', v)
-            elif v.funct3 == 0b001: return rtype_instr('mulh', v)
-            elif v.funct3 == 0b010: return rtype_instr('mulhsu', v)
-            elif v.funct3 == 0b011: return rtype_instr('mulhu', v)
-            elif v.funct3 == 0b100: return rtype_instr('div', v)
-            elif v.funct3 == 0b101: return rtype_instr('divu', v)
-            elif v.funct3 == 0b110: return rtype_instr('rem', v)
-            elif v.funct3 == 0b111: return rtype_instr('remu', v)
-        else:
-            # R-type math
-            if   v.funct3 == 0b000:
-                if   v.funct7 == 0b0000000: return rtype_instr('add', v)
-                elif v.funct7 == 0b0100000: return rtype_instr('sub', v)
-            elif v.funct3 == 0b001: return rtype_instr('sll', v)
-            elif v.funct3 == 0b010: return rtype_instr('slt', v)
-            elif v.funct3 == 0b011: return rtype_instr('sltu', v)
-            elif v.funct3 == 0b100: return rtype_instr('xor', v)
-            elif v.funct3 == 0b101:
-                if   v.funct7 == 0b0000000: return rtype_instr('srl', v)
-                elif v.funct7 == 0b0100000: return rtype_instr('sra', v)
-            elif v.funct3 == 0b110: return rtype_instr('or', v)
-            elif v.funct3 == 0b111: return rtype_instr('xor', v)
-
-    elif v.op == 0b01101:
-        return lui(v)
-
-    elif v.op == 0b01110:
-        # rv64 extension
-        if v.funct7 & 1:
-            # M extension
-            if   v.funct3 == 0b000: return rtype_instr('mulw', v)
-            elif v.funct3 == 0b100: return rtype_instr('divw', v)
-            elif v.funct3 == 0b101: return rtype_instr('divuw', v)
-            elif v.funct3 == 0b110: return rtype_instr('remw', v)
-            elif v.funct3 == 0b111: return rtype_instr('remuw', v)
-        else:
-            if   v.funct3 == 0b000:
-                if   v.funct7 == 0b0000000: return rtype_instr('addw', v)
-                elif v.funct7 == 0b0100000: return rtype_instr('subw', v)
-            elif v.funct3 == 0b001: return rtype_instr('sllw', v)
-            elif v.funct3 == 0b101:
-                if   v.funct7 == 0b0000000: return rtype_instr('srlw', v)
-                elif v.funct7 == 0b0100000: return rtype_instr('sraw', v)
-
-    elif v.op == 0b11000:
-        # branches
-        if   v.funct3 == 0b000: return branch_instr('beq', v, addr)
-        elif v.funct3 == 0b001: return branch_instr('bne', v, addr)
-        elif v.funct3 == 0b100: return branch_instr('blt', v, addr)
-        elif v.funct3 == 0b101: return branch_instr('bge', v, addr)
-        elif v.funct3 == 0b110: return branch_instr('bltu', v, addr)
-        elif v.funct3 == 0b111: return branch_instr('bgeu', v, addr)
-
-    elif v.op == 0b11001:
-        return jalr(v, addr)
-
-    elif v.op == 0b11011:
-        return jal(v, addr)
-
-    elif v.op == 0b11100:
-        if   v.funct3 == 0b000:
-            if   v.imm_i == 0b000000000000: return simple('ecall')
-            elif v.imm_i == 0b000000000001: return simple('ebreak')
-
-            # privileged:
-            if v.funct7 == 0b0000000:
-                if v.rs2 == 0b00010: return simple('uret')
-            elif v.funct7 == 0b0001000:
-                if   v.rs2 == 0b00010: return simple('sret')
-                elif v.rs2 == 0b00101: return simple('wfi')
-            elif v.funct7 == 0b0011000:
-                if v.rs2 == 0b00010: return simple('mret')
-            elif v.funct7 == 0b0001001:
-                return simple('sfence.vma')
-
-        elif v.funct3 == 0b001: return csr('csrrw', v)
-        elif v.funct3 == 0b010: return csr('csrrs', v)
-        elif v.funct3 == 0b011: return csr('csrrc', v)
-        elif v.funct3 == 0b101: return csr_i('csrrwi', v)
-        elif v.funct3 == 0b110: return csr_i('csrrsi', v)
-        elif v.funct3 == 0b111: return csr_i('csrrci', v)
-
-            
+    return fn(v, addr, mode)
 
 
 # ------- Compressed extension -------
 
-def c_simple(op):
+def c_simple(op, mode):
     info = InstructionInfo()
     info.length = 2
 
-    tok = [tI(op)]
-    
-    return (tok, info)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, ())
+
+    return (tok, info, lift)
 
-def c_addi4spn(v):
+def c_addi4spn(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,10,7) << 6) + (bits(x,12,11) << 4) + (bits(x,5,5) << 3) + (bits(x,6,6) << 2)
-    
-    tok = [tI('c.addi4spn'), tT(' '), tR(RVC[v.rd_c]), tS(', '), tR('sp'), tS(', '), tN(str(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, RVC[v.rd_c], il.add(8, il.reg(8, 'sp'), il.const(8, imm)))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.addi4spn'), tT(' '), tR(RVC[v.rd_c]), tS(', '), tR('sp'), tS(', '), tN(str(imm), imm)]
 
-def c_lw(v):
+    lift = None
+    if mode & IL:
+        lift = ('c.addi4spn', (RVC[v.rd_c], 'sp', imm))
+
+    return (tok, info, lift)
+
+def c_lw(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,5,5) << 6) + (bits(x,12,10) << 3) + (bits(x,6,6) << 2)
-    
-    tok = [tI('c.lw'), tT(' '), tR(RVC[v.rd_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, RVC[v.rs1_c]), il.const_pointer(8, imm))
-    fn = lambda il: il.set_reg(8, RVC[v.rd_c], il.zero_extend(8, il.load(4, mem(il))))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.lw'), tT(' '), tR(RVC[v.rd_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.lw', (RVC[v.rd_c], RVC[v.rs1_c], imm))
+
+    return (tok, info, lift)
 
-def c_ld(v):
+def c_ld(v, mode, op='c.ld', regs=RVC):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,6,5) << 6) + (bits(x,12,10) << 3)
-    
-    tok = [tI('c.ld'), tT(' '), tR(RVC[v.rd_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, RVC[v.rs1_c]), il.const_pointer(8, imm))
-    fn = lambda il: il.set_reg(8, RVC[v.rd_c], il.load(8, mem(il)))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(regs[v.rd_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
 
-def c_sw(v):
+    lift = None
+    if mode & IL:
+        lift = (op, (regs[v.rd_c], RVC[v.rs1_c], imm))
+
+    return (tok, info, lift)
+
+def c_sw(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,5,5) << 6) + (bits(x,12,10) << 3) + (bits(x,6,6) << 2)
-    
-    tok = [tI('c.sw'), tT(' '), tR(RVC[v.rs2_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, RVC[v.rs1_c]), il.const_pointer(8, imm))
-    fn = lambda il: il.store(8, mem(il), il.low_part(4, il.reg(8, RVC[v.rs2_c])))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.sw'), tT(' '), tR(RVC[v.rs2_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.sw', (RVC[v.rs1_c], RVC[v.rs2_c], imm))
 
-def c_sd(v):
+    return (tok, info, lift)
+
+def c_sd(v, mode, op='c.sd', regs=RVC):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,6,5) << 6) + (bits(x,12,10) << 3)
-    
-    tok = [tI('c.sd'), tT(' '), tR(RVC[v.rs2_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, RVC[v.rs1_c]), il.const_pointer(8, imm))
-    fn = lambda il: il.store(8, mem(il), il.reg(8, RVC[v.rs2_c]))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(regs[v.rs2_c]), tS(', '), tM('['), tR(RVC[v.rs1_c]), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (RVC[v.rs1_c], regs[v.rs2_c], imm))
 
-def c_addi(v):
+    return (tok, info, lift)
+
+def c_addi(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
-    imm = (bits(x,12,12) << 5) + (bits(x,6,2))
-    
-    tok = [tI('c.addi'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.add(8, il.reg(8, REGS[v.rd]), il.const(8, imm)))
+    imm = ext((bits(x,12,12) << 5) + (bits(x,6,2)), 6)
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.addi'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
 
-def c_addiw(v):
+    lift = None
+    if mode & IL:
+        lift = ('c.addi', (REGS[v.rd], REGS[v.rd], imm))
+
+    return (tok, info, lift)
+
+def c_addiw(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
-    imm = (bits(x,12,12) << 5) + (bits(x,6,2))
-    
-    tok = [tI('c.addiw'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.add(8, il.reg(8, REGS[v.rd]), il.const(8, imm)))
+    imm = ext((bits(x,12,12) << 5) + (bits(x,6,2)), 6)
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.addiw'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
 
-def c_li(v):
+    lift = None
+    if mode & IL:
+        lift = ('c.addiw', (REGS[v.rd], REGS[v.rd], imm))
+
+    return (tok, info, lift)
+
+def c_li(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
-    imm = (bits(x,12,12) << 5) + (bits(x,6,2))
-    
-    tok = [tI('c.li'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.const(8, imm))
+    imm = ext((bits(x,12,12) << 5) + (bits(x,6,2)), 6)
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.li'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = ('c.li', (REGS[v.rd], imm))
 
-def c_addi16sp(v):
+    return (tok, info, lift)
+
+def c_addi16sp(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
-    imm = (bits(x,12,12) << 9) + (bits(x,4,3) << 7) + (bits(x,5,5) << 6) + (bits(x,2,2) << 5) + (bits(x,6,6) << 4)
-    
-    tok = [tI('c.addi16sp'), tT(' '), tR('sp'), tS(', '), tN(hex(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, 'sp', il.add(8, il.reg(8, 'sp'), il.const(8, imm)))
+    imm = ext((bits(x,12,12) << 9) + (bits(x,4,3) << 7) + (bits(x,5,5) << 6) + (bits(x,2,2) << 5) + (bits(x,6,6) << 4), 10)
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.addi16sp'), tT(' '), tR('sp'), tS(', '), tN(hex(imm), imm)]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = ('c.addi16sp', ('sp', 'sp', imm))
 
-def c_lui(v):
+    return (tok, info, lift)
+
+def c_lui(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,12,12) << 17) + (bits(x,6,2) << 12)
-    imm_ext = ext(imm, 17)
-    
-    tok = [tI('c.lui'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(imm_ext), imm_ext)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.const(8, imm_ext))
+    imm_ext = ext(imm, 18)
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.lui'), tT(' '), tR(REGS[v.rd]), tS(', '), tN(hex(imm_ext), imm_ext)]
 
-def c_j(v, addr):
-    info = InstructionInfo()
-    info.length = 2
+    lift = None
+    if mode & IL:
+        lift = ('c.lui', (REGS[v.rd], imm_ext))
+
+    return (tok, info, lift)
 
+def c_j_offset(v):
     x = v.x
     imm = (bits(x,12,12) << 11) + (bits(x,8,8) << 10) + (bits(x,10,9) << 8) + (bits(x,6,6) << 7) \
         + (bits(x,7,7) << 6) + (bits(x,2,2) << 5) + (bits(x,11,11) << 4) + (bits(x,5,3) << 1)
 
-    target = ext(imm, 12) + addr
+    return ext(imm, 12)
+
+def c_j_at(offset, addr, mode):
+    info = InstructionInfo()
+    info.length = 2
+
+    target = offset + addr
 
     info.add_branch(BranchType.UnconditionalBranch, target)
-    
-    tok = [tI('c.j'), tT(' '), tA(hex(target), target)]
 
-    fn = [lambda il: il_jump(il, il.const(8, target), False)]
-    
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.j'), tT(' '), tA(hex(target), target)]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.j', ('zero', target, None))
 
-def c_jr(op, v):
+    return (tok, info, lift)
+
+def c_j(v, addr, mode):
+    return c_j_at(c_j_offset(v), addr, mode)
+
+def c_jr(op, v, mode):
     info = InstructionInfo()
     info.length = 2
-    
-    tok = []
+
+    # c.jalr is a call
     if v.rs1 == 1 and op == 'c.jr':
-        tok = [tI('c.ret')]
         info.add_branch(BranchType.FunctionReturn)
-    else:
-        tok = [tI(op), tT(' '), tR(REGS[v.rs1])]
+    elif op == 'c.jr':
         info.add_branch(BranchType.UnresolvedBranch)
-    
-    fn = [lambda il: il_jump(il, il.reg(8, REGS[v.rs1]), False)]
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        if v.rs1 == 1 and op == 'c.jr':
+            tok = [tI('c.ret')]
+        else:
+            tok = [tI(op), tT(' '), tR(REGS[v.rs1])]
 
-def c_branch(op, v, addr):
-    info = InstructionInfo()
-    info.length = 2
+    lift = None
+    if mode & IL:
+        lift = (op, ('zero' if op == 'c.jr' else 'ra', REGS[v.rs1], 0, None))
+
+    return (tok, info, lift)
 
+def c_branch_offset(v):
     x = v.x
     imm = (bits(x,12,12) << 8) + (bits(x,6,5) << 6) + (bits(x,2,2) << 5) + (bits(x,11,10) << 3) + (bits(x,4,3) << 1)
 
-    target = addr + ext(imm, 9)
+    return ext(imm, 9)
+
+def c_branch_at(op, rs1_c, offset, addr, mode):
+    info = InstructionInfo()
+    info.length = 2
+
+    target = addr + offset
 
     info.add_branch(BranchType.TrueBranch, target)
     info.add_branch(BranchType.FalseBranch, addr + 2)
-    
-    tok = [tI(op), tT(' '), tR(RVC[v.rs1_c]), tS(', '), tA(hex(target), target)]
-    
-    fn = []
-    if op == 'c.beqz':
-        fn.append(lambda il: il_branch(il, il.compare_equal(8, il.reg(8, RVC[v.rs1_c]), il.const(8, 0)), il.const(8, target), il.const(8, addr+2)))
-    elif op == 'c.bnez':
-        fn.append(lambda il: il_branch(il, il.compare_not_equal(8, il.reg(8, RVC[v.rs1_c]), il.const(8, 0)), il.const(8, target), il.const(8, addr+2)))
-    
-    return (tok, info, fn)
-
-def c_slli(v):
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(RVC[rs1_c]), tS(', '), tA(hex(target), target)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (RVC[rs1_c], 'zero', target, addr + 2))
+
+    return (tok, info, lift)
+
+def c_branch(op, v, addr, mode):
+    return c_branch_at(op, v.rs1_c, c_branch_offset(v), addr, mode)
+
+def c_shift_imm(op, v, mode):
+    '''c.srli / c.srai'''
+    info = InstructionInfo()
+    info.length = 2
+
+    x = v.x
+    shamt = (bits(x,12,12) << 5) + (bits(x,6,2))
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(RVC[v.rs1_c]), tS(', '), tR(RVC[v.rs1_c]), tS(', '), tN(hex(shamt), shamt)]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (RVC[v.rs1_c], RVC[v.rs1_c], shamt))
+
+    return (tok, info, lift)
+
+def c_andi(v, mode):
+    info = InstructionInfo()
+    info.length = 2
+
+    x = v.x
+    imm = ext((bits(x,12,12) << 5) + (bits(x,6,2)), 6)
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.andi'), tT(' '), tR(RVC[v.rs1_c]), tS(', '), tR(RVC[v.rs1_c]), tS(', '), tN(hex(imm), imm)]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.andi', (RVC[v.rs1_c], RVC[v.rs1_c], imm))
+
+    return (tok, info, lift)
+
+def c_arith(op, v, mode):
+    '''register-register ops on the compressed registers, rd = rd op rs2'''
+    info = InstructionInfo()
+    info.length = 2
+
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(RVC[v.rs1_c]), tS(', '), tR(RVC[v.rs1_c]), tS(', '), tR(RVC[v.rs2_c])]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (RVC[v.rs1_c], RVC[v.rs1_c], RVC[v.rs2_c]))
+
+    return (tok, info, lift)
+
+def c_slli(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,12,12) << 5) + (bits(x,6,2))
 
-    tok = [tI('c.slli'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.shift_left(8, il.reg(8, REGS[v.rd]), il.const(8, imm)))
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.slli'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tN(hex(imm), imm)]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = ('c.slli', (REGS[v.rd], REGS[v.rd], imm))
 
-def c_lwsp(v):
+    return (tok, info, lift)
+
+def c_lwsp(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,3,2) << 6) + (bits(x,12,12) << 5) + (bits(x,6,4) << 2)
-    
-    tok = [tI('c.lwsp'), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, 'sp'), il.const(8, imm))
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.zero_extend(8, il.load(4, mem(il))))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.lwsp'), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.lwsp', (REGS[v.rd], 'sp', imm))
 
-def c_ldsp(v):
+    return (tok, info, lift)
+
+def c_ldsp(v, mode, op='c.ldsp', regs=REGS):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,4,2) << 6) + (bits(x,12,12) << 5) + (bits(x,6,5) << 3)
-    
-    tok = [tI('c.ldsp'), tT(' '), tR(REGS[v.rd]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, 'sp'), il.const(8, imm))
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.load(8, mem(il)))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(regs[v.rd]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = (op, (regs[v.rd], 'sp', imm))
+
+    return (tok, info, lift)
 
-def c_mv(v):
+def c_mv(v, mode):
     info = InstructionInfo()
     info.length = 2
 
-    tok = [tI('c.mv'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs2])]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.reg(8, REGS[v.rs2]))
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.mv'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs2])]
 
-    return (tok, info, fn)
+    lift = None
+    if mode & IL:
+        lift = ('c.mv', (REGS[v.rd], REGS[v.rs2]))
 
-def c_add(v):
+    return (tok, info, lift)
+
+def c_add(v, mode):
     info = InstructionInfo()
     info.length = 2
 
-    tok = [tI('c.add'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs2])]
-    
-    fn = lambda il: il.set_reg(8, REGS[v.rd], il.add(8, il.reg(8, REGS[v.rd]), il.reg(8, REGS[v.rs2])))
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.add'), tT(' '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rd]), tS(', '), tR(REGS[v.rs2])]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.add', (REGS[v.rd], REGS[v.rd], REGS[v.rs2]))
 
-    return (tok, info, fn)
+    return (tok, info, lift)
 
-def c_swsp(v):
+def c_swsp(v, mode):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,8,7) << 6) + (bits(x,12,9) << 2)
-    
-    tok = [tI('c.swsp'), tT(' '), tR(REGS[v.rs2]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, 'sp'), il.const(8, imm))
-    fn = lambda il: il.store(8, mem(il), il.low_part(4, il.reg(8, REGS[v.rs2])))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI('c.swsp'), tT(' '), tR(REGS[v.rs2]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = ('c.swsp', ('sp', REGS[v.rs2], imm))
+
+    return (tok, info, lift)
 
-def c_sdsp(v):
+def c_sdsp(v, mode, op='c.sdsp', regs=REGS):
     info = InstructionInfo()
     info.length = 2
 
     x = v.x
     imm = (bits(x,9,7) << 6) + (bits(x,12,8) << 3)
-    
-    tok = [tI('c.sdsp'), tT(' '), tR(REGS[v.rs2]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
-    
-    mem = lambda il: il.add(8, il.reg(8, 'sp'), il.const(8, imm))
-    fn = lambda il: il.store(8, mem(il), il.reg(8, REGS[v.rs2]))
 
-    return (tok, info, fn)
+    tok = None
+    if mode & TEXT:
+        tok = [tI(op), tT(' '), tR(regs[v.rs2]), tS(', '), tM('['), tR('sp'), tT('+'), tA(hex(imm), imm), tE(']')]
+
+    lift = None
+    if mode & IL:
+        lift = (op, ('sp', regs[v.rs2], imm))
+
+    return (tok, info, lift)
+
+C_ARITH = ['c.sub', 'c.xor', 'c.or', 'c.and', 'c.subw', 'c.addw', None, None]
+
+def decode_c_math(v, addr, mode):
+    f2 = bits(v.x,11,10)
+    if f2 == 0b00: return c_shift_imm('c.srli', v, mode)
+    elif f2 == 0b01: return c_shift_imm('c.srai', v, mode)
+    elif f2 == 0b10: return c_andi(v, mode)
+
+    # bit 12 and funct2 (6:5), the last two are reserved
+    op = C_ARITH[(bits(v.x,12,12) << 2) | v.funct2]
+    if op is not None:
+        return c_arith(op, v, mode)
+
+def decode_c_addi(v, addr, mode):
+    if v.rd == 0b00000: return c_simple('nop', mode)
+    else: return c_addi(v, mode)
+
+def decode_c_lui(v, addr, mode):
+    if v.rd == 0b00010: return c_addi16sp(v, mode)
+    elif v.rd != 0b0000: return c_lui(v, mode)
+
+def decode_c_jr(v, addr, mode):
+    if bits(v.x,12,12):
+        if v.rd == 0b00000: return c_simple('c.ebreak', mode)
+        else:
+            if v.rs2 == 0b00000: return c_jr('c.jalr', v, mode)
+            else: return c_add(v, mode)
+    else:
+        if v.rd != 0b00000:
+            if v.rs2 == 0b00000: return c_jr('c.jr', v, mode)
+            else: return c_mv(v, mode)
+
+def c_rd(fn):
+    '''handler for forms that are reserved when rd == 0'''
+    return lambda v, addr, mode: fn(v, mode) if v.rd != 0b00000 else None
+
+# (op, funct3) -> handler
+COMPRESSED_OPS = {
+    (0b00, 0b000): lambda v, addr, mode: c_addi4spn(v, mode),
+    (0b00, 0b001): lambda v, addr, mode: c_ld(v, mode, 'c.fld', FRVC),
+    (0b00, 0b010): lambda v, addr, mode: c_lw(v, mode),
+    (0b00, 0b011): lambda v, addr, mode: c_ld(v, mode),
+    (0b00, 0b100): None, # reserved
+    (0b00, 0b101): lambda v, addr, mode: c_sd(v, mode, 'c.fsd', FRVC),
+    (0b00, 0b110): lambda v, addr, mode: c_sw(v, mode),
+    (0b00, 0b111): lambda v, addr, mode: c_sd(v, mode),
+
+    (0b01, 0b000): decode_c_addi,
+    (0b01, 0b001): c_rd(c_addiw),
+    (0b01, 0b010): c_rd(c_li),
+    (0b01, 0b011): decode_c_lui,
+    (0b01, 0b100): decode_c_math,
+    (0b01, 0b101): c_j,
+    (0b01, 0b110): lambda v, addr, mode: c_branch('c.beqz', v, addr, mode),
+    (0b01, 0b111): lambda v, addr, mode: c_branch('c.bnez', v, addr, mode),
+
+    (0b10, 0b000): c_rd(c_slli),
+    (0b10, 0b001): lambda v, addr, mode: c_ldsp(v, mode, 'c.fldsp', FREGS),
+    (0b10, 0b010): c_rd(c_lwsp),
+    (0b10, 0b011): c_rd(c_ldsp),
+    (0b10, 0b100): decode_c_jr,
+    (0b10, 0b101): lambda v, addr, mode: c_sdsp(v, mode, 'c.fsdsp', FREGS),
+    (0b10, 0b110): lambda v, addr, mode: c_swsp(v, mode),
+    (0b10, 0b111): lambda v, addr, mode: c_sdsp(v, mode),
+}
+
+# flat table indexed by (op << 3) | funct3
+COMPRESSED_TABLE = [COMPRESSED_OPS.get((i >> 3, i & 0b111)) for i in range(32)]
 
-def decode_compressed(v, addr):
+def decode_compressed(v, addr, mode=ALL):
     '''C extension'''
     if v.x == 0:
-        return c_simple('illegal')
-
-    if   v.op == 0b00:
-        if   v.funct3 == 0b000: return c_addi4spn(v)
-        elif v.funct3 == 0b001: return c_simple('c.fld') # floating point (FLD)
-        elif v.funct3 == 0b010: return c_lw(v)
-        elif v.funct3 == 0b011: return c_ld(v)
-        elif v.funct3 == 0b100: return None # reserved
-        elif v.funct3 == 0b101: return c_simple('c.fsd') # floating point (FSD)
-        elif v.funct3 == 0b110: return c_sw(v)
-        elif v.funct3 == 0b111: return c_sd(v)
-    elif v.op == 0b01:
-        if v.funct3 == 0b000: 
-            if v.rd == 0b00000: return c_simple('nop')
-            else: return c_addi(v)
-        elif v.funct3 == 0b001:
-            if v.rd != 0b00000: return c_addiw(v)
-        elif v.funct3 == 0b010:
-            if v.rd != 0b00000: return c_li(v)
-        elif v.funct3 == 0b011:
-            if v.rd == 0b00010: return c_addi16sp(v)
-            elif v.rd != 0b0000: return c_lui(v)
-        elif v.funct3 == 0b100:
-            return c_simple('<c.math>')
-        elif v.funct3 == 0b101: return c_j(v, addr)
-        elif v.funct3 == 0b110: return c_branch('c.beqz', v, addr)
-        elif v.funct3 == 0b111: return c_branch('c.bnez', v, addr)
-    elif v.op == 0b10:
-        if v.funct3 == 0b000:
-            if v.rd != 0b00000: return c_slli(v)
-        elif v.funct3 == 0b001: return c_simple('c.fldsp')
-        elif v.funct3 == 0b010:
-            if v.rd != 0b00000: return c_lwsp(v)
-        elif v.funct3 == 0b011:
-            if v.rd != 0b00000: return c_ldsp(v)
-        elif v.funct3 == 0b100:
-            if bits(v.x,12,12):
-                if v.rd == 0b00000: return c_simple('c.ebreak')
-                else:
-                    if v.rs2 == 0b00000: return c_jr('c.jalr', v)
-                    else: return c_add(v)
-            else:
-                if v.rd != 0b00000:
-                    if v.rs2 == 0b00000: return c_jr('c.jr', v)
-                    else: return c_mv(v)
-        elif v.funct3 == 0b101: return c_simple('c.fsdsp')
-        elif v.funct3 == 0b110: return c_swsp(v)
-        elif v.funct3 == 0b111: return c_sdsp(v)
+        return c_simple('illegal', mode)
 
-    return None
+    fn = COMPRESSED_TABLE[(v.op << 3) | v.funct3]
+    if fn is None:
+        return None
+
+    return fn(v, addr, mode)
+
+
+# ------- Precomputed compressed decode -------
+
+# every 16-bit encoding decodes the same way at any address except for the
+# pc-relative forms, for those only the offset is precomputed and the result
+# is built per address
+RVC_PCREL = {
+    (0b01, 0b101): lambda v: partial(c_j_at, c_j_offset(v)),
+    (0b01, 0b110): lambda v: partial(c_branch_at, 'c.beqz', v.rs1_c, c_branch_offset(v)),
+    (0b01, 0b111): lambda v: partial(c_branch_at, 'c.bnez', v.rs1_c, c_branch_offset(v)),
+}
+
+# set to False to always decode compressed instructions from scratch
+USE_RVC_TABLE = True
+
+_UNDECODED = object()
+RVC_TABLE = [_UNDECODED] * 0x10000
+
+def rvc_entry(x):
+    v = CInstr(x)
+
+    pcrel = RVC_PCREL.get((v.op, v.funct3))
+    if pcrel is not None:
+        return pcrel(v)
+
+    return decode_compressed(v, 0, ALL)
+
+def decode_rvc(x, addr, mode=ALL):
+    '''compressed decode through the lazily filled per-halfword table
+
+    entries are built once in ALL mode and returned for any mode
+    '''
+    r = RVC_TABLE[x]
+    if r is _UNDECODED:
+        r = RVC_TABLE[x] = rvc_entry(x)
 
+    if type(r) is partial:
+        return r(addr, mode)
+    return r
 
-def decode(dat, addr):
-    
-    if bits(dat[0],1,0) == 0b11:
+def build_rvc_table():
+    '''eagerly fill the whole compressed table'''
+    for x in range(0x10000):
+        # skip 32-bit encodings
+        if x & 0b11 != 0b11 and RVC_TABLE[x] is _UNDECODED:
+            RVC_TABLE[x] = rvc_entry(x)
+
+def clear_rvc_table():
+    RVC_TABLE[:] = [_UNDECODED] * 0x10000
+
+
+def decode(dat, addr, mode=ALL):
+    '''decode one instruction, returns (tokens, info, lift) or None
+
+    lift is (op, args) for lift.LIFTERS
+
+    mode selects what is built besides the InstructionInfo (INFO, TEXT, IL
+    or ALL), parts that were not asked for may be None
+    '''
+    if dat[0] & 0b11 == 0b11:
         if len(dat) < 4: return None
 
         # base 32 bit instruction
         v = Instr(u32(dat))
-        return decode_base(v, addr)
+        return decode_base(v, addr, mode)
     else:
         if len(dat) < 2: return None
 
         # compressed 16 bit instruction
+        if USE_RVC_TABLE:
+            return decode_rvc(u16(dat), addr, mode)
+
         v = CInstr(u16(dat))
-        return decode_compressed(v, addr)
+        return decode_compressed(v, addr, mode)
 
     return None
+
+
+# ------- fused pairs -------
+
+# load funct3 -> (mnemonic, size, signed)
+FUSED_LOADS = {
+    0b000: ('lb', 1, True), 0b001: ('lh', 2, True), 0b010: ('lw', 4, True), 0b011: ('ld', 8, True),
+    0b100: ('lbu', 1, False), 0b101: ('lhu', 2, False), 0b110: ('lwu', 4, False),
+}
+
+def decode_pair(dat, addr, mode=ALL):
+    '''auipc / lui and the instruction completing the address, as one 8 byte
+    instruction with a resolved constant, or None if dat doesn't start with one
+
+    fused are the addi (la / li), addiw (li, after lui), load and jalr
+    (call / tail) forms where the second instruction reads the register the
+    first one wrote. addi and loads only when they overwrite it again, jalr
+    only linking to ra (after auipc ra) or not linking
+    '''
+    if len(dat) < 8 or dat[0] & 0x5f != 0x17 or dat[4] & 0b11 != 0b11:
+        return None
+
+    hi = Instr(u32(dat))
+    lo = Instr(u32(dat[4:]))
+    rd = hi.rd
+    if rd == 0 or lo.rs1 != rd:
+        return None
+
+    pc = hi.opcode == 0x17
+    value = hi.imm_u_ext + (addr if pc else 0)
+    imm = lo.imm_i_ext
+
+    info = InstructionInfo()
+    info.length = 8
+
+    tok = None
+    lift = None
+    opcode = lo.opcode
+
+    if opcode in (0x13, 0x1b) and lo.funct3 == 0 and lo.rd == rd:
+        # addi: la / li, addiw: li of a 32 bit value
+        if opcode == 0x1b:
+            if pc:
+                return None
+            value = ext((value + imm) & 0xffffffff, 32)
+        else:
+            value += imm
+
+        if mode & TEXT:
+            if pc:
+                tok = [tI('la'), tT(' '), tR(REGS[rd]), tS(', '), tA(hex(value), value)]
+            else:
+                tok = [tI('li'), tT(' '), tR(REGS[rd]), tS(', '), tN(hex(value), value)]
+        if mode & IL:
+            lift = ('la' if pc else 'li', (REGS[rd], value))
+
+    elif opcode == 0x03 and lo.funct3 in FUSED_LOADS and lo.rd == rd:
+        op, size, signed = FUSED_LOADS[lo.funct3]
+        value += imm
+
+        if mode & TEXT:
+            tok = [tI(op), tT(' '), tR(REGS[rd]), tS(', '), tM('['), tA(hex(value), value), tE(']')]
+        if mode & IL:
+            lift = ('load.abs', (size, signed, REGS[rd], value))
+
+    elif opcode == 0x67 and lo.funct3 == 0 and (lo.rd == 0 or lo.rd == rd == 1):
+        target = (value + imm) & ~1
+
+        if lo.rd == 1:
+            info.add_branch(BranchType.CallDestination, target)
+        else:
+            info.add_branch(BranchType.UnconditionalBranch, target)
+
+        if mode & TEXT:
+            tok = [tI('call' if lo.rd else 'tail'), tT(' '), tA(hex(target), target)]
+        if mode & IL:
+            if lo.rd:
+                lift = ('jal', ('ra', target, addr + 8))
+            else:
+                lift = ('tail', (REGS[rd], value, target))
+
+    else:
+        return None
+
+    return (tok, info, lift)
@@ -0,0 +1,570 @@
+'''LLIL lifters
+
+decode results carry (op, args) for lifting, RISCV.get_instruction_low_level_il
+calls LIFTERS[op](il, *args). args are register names, immediates and
+resolved addresses, lifters append their instructions themselves. ops
+without an entry are not lifted.
+'''
+from functools import partial
+
+from .instr import Architecture, LowLevelILLabel, LowLevelILOperation, LLIL_TEMP
+
+_arch = []
+
+def riscv_arch():
+    '''the registered architecture, looked up by name only once'''
+    if not _arch:
+        _arch.append(Architecture['riscv:hacksec'])
+    return _arch[0]
+
+# LLIL branching util, target is the address dest evaluates to if it's known
+
+def il_jump(il, dest, is_call=False, target=None):
+
+    if is_call:
+        il.append(il.call(dest))
+    else:
+        if target is None and il[dest].operation == LowLevelILOperation.LLIL_CONST:
+            target = il[dest].constant
+
+        # lookup label
+        t = None
+        if target is not None:
+            t = il.get_label_for_address(riscv_arch(), target)
+
+        # if the label doesn't exist, create a new one
+        indirect = False
+        if t is None:
+            t = LowLevelILLabel()
+            indirect = True
+
+        # if it doesn't exist, create and jump
+        if indirect:
+            il.mark_label(t)
+            il.append(il.jump(dest))
+        else:
+            # just goto label
+            il.append(il.goto(t))
+
+
+def il_branch(il, cond, tdest, fdest, target=None):
+
+    if target is None and il[tdest].operation == LowLevelILOperation.LLIL_CONST:
+        target = il[tdest].constant
+
+    # lookup the true branch
+    t_target = None
+    if target is not None:
+        t_target = il.get_label_for_address(riscv_arch(), target)
+
+    # if the label doesn't exist, create a new one
+    indirect = False
+    if t_target is None:
+        t_target = LowLevelILLabel()
+        indirect = True
+
+    # create the false branch
+    f_target = LowLevelILLabel()
+
+    # create the if_expr
+    il.append(il.if_expr(cond, t_target, f_target))
+
+    # handle true target if indirect
+    if indirect:
+        il.mark_label(t_target)
+        il.append(il.jump(tdest))
+
+    # mark false branch
+    il.mark_label(f_target)
+
+
+def reg_or_zero(il, r):
+    return il.const(8, 0) if r == 'zero' else il.reg(8, r)
+
+def set_rd(il, rd, val):
+    '''rd = val, writes to x0 are dropped'''
+    il.append(il.nop() if rd == 'zero' else il.set_reg(8, rd, val))
+
+def word(il, val):
+    '''sign extend the 32 bit result of a *w op'''
+    return il.sign_extend(8, val)
+
+def mem(il, base, offset):
+    '''base register + offset'''
+    return il.add(8, reg_or_zero(il, base), il.const(8, offset))
+
+def lift_load(size, signed, il, rd, rs1, imm):
+    val = il.load(size, mem(il, rs1, imm))
+    if size < 8:
+        val = il.sign_extend(8, val) if signed else il.zero_extend(8, val)
+    set_rd(il, rd, val)
+
+def lift_store(size, il, rs1, rs2, imm):
+    addr = mem(il, rs1, imm)
+    val = reg_or_zero(il, rs2)
+    if size < 8:
+        val = il.low_part(size, val)
+    il.append(il.store(size, addr, val))
+
+# op / cmp are the LowLevelILFunction methods
+
+def lift_op_imm(op, il, rd, rs1, imm):
+    '''rd = rs1 <op> imm'''
+    set_rd(il, rd, getattr(il, op)(8, reg_or_zero(il, rs1), il.const(8, imm)))
+
+def lift_op_imm_w(op, il, rd, rs1, imm):
+    a = il.low_part(4, reg_or_zero(il, rs1))
+    set_rd(il, rd, word(il, getattr(il, op)(4, a, il.const(4, imm))))
+
+def lift_cmp_imm(cmp, il, rd, rs1, imm):
+    set_rd(il, rd, il.bool_to_int(8, getattr(il, cmp)(8, reg_or_zero(il, rs1), il.const(8, imm))))
+
+def lift_op(op, il, rd, rs1, rs2):
+    '''rd = rs1 <op> rs2'''
+    set_rd(il, rd, getattr(il, op)(8, reg_or_zero(il, rs1), reg_or_zero(il, rs2)))
+
+def lift_op_w(op, il, rd, rs1, rs2):
+    a = il.low_part(4, reg_or_zero(il, rs1))
+    b = il.low_part(4, reg_or_zero(il, rs2))
+    set_rd(il, rd, word(il, getattr(il, op)(4, a, b)))
+
+def lift_cmp(cmp, il, rd, rs1, rs2):
+    set_rd(il, rd, il.bool_to_int(8, getattr(il, cmp)(8, reg_or_zero(il, rs1), reg_or_zero(il, rs2))))
+
+def lift_shift(op, il, rd, rs1, rs2):
+    # only the low 6 bits of rs2 are the shift amount
+    amount = il.and_expr(8, reg_or_zero(il, rs2), il.const(8, 0x3f))
+    set_rd(il, rd, getattr(il, op)(8, reg_or_zero(il, rs1), amount))
+
+def lift_shift_w(op, il, rd, rs1, rs2):
+    a = il.low_part(4, reg_or_zero(il, rs1))
+    amount = il.and_expr(8, reg_or_zero(il, rs2), il.const(8, 0x1f))
+    set_rd(il, rd, word(il, getattr(il, op)(4, a, amount)))
+
+def lift_mulh(ext1, ext2, il, rd, rs1, rs2):
+    '''upper 64 bits of the 128 bit product, ext* extend rs1 / rs2'''
+    a = getattr(il, ext1)(16, reg_or_zero(il, rs1))
+    b = getattr(il, ext2)(16, reg_or_zero(il, rs2))
+    hi = il.logical_shift_right(16, il.mult(16, a, b), il.const(1, 64))
+    set_rd(il, rd, il.low_part(8, hi))
+
+def lift_const(il, rd, value):
+    set_rd(il, rd, il.const(8, value))
+
+def lift_mv(il, rd, rs):
+    set_rd(il, rd, reg_or_zero(il, rs))
+
+# fused pairs (instr.decode_pair), the address is already resolved
+
+def lift_const_ptr(il, rd, value):
+    set_rd(il, rd, il.const_pointer(8, value))
+
+def lift_load_abs(il, size, signed, rd, address):
+    val = il.load(size, il.const_pointer(8, address))
+    if size < 8:
+        val = il.sign_extend(8, val) if signed else il.zero_extend(8, val)
+    set_rd(il, rd, val)
+
+def lift_tail(il, rd, value, target):
+    '''auipc rd / jalr zero, the scratch register keeps the upper part'''
+    set_rd(il, rd, il.const(8, value))
+    il_jump(il, il.const_pointer(8, target), False, target)
+
+def lift_jal(il, rd, target, link):
+    dest = il.const_pointer(8, target)
+
+    if rd == 'zero':
+        il_jump(il, dest, False, target)
+        return
+
+    # every link register makes it a call (CallDestination in the info),
+    # ra is left to the call, other link registers are written before it
+    if rd != 'ra':
+        set_rd(il, rd, il.const_pointer(8, link))
+    il.append(il.call(dest))
+
+def lift_jalr(il, rd, rs1, imm, link):
+    dest = reg_or_zero(il, rs1)
+    if rd == 'zero' and rs1 == 'ra' and imm == 0:
+        il.append(il.ret(dest))
+        return
+
+    if imm:
+        dest = il.add(8, dest, il.const(8, imm))
+    # the lowest bit of the target is cleared
+    dest = il.and_expr(8, dest, il.const(8, ~1))
+
+    if rd == 'zero':
+        il.append(il.jump(dest))
+    elif rd == 'ra':
+        il.append(il.call(dest))
+    else:
+        # a call linking through another register, rs1 may be rd
+        il.append(il.set_reg(8, LLIL_TEMP(0), dest))
+        set_rd(il, rd, il.const_pointer(8, link))
+        il.append(il.call(il.reg(8, LLIL_TEMP(0))))
+
+def lift_branch(cmp, il, rs1, rs2, target, fallthrough):
+    cond = getattr(il, cmp)(8, reg_or_zero(il, rs1), reg_or_zero(il, rs2))
+    il_branch(il, cond, il.const_pointer(8, target), il.const_pointer(8, fallthrough), target)
+
+def lift_csr(name, il, rd, csr, rs1):
+    '''csr ops are intrinsics (see RISCV.intrinsics) taking the csr number'''
+    src = reg_or_zero(il, rs1) if type(rs1) is str else il.const(8, rs1)
+    il.append(il.intrinsic([] if rd == 'zero' else [rd], name, [il.const(2, csr), src]))
+
+def lift_nop(il):
+    il.append(il.nop())
+
+def lift_ecall(il):
+    il.append(il.system_call())
+
+def lift_ebreak(il):
+    il.append(il.breakpoint())
+
+def lift_noret(il):
+    # trap returns leave the function
+    il.append(il.no_ret())
+
+def lift_undefined(il):
+    il.append(il.undefined())
+
+# floating point registers are 8 bytes, single precision values live in the
+# low 4 (nan boxing is not modelled)
+
+def freg(il, size, r):
+    val = il.reg(8, r)
+    return val if size == 8 else il.low_part(4, val)
+
+def set_fd(il, size, fd, val):
+    il.append(il.set_reg(8, fd, val if size == 8 else il.zero_extend(8, val)))
+
+def lift_fload(size, il, fd, rs1, imm):
+    set_fd(il, size, fd, il.load(size, mem(il, rs1, imm)))
+
+def lift_fstore(size, il, rs1, fs2, imm):
+    il.append(il.store(size, mem(il, rs1, imm), freg(il, size, fs2)))
+
+def lift_fop(op, size, il, fd, fs1, fs2):
+    '''fd = fs1 <op> fs2'''
+    set_fd(il, size, fd, getattr(il, op)(size, freg(il, size, fs1), freg(il, size, fs2)))
+
+def lift_fsqrt(size, il, fd, fs1):
+    set_fd(il, size, fd, il.float_sqrt(size, freg(il, size, fs1)))
+
+def lift_fma(neg_product, neg_addend, size, il, fd, fs1, fs2, fs3):
+    '''fd = +-(fs1 * fs2) +- fs3'''
+    product = il.float_mult(size, freg(il, size, fs1), freg(il, size, fs2))
+    if neg_product:
+        product = il.float_neg(size, product)
+    addend = freg(il, size, fs3)
+    if neg_addend:
+        addend = il.float_neg(size, addend)
+    set_fd(il, size, fd, il.float_add(size, product, addend))
+
+def lift_fsgnj(kind, size, il, fd, fs1, fs2):
+    '''sign injection, fs1 == fs2 are the fmv / fneg / fabs pseudo ops'''
+    a = freg(il, size, fs1)
+    if fs1 == fs2:
+        if kind == 'n':
+            a = il.float_neg(size, a)
+        elif kind == 'x':
+            a = il.float_abs(size, a)
+        set_fd(il, size, fd, a)
+        return
+
+    sign = 1 << (size * 8 - 1)
+    b = freg(il, size, fs2)
+    if kind == 'n':
+        b = il.not_expr(size, b)
+    b = il.and_expr(size, b, il.const(size, sign))
+    if kind == 'x':
+        set_fd(il, size, fd, il.xor_expr(size, a, b))
+    else:
+        set_fd(il, size, fd, il.or_expr(size, il.and_expr(size, a, il.const(size, sign - 1)), b))
+
+def lift_fcmp(cmp, size, il, rd, fs1, fs2):
+    set_rd(il, rd, il.bool_to_int(8, getattr(il, cmp)(size, freg(il, size, fs1), freg(il, size, fs2))))
+
+def lift_fcvt_to_int(size, isize, il, rd, fs1):
+    val = il.float_to_int(isize, freg(il, size, fs1))
+    set_rd(il, rd, val if isize == 8 else word(il, val))
+
+def lift_fcvt_from_int(size, isize, signed, il, fd, rs1):
+    val = reg_or_zero(il, rs1)
+    if isize == 4:
+        val = il.low_part(4, val)
+        val = il.sign_extend(8, val) if signed else il.zero_extend(8, val)
+    set_fd(il, size, fd, il.int_to_float(size, val))
+
+def lift_fcvt(size, src_size, il, fd, fs1):
+    set_fd(il, size, fd, il.float_convert(size, freg(il, src_size, fs1)))
+
+def lift_fmv_x(size, il, rd, fs1):
+    val = freg(il, size, fs1)
+    set_rd(il, rd, val if size == 8 else word(il, val))
+
+def lift_fmv_f(size, il, fd, rs1):
+    val = reg_or_zero(il, rs1)
+    set_fd(il, size, fd, val if size == 8 else il.low_part(4, val))
+
+def lift_fintrinsic(name, il, rd, *srcs):
+    '''fmin / fmax / fclass (see RISCV.intrinsics)'''
+    il.append(il.intrinsic([] if rd == 'zero' else [rd], name, [il.reg(8, r) for r in srcs]))
+
+# A extension, the reservation of lr / sc is not modelled, sc always succeeds
+
+def lift_lr(size, il, rd, rs1, rs2):
+    val = il.load(size, reg_or_zero(il, rs1))
+    set_rd(il, rd, val if size == 8 else word(il, val))
+
+def lift_sc(size, il, rd, rs1, rs2):
+    val = reg_or_zero(il, rs2)
+    if size < 8:
+        val = il.low_part(size, val)
+    il.append(il.store(size, reg_or_zero(il, rs1), val))
+    set_rd(il, rd, il.const(8, 0))
+
+def amo_operands(size, il, rs1, rs2):
+    '''old value into temp 0, returns (old, rs2)'''
+    il.append(il.set_reg(size, LLIL_TEMP(0), il.load(size, reg_or_zero(il, rs1))))
+    src = reg_or_zero(il, rs2)
+    if size < 8:
+        src = il.low_part(size, src)
+    return il.reg(size, LLIL_TEMP(0)), src
+
+def amo_result(size, il, rd):
+    '''rd = old value'''
+    old = il.reg(size, LLIL_TEMP(0))
+    set_rd(il, rd, old if size == 8 else word(il, old))
+
+def lift_amo(op, size, il, rd, rs1, rs2):
+    '''mem[rs1] = mem[rs1] <op> rs2, swap when op is None'''
+    old, src = amo_operands(size, il, rs1, rs2)
+    il.append(il.store(size, reg_or_zero(il, rs1), src if op is None else getattr(il, op)(size, old, src)))
+    amo_result(size, il, rd)
+
+def lift_amo_minmax(cmp, size, il, rd, rs1, rs2):
+    '''mem[rs1] = rs2 unless old <cmp> rs2 already holds'''
+    old, src = amo_operands(size, il, rs1, rs2)
+    keep = LowLevelILLabel()
+    store = LowLevelILLabel()
+    il.append(il.if_expr(getattr(il, cmp)(size, old, src), keep, store))
+    il.mark_label(store)
+    il.append(il.store(size, reg_or_zero(il, rs1), src))
+    il.mark_label(keep)
+    amo_result(size, il, rd)
+
+LIFTERS = {
+    # loads (rd, rs1, imm) / stores (rs1, rs2, imm)
+    'lb': partial(lift_load, 1, True),
+    'lh': partial(lift_load, 2, True),
+    'lw': partial(lift_load, 4, True),
+    'ld': partial(lift_load, 8, True),
+    'lbu': partial(lift_load, 1, False),
+    'lhu': partial(lift_load, 2, False),
+    'lwu': partial(lift_load, 4, False),
+
+    'sb': partial(lift_store, 1),
+    'sh': partial(lift_store, 2),
+    'sw': partial(lift_store, 4),
+    'sd': partial(lift_store, 8),
+
+    # I-type (rd, rs1, imm), shifts take the shift amount as imm
+    'addi': partial(lift_op_imm, 'add'),
+    'slti': partial(lift_cmp_imm, 'compare_signed_less_than'),
+    'sltiu': partial(lift_cmp_imm, 'compare_unsigned_less_than'),
+    'xori': partial(lift_op_imm, 'xor_expr'),
+    'ori': partial(lift_op_imm, 'or_expr'),
+    'andi': partial(lift_op_imm, 'and_expr'),
+    'slli': partial(lift_op_imm, 'shift_left'),
+    'srli': partial(lift_op_imm, 'logical_shift_right'),
+    'srai': partial(lift_op_imm, 'arith_shift_right'),
+
+    'addiw': partial(lift_op_imm_w, 'add'),
+    'slliw': partial(lift_op_imm_w, 'shift_left'),
+    'srliw': partial(lift_op_imm_w, 'logical_shift_right'),
+    'sraiw': partial(lift_op_imm_w, 'arith_shift_right'),
+
+    # R-type (rd, rs1, rs2)
+    'add': partial(lift_op, 'add'),
+    'sub': partial(lift_op, 'sub'),
+    'sll': partial(lift_shift, 'shift_left'),
+    'slt': partial(lift_cmp, 'compare_signed_less_than'),
+    'sltu': partial(lift_cmp, 'compare_unsigned_less_than'),
+    'xor': partial(lift_op, 'xor_expr'),
+    'srl': partial(lift_shift, 'logical_shift_right'),
+    'sra': partial(lift_shift, 'arith_shift_right'),
+    'or': partial(lift_op, 'or_expr'),
+    'and': partial(lift_op, 'and_expr'),
+
+    'addw': partial(lift_op_w, 'add'),
+    'subw': partial(lift_op_w, 'sub'),
+    'sllw': partial(lift_shift_w, 'shift_left'),
+    'srlw': partial(lift_shift_w, 'logical_shift_right'),
+    'sraw': partial(lift_shift_w, 'arith_shift_right'),
+
+    # M extension
+    'mul': partial(lift_op, 'mult'),
+    'mulh': partial(lift_mulh, 'sign_extend', 'sign_extend'),
+    'mulhsu': partial(lift_mulh, 'sign_extend', 'zero_extend'),
+    'mulhu': partial(lift_mulh, 'zero_extend', 'zero_extend'),
+    'div': partial(lift_op, 'div_signed'),
+    'divu': partial(lift_op, 'div_unsigned'),
+    'rem': partial(lift_op, 'mod_signed'),
+    'remu': partial(lift_op, 'mod_unsigned'),
+
+    'mulw': partial(lift_op_w, 'mult'),
+    'divw': partial(lift_op_w, 'div_signed'),
+    'divuw': partial(lift_op_w, 'div_unsigned'),
+    'remw': partial(lift_op_w, 'mod_signed'),
+    'remuw': partial(lift_op_w, 'mod_unsigned'),
+
+    # (rd, value)
+    'lui': lift_const,
+    'auipc': lift_const,
+
+    # (rd, target, link) / (rd, rs1, imm, link)
+    'jal': lift_jal,
+    'jalr': lift_jalr,
+
+    # (rs1, rs2, target, fallthrough)
+    'beq': partial(lift_branch, 'compare_equal'),
+    'bne': partial(lift_branch, 'compare_not_equal'),
+    'blt': partial(lift_branch, 'compare_signed_less_than'),
+    'bge': partial(lift_branch, 'compare_signed_greater_equal'),
+    'bltu': partial(lift_branch, 'compare_unsigned_less_than'),
+    'bgeu': partial(lift_branch, 'compare_unsigned_greater_equal'),
+
+    'fence': lift_nop,
+    'fence.I': lift_nop,
+    'ecall': lift_ecall,
+    'ebreak': lift_ebreak,
+    'uret': lift_noret,
+    'sret': lift_noret,
+    'mret': lift_noret,
+    'wfi': lift_nop,
+    'sfence.vma': lift_nop,
+
+    # (rd, csr, rs1 or uimm)
+    'csrrw': partial(lift_csr, 'csrrw'),
+    'csrrs': partial(lift_csr, 'csrrs'),
+    'csrrc': partial(lift_csr, 'csrrc'),
+    'csrrwi': partial(lift_csr, 'csrrw'),
+    'csrrsi': partial(lift_csr, 'csrrs'),
+    'csrrci': partial(lift_csr, 'csrrc'),
+
+    # compressed, the base lifters with expanded operands
+    'illegal': lift_undefined,
+    'c.addi4spn': partial(lift_op_imm, 'add'),
+    'c.lw': partial(lift_load, 4, True),
+    'c.ld': partial(lift_load, 8, True),
+    'c.sw': partial(lift_store, 4),
+    'c.sd': partial(lift_store, 8),
+    'nop': lift_nop,
+    'c.addi': partial(lift_op_imm, 'add'),
+    'c.addiw': partial(lift_op_imm_w, 'add'),
+    'c.li': lift_const,
+    'c.addi16sp': partial(lift_op_imm, 'add'),
+    'c.lui': lift_const,
+    'c.srli': partial(lift_op_imm, 'logical_shift_right'),
+    'c.srai': partial(lift_op_imm, 'arith_shift_right'),
+    'c.andi': partial(lift_op_imm, 'and_expr'),
+    'c.sub': partial(lift_op, 'sub'),
+    'c.xor': partial(lift_op, 'xor_expr'),
+    'c.or': partial(lift_op, 'or_expr'),
+    'c.and': partial(lift_op, 'and_expr'),
+    'c.subw': partial(lift_op_w, 'sub'),
+    'c.addw': partial(lift_op_w, 'add'),
+    'c.j': lift_jal,
+    'c.beqz': partial(lift_branch, 'compare_equal'),
+    'c.bnez': partial(lift_branch, 'compare_not_equal'),
+    'c.slli': partial(lift_op_imm, 'shift_left'),
+    'c.lwsp': partial(lift_load, 4, True),
+    'c.ldsp': partial(lift_load, 8, True),
+    'c.jr': lift_jalr,
+    'c.jalr': lift_jalr,
+    'c.mv': lift_mv,
+    'c.add': partial(lift_op, 'add'),
+    'c.ebreak': lift_ebreak,
+    'c.swsp': partial(lift_store, 4),
+    'c.sdsp': partial(lift_store, 8),
+
+    # F / D extensions
+    'flw': partial(lift_fload, 4),
+    'fld': partial(lift_fload, 8),
+    'fsw': partial(lift_fstore, 4),
+    'fsd': partial(lift_fstore, 8),
+    'fcvt.s.d': partial(lift_fcvt, 4, 8),
+    'fcvt.d.s': partial(lift_fcvt, 8, 4),
+    'c.fld': partial(lift_fload, 8),
+    'c.fsd': partial(lift_fstore, 8),
+    'c.fldsp': partial(lift_fload, 8),
+    'c.fsdsp': partial(lift_fstore, 8),
+
+    # fused pairs
+    'la': lift_const_ptr,
+    'li': lift_const,
+    'load.abs': lift_load_abs,
+    'tail': lift_tail,
+}
+
+def fp_lifters(fmt, size):
+    '''lifters of the F (fmt s) or D (fmt d) ops'''
+    mv = 'w' if fmt == 's' else 'd'
+    lifters = {
+        'fadd.' + fmt: partial(lift_fop, 'float_add', size),
+        'fsub.' + fmt: partial(lift_fop, 'float_sub', size),
+        'fmul.' + fmt: partial(lift_fop, 'float_mult', size),
+        'fdiv.' + fmt: partial(lift_fop, 'float_div', size),
+        'fsqrt.' + fmt: partial(lift_fsqrt, size),
+        'fmadd.' + fmt: partial(lift_fma, False, False, size),
+        'fmsub.' + fmt: partial(lift_fma, False, True, size),
+        'fnmsub.' + fmt: partial(lift_fma, True, False, size),
+        'fnmadd.' + fmt: partial(lift_fma, True, True, size),
+        'fsgnj.' + fmt: partial(lift_fsgnj, 'j', size),
+        'fsgnjn.' + fmt: partial(lift_fsgnj, 'n', size),
+        'fsgnjx.' + fmt: partial(lift_fsgnj, 'x', size),
+        'fmin.' + fmt: partial(lift_fintrinsic, 'fmin'),
+        'fmax.' + fmt: partial(lift_fintrinsic, 'fmax'),
+        'fclass.' + fmt: partial(lift_fintrinsic, 'fclass'),
+        'feq.' + fmt: partial(lift_fcmp, 'float_compare_equal', size),
+        'flt.' + fmt: partial(lift_fcmp, 'float_compare_less_than', size),
+        'fle.' + fmt: partial(lift_fcmp, 'float_compare_less_equal', size),
+        'fmv.x.' + mv: partial(lift_fmv_x, size),
+        'fmv.%s.x' % mv: partial(lift_fmv_f, size),
+    }
+    for i, isize, signed in (('w', 4, True), ('wu', 4, False), ('l', 8, True), ('lu', 8, False)):
+        lifters['fcvt.%s.%s' % (i, fmt)] = partial(lift_fcvt_to_int, size, isize)
+        lifters['fcvt.%s.%s' % (fmt, i)] = partial(lift_fcvt_from_int, size, isize, signed)
+    return lifters
+
+def amo_lifters(w, size):
+    '''lifters of the .w / .d atomics'''
+    return {
+        'lr.' + w: partial(lift_lr, size),
+        'sc.' + w: partial(lift_sc, size),
+        'amoswap.' + w: partial(lift_amo, None, size),
+        'amoadd.' + w: partial(lift_amo, 'add', size),
+        'amoxor.' + w: partial(lift_amo, 'xor_expr', size),
+        'amoand.' + w: partial(lift_amo, 'and_expr', size),
+        'amoor.' + w: partial(lift_amo, 'or_expr', size),
+        'amomin.' + w: partial(lift_amo_minmax, 'compare_signed_less_equal', size),
+        'amomax.' + w: partial(lift_amo_minmax, 'compare_signed_greater_equal', size),
+        'amominu.' + w: partial(lift_amo_minmax, 'compare_unsigned_less_equal', size),
+        'amomaxu.' + w: partial(lift_amo_minmax, 'compare_unsigned_greater_equal', size),
+    }
+
+LIFTERS.update(fp_lifters('s', 4))
+LIFTERS.update(fp_lifters('d', 8))
+LIFTERS.update(amo_lifters('w', 4))
+LIFTERS.update(amo_lifters('d', 8))
+
+def lift(il, r):
+    '''lift the (op, args) of a decode result, False if op has no lifter'''
+    fn = LIFTERS.get(r[0])
+    if fn is None:
+        return False
+
+    fn(il, *r[1])
+    return True
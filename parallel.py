@@ -0,0 +1,67 @@
+'''multi-process linear sweep
+
+the region is split into chunks that are decoded independently with
+decode_range and merged back in address order. a chunk boundary may fall in
+the middle of a 4-byte instruction, in which case the next chunk was decoded
+out of phase, so the merge re-decodes serially from the real instruction
+boundary until the two streams line up again (this usually takes one or two
+instructions).
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .sweep import decode_all, decode_range
+
+def _sweep_chunk(dat, base_addr, end, text):
+    # dat is the chunk plus 2 bytes of the next one, for the last instruction
+    return decode_all(dat, base_addr, 0, end, text)
+
+def chunks(size, chunk_size):
+    '''(start, end) offsets of the chunks, aligned to 2 bytes'''
+    chunk_size = max(2, chunk_size & ~1)
+    return [(s, min(s + chunk_size, size)) for s in range(0, size, chunk_size)]
+
+def merge(buf, base_addr, parts, text=True):
+    '''join per-chunk records, resyncing chunks that started out of phase'''
+    out = []
+    expect = 0
+
+    for (start, end), recs in parts:
+        i = 0
+        # the previous chunk ran past start, skip what it already covered
+        while i < len(recs) and recs[i].addr - base_addr < expect:
+            i += 1
+
+        if i < len(recs) and recs[i].addr - base_addr != expect:
+            index = {r.addr: j for j, r in enumerate(recs) if j >= i}
+
+            i = len(recs)
+            for r in decode_range(buf, base_addr, expect, end, text):
+                if r.addr in index:
+                    i = index[r.addr]
+                    break
+                out.append(r)
+                expect = r.addr - base_addr + r.length
+
+        out.extend(recs[i:])
+        if out:
+            expect = out[-1].addr - base_addr + out[-1].length
+
+    return out
+
+def parallel_sweep(buf, base_addr, chunk_size=1 << 20, workers=None, text=True):
+    '''linear sweep over buf using a process pool, returns the Records in order'''
+    dat = memoryview(buf).cast('B')
+    spans = chunks(len(dat), chunk_size)
+
+    if workers == 1 or len(spans) <= 1:
+        return decode_all(dat, base_addr, text=text)
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(_sweep_chunk, bytes(dat[s:e+2]), base_addr + s, e - s, text)
+            for s, e in spans
+        ]
+        parts = [(span, f.result()) for span, f in zip(spans, futures)]
+
+    return merge(dat, base_addr, parts, text)
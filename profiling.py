@@ -0,0 +1,228 @@
+'''opt-in profiling of the decoder and the RISCV callbacks
+
+from the binary ninja console (or any headless script):
+
+    from riscv_hacksec import profiling
+    profiling.enable()
+    ... run the analysis ...
+    profiling.disable()
+    profiling.dump_json('/tmp/decode.json')
+    profiling.dump_stats('/tmp/decode.prof')   # pstats.Stats, snakeviz, ...
+
+enable() swaps timing wrappers in for the decode function the cache and
+the sweep call and for the RISCV callbacks, disable() puts the originals
+back, so nothing is paid while profiling is off.
+
+recorded are calls and time per callback (split into the time spent
+decoding and the rest, which is lifting in get_instruction_low_level_il),
+time per decode mode (text and il include building the tokens / lifters)
+and a histogram of decode time per mnemonic. only real decodes are timed,
+cache hits only show up in the callback times.
+
+the callbacks may run on several analysis threads. nothing is locked, the
+running callback is tracked per thread and counters are created atomically,
+but concurrent updates of the same counter can lose a few calls: the
+numbers are for finding hot spots, not exact.
+'''
+import json
+import marshal
+import threading
+import time
+
+from . import instr
+
+CALLBACKS = ('get_instruction_info', 'get_instruction_text', 'get_instruction_low_level_il')
+MODES = {instr.INFO: 'info', instr.TEXT: 'text', instr.IL: 'il', instr.ALL: 'all'}
+
+# time buckets are powers of two in ns
+BUCKETS = 40
+
+class Counter(object):
+    __slots__ = ('calls', 'time', 'inner', 'min', 'max', 'buckets', 'callers')
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0
+        self.inner = 0
+        self.min = None
+        self.max = 0
+        self.buckets = [0] * BUCKETS
+        self.callers = {}
+
+    def add(self, t, caller=None):
+        self.calls += 1
+        self.time += t
+        if self.min is None or t < self.min:
+            self.min = t
+        if t > self.max:
+            self.max = t
+        self.buckets[min(t.bit_length(), BUCKETS - 1)] += 1
+
+        if caller is not None:
+            c = self.callers.get(caller)
+            if c is None:
+                c = self.callers[caller] = [0, 0]
+            c[0] += 1
+            c[1] += t
+
+    def as_dict(self):
+        d = {
+            'calls': self.calls,
+            'total_ns': self.time,
+            'mean_ns': self.time / self.calls if self.calls else 0,
+            'min_ns': self.min or 0,
+            'max_ns': self.max,
+            # [upper bound in ns, count] of the non empty buckets
+            'histogram': [[1 << i, n] for i, n in enumerate(self.buckets) if n],
+        }
+        if self.inner:
+            d['decode_ns'] = self.inner
+            d['self_ns'] = self.time - self.inner
+        return d
+
+callbacks = {}
+decoders = {}
+mnemonics = {}
+
+# raw instruction bytes -> mnemonic, for decodes that didn't build tokens
+_names = {}
+
+# callback currently running on each thread, decode time is charged to it
+_current = threading.local()
+
+# (object, attribute, original) of everything enable() replaced
+_saved = []
+
+def counter(table, key):
+    c = table.get(key)
+    if c is None:
+        c = table.setdefault(key, Counter())
+    return c
+
+def mnemonic(dat, addr, r):
+    if r is None:
+        return 'unk'
+    if r[0] is not None:
+        return r[0][0].text
+
+    n = 4 if (dat[0] & 0b11) == 0b11 else 2
+    key = bytes(dat[:n])
+    name = _names.get(key)
+    if name is None:
+        name = _names[key] = mnemonic(dat, addr, instr.decode(dat, addr, instr.TEXT))
+    return name
+
+def timed_decode(dat, addr, mode=instr.ALL):
+    t = time.perf_counter_ns()
+    r = instr.decode(dat, addr, mode)
+    t = time.perf_counter_ns() - t
+
+    caller = getattr(_current, 'name', None)
+    if caller is not None:
+        counter(callbacks, caller).inner += t
+    else:
+        caller = 'decode[%s]' % MODES[mode]
+
+    counter(decoders, MODES[mode]).add(t)
+    counter(mnemonics, mnemonic(dat, addr, r)).add(t, caller)
+
+    return r
+
+def timed_callback(name, fn):
+    def callback(*args):
+        outer = getattr(_current, 'name', None)
+        _current.name = name
+        t = time.perf_counter_ns()
+        try:
+            return fn(*args)
+        finally:
+            counter(callbacks, name).add(time.perf_counter_ns() - t)
+            _current.name = outer
+
+    callback.__name__ = fn.__name__
+    callback.__doc__ = fn.__doc__
+    return callback
+
+def riscv_class():
+    '''the RISCV architecture class, None without binaryninja'''
+    try:
+        from .riscv import RISCV
+    except ImportError:
+        return None
+    return RISCV
+
+def enabled():
+    return bool(_saved)
+
+def enable():
+    '''start recording, counters keep what was recorded earlier'''
+    if _saved:
+        return
+
+    from . import cache, sweep
+    for mod in (cache, sweep):
+        _saved.append((mod, 'decode', mod.decode))
+        mod.decode = timed_decode
+
+    RISCV = riscv_class()
+    if RISCV is not None:
+        for name in CALLBACKS:
+            fn = getattr(RISCV, name)
+            _saved.append((RISCV, name, fn))
+            setattr(RISCV, name, timed_callback(name, fn))
+
+def disable():
+    while _saved:
+        obj, name, orig = _saved.pop()
+        setattr(obj, name, orig)
+
+def reset():
+    callbacks.clear()
+    decoders.clear()
+    mnemonics.clear()
+    _names.clear()
+
+def report():
+    '''everything recorded so far as a json-able dict'''
+    r = {
+        'callbacks': {k: c.as_dict() for k, c in callbacks.items()},
+        'decode': {k: c.as_dict() for k, c in decoders.items()},
+        'mnemonics': {k: c.as_dict() for k, c in mnemonics.items()},
+    }
+
+    RISCV = riscv_class()
+    if RISCV is not None:
+        r['cache'] = RISCV.decode_cache.stats()
+
+    return r
+
+def dump_json(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=2, sort_keys=True)
+
+def pstats_key(name):
+    return ('riscv.py' if name in CALLBACKS else 'instr.py', 0, name)
+
+def dump_stats(path):
+    '''write the counters in the marshal format of cProfile / pstats
+
+    callbacks call decode:<mnemonic> entries, decodes outside of the
+    callbacks are called from decode[<mode>]
+    '''
+    s = 1e-9
+    stats = {}
+
+    for mode, c in decoders.items():
+        stats[pstats_key('decode[%s]' % mode)] = (c.calls, c.calls, 0.0, c.time * s, {})
+
+    for name, c in callbacks.items():
+        stats[pstats_key(name)] = (c.calls, c.calls, (c.time - c.inner) * s, c.time * s, {})
+
+    for name, c in mnemonics.items():
+        callers = {}
+        for caller, (calls, t) in c.callers.items():
+            callers[pstats_key(caller)] = (calls, calls, t * s, t * s)
+        stats[pstats_key('decode:' + name)] = (c.calls, c.calls, c.time * s, c.time * s, callers)
+
+    with open(path, 'wb') as f:
+        marshal.dump(stats, f)
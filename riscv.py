@@ -1,22 +1,70 @@
-from binaryninja.architecture import Architecture
+from binaryninja.architecture import Architecture, IntrinsicInfo, IntrinsicInput
 from binaryninja.function import RegisterInfo, InstructionInfo, InstructionTextToken
+from binaryninja.binaryview import BinaryDataNotification
 from binaryninja.enums import InstructionTextTokenType
+from binaryninja.plugin import BackgroundTaskThread
+from binaryninja.types import Type
 
-from .instr import decode, REGS, tT
+from .instr import REGS, FREGS, tT, INFO, TEXT, IL, decode_pair
+from .cache import DecodeCache
+from . import index
+from .lift import lift
 
 
 
+# bytes read past a cache miss
+READ_AHEAD = 256
+
 class RISCV(Architecture):
     name = 'riscv:hacksec'
     address_size = 8
     max_instr_length = 8
 
-    regs = { r:RegisterInfo(r, 8) for r in REGS }
+    regs = { r:RegisterInfo(r, 8) for r in REGS + FREGS }
     stack_pointer = 'sp'
 
+    # csr ops, (csr number, rs1 or immediate) -> old csr value
+    intrinsics = {
+        name: IntrinsicInfo([IntrinsicInput(Type.int(2, False), 'csr'), IntrinsicInput(Type.int(8), 'value')], [Type.int(8)])
+        for name in ('csrrw', 'csrrs', 'csrrc')
+    }
+
+    # fp ops without an llil equivalent, on the raw 8 byte registers
+    intrinsics['fmin'] = IntrinsicInfo([IntrinsicInput(Type.int(8), 'a'), IntrinsicInput(Type.int(8), 'b')], [Type.int(8)])
+    intrinsics['fmax'] = IntrinsicInfo([IntrinsicInput(Type.int(8), 'a'), IntrinsicInput(Type.int(8), 'b')], [Type.int(8)])
+    intrinsics['fclass'] = IntrinsicInfo([IntrinsicInput(Type.int(8), 'value')], [Type.int(8)])
+
+    # shared by the info / text / il callbacks for the same address
+    decode_cache = DecodeCache()
+
+    # with read_ahead a miss in get_instruction_info decodes the rest of the
+    # basic block, read from a riscv view holding the same bytes. every riscv
+    # view is kept (see watch_patches) so the flag can be set at any time,
+    # views are dropped again when their file is closed (see release_file).
+    # the list is replaced rather than modified
+    read_ahead = False
+    read_ahead_views = []
+
+    # lift auipc / lui pairs as one instruction with the resolved address
+    # (instr.decode_pair), pairs are not cached
+    fuse = False
+
     def get_instruction_info(self, data, addr):
 
-        r = decode(data, addr)
+        if self.fuse:
+            r = decode_pair(data, addr, INFO)
+            if r is not None:
+                return r[1]
+
+        if index.indexes:
+            h = index.lookup(data, addr)
+            if h is not None:
+                return h
+
+        if self.read_ahead:
+            r = self.decode_ahead(data, addr)
+        else:
+            r = self.decode_cache.decode(data, addr, INFO)
 
         if r is None:
             h = InstructionInfo()
@@ -25,9 +73,22 @@ class RISCV(Architecture):
 
         return r[1]
 
+    def decode_ahead(self, data, addr):
+        '''INFO decode of addr, decoding the rest of its block on a miss'''
+        e = self.decode_cache.peek(addr)
+        if e is None:
+            for view in self.read_ahead_views:
+                if view.start <= addr < view.end:
+                    buf = view.read(addr, READ_AHEAD)
+                    # only when the view has the bytes binary ninja passed in
+                    if len(buf) >= len(data) and buf[:len(data)] == data:
+                        return self.decode_cache.decode_block(buf, addr, INFO)
+
+        return self.decode_cache.decode(data, addr, INFO)
+
     def get_instruction_text(self, data, addr):
 
-        r = decode(data, addr)
+        r = self.fuse and decode_pair(data, addr, TEXT) or self.decode_cache.decode(data, addr, TEXT)
 
         if r is None:
             return [tT('unk')], 2
@@ -36,24 +97,73 @@ class RISCV(Architecture):
 
     def get_instruction_low_level_il(self, data, addr, il):
 
-        r = decode(data, addr)
+        r = self.fuse and decode_pair(data, addr, IL) or self.decode_cache.decode(data, addr, IL)
 
         if r is None:
             return 2
 
-        if len(r) >= 3:
-            fn = r[2]
-
-            if fn is not None:
-                if type(fn) is list:
-                    for f in fn:
-                        h = f(il)
-                        if h is not None:
-                            il.append(h)
-                else:
-                    il.append(fn(il))
-
-            return r[1].length
-
-        return 2
-
+        if r[2] is not None:
+            lift(il, r[2])
+
+        return r[1].length
+
+
+
+class PatchListener(BinaryDataNotification):
+    '''drops the cached decodes of patched bytes, not the whole cache'''
+
+    def data_written(self, view, offset, length):
+        RISCV.decode_cache.invalidate(offset, length)
+        index.invalidate(offset, length)
+
+    # inserted / removed data moves every later address
+
+    def data_inserted(self, view, offset, length):
+        RISCV.decode_cache.invalidate(offset)
+        index.invalidate(offset)
+
+    def data_removed(self, view, offset, length):
+        RISCV.decode_cache.invalidate(offset)
+        index.invalidate(offset)
+
+class IndexTask(BackgroundTaskThread):
+    '''builds (or loads) the decode indexes of a view off the finalization event'''
+
+    def __init__(self, view):
+        BackgroundTaskThread.__init__(self, 'Indexing RISC-V code', True)
+        self.view = view
+        self.session = view.file.session_id
+
+    def run(self):
+        try:
+            index.attach_view(self.view, self.session)
+        finally:
+            # closed while building, release_file may have run before the attach
+            if self.cancelled:
+                index.detach_owner(self.session)
+            index_tasks.pop(self.session, None)
+            self.view = None
+            self.finish()
+
+# session id -> IndexTask still running
+index_tasks = {}
+
+def watch_patches(view):
+    '''BinaryViewEvent callback, hooks the riscv views up to the caches'''
+    if view.arch is None or view.arch.name != RISCV.name:
+        return
+    view.register_notification(PatchListener())
+    if index.enabled:
+        task = index_tasks[view.file.session_id] = IndexTask(view)
+        task.start()
+    # kept whatever read_ahead says, so it can be turned on for open views
+    RISCV.read_ahead_views = RISCV.read_ahead_views + [view]
+
+def release_file(file):
+    '''drop what watch_patches kept for the views of a closed FileMetadata'''
+    session = file.session_id
+    task = index_tasks.pop(session, None)
+    if task is not None:
+        task.cancel()
+    index.detach_owner(session)
+    RISCV.read_ahead_views = [v for v in RISCV.read_ahead_views if v.file.session_id != session]
@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+from .instr import decode, INFO, TEXT
+
+# one instruction of a linear sweep, branches is a tuple of (BranchType, target)
+Record = namedtuple('Record', ['addr', 'length', 'mnemonic', 'operands', 'branches'])
+
+def record(r, addr, text=True):
+    '''Record for a decode result (None if the instruction is invalid)'''
+    if r is None:
+        # same fallback as the RISCV callbacks
+        return Record(addr, 2, 'unk' if text else None, '' if text else None, ())
+
+    tok, info = r[0], r[1]
+
+    mnemonic = operands = None
+    if text:
+        mnemonic = tok[0].text
+        operands = ''.join(t.text for t in tok[1:]).strip()
+
+    branches = tuple((b.type, b.target) for b in info.branches)
+
+    return Record(addr, info.length, mnemonic, operands, branches)
+
+def decode_range(buf, base_addr, start=0, end=None, text=True):
+    '''linear sweep over buf[start:end], yields a Record per instruction
+
+    buf can be anything supporting the buffer protocol, base_addr is the
+    address of buf[0]. invalid instructions are 2 bytes long, like in
+    RISCV.get_instruction_info, with text the mnemonic is 'unk'
+    '''
+    dat = memoryview(buf).cast('B')
+    if end is None:
+        end = len(dat)
+
+    mode = TEXT if text else INFO
+
+    off = start
+    while off < end:
+        addr = base_addr + off
+        r = record(decode(dat[off:off+4], addr, mode), addr, text)
+        yield r
+        off += r.length
+
+def decode_all(buf, base_addr, start=0, end=None, text=True):
+    '''decode_range as a list'''
+    return list(decode_range(buf, base_addr, start, end, text))
@@ -0,0 +1,43 @@
+'''the plugin directory is imported as the riscv_hacksec package
+
+run from the plugin directory with: python -m pytest tests
+'''
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'riscv_hacksec' not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        'riscv_hacksec', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['riscv_hacksec'] = module
+    spec.loader.exec_module(module)
+
+
+class RecordingIL(object):
+    '''stands in for LowLevelILFunction, expressions are nested tuples and
+    appended ones are kept in order'''
+
+    def __init__(self):
+        self.out = []
+
+    def __getattr__(self, name):
+        return lambda *args: (name,) + args
+
+    def append(self, expr):
+        self.out.append(expr)
+
+    def mark_label(self, label):
+        self.out.append(('mark_label',))
+
+    def get_label_for_address(self, arch, addr):
+        return None
+
+
+@pytest.fixture
+def il():
+    return RecordingIL()
@@ -0,0 +1,42 @@
+import struct
+
+import pytest
+
+from riscv_hacksec.columns import ColumnStore, NO_BRANCH
+
+def words(*ws):
+    return b''.join(struct.pack('<I', w) for w in ws)
+
+def test_fma_keeps_rs3():
+    # fmadd.s fa0, fa1, fa2, fa3
+    x = (13 << 27) | (12 << 20) | (11 << 15) | (10 << 7) | 0x43
+    row = ColumnStore.from_buffer(words(x), 0).row(0)
+
+    assert row['mnemonic'] == 'fmadd.s'
+    assert (row['rd'], row['rs1'], row['rs2'], row['rs3']) == (42, 43, 44, 45)
+
+def test_branch_to_zero():
+    # nop, then jal zero, -4 back to address 0
+    store = ColumnStore.from_buffer(words(0x00000013, 0xffdff06f), 0)
+    row = store.row(1)
+
+    assert row['mnemonic'] == 'jal'
+    assert row['branch'] != NO_BRANCH
+    assert row['target'] == 0
+    assert row['imm'] == -4
+
+def test_return_has_no_target():
+    row = ColumnStore.from_buffer(words(0x00008067), 0x1000).row(0)
+    assert row['branch'] != NO_BRANCH
+    assert (row['target'], row['imm']) == (0, 0)
+
+def test_npz_roundtrip(tmp_path):
+    pytest.importorskip('numpy')
+    x = (13 << 27) | (12 << 20) | (11 << 15) | (10 << 7) | 0x43
+    store = ColumnStore.from_buffer(words(x, 0x00008067, 0xffdff06f), 0x1000)
+
+    path = str(tmp_path / 'code.npz')
+    store.save_npz(path)
+    back = ColumnStore.load_npz(path)
+
+    assert [back.row(i) for i in range(len(back))] == [store.row(i) for i in range(len(store))]
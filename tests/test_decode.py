@@ -0,0 +1,202 @@
+import struct
+
+import pytest
+
+from riscv_hacksec.instr import decode
+from riscv_hacksec.lift import lift
+from riscv_hacksec.sweep import record
+
+def half(x):
+    return struct.pack('<H', x)
+
+def text(x, addr=0):
+    r = record(decode(half(x), addr), addr)
+    return r.mnemonic, r.operands, r.length
+
+def lifted(il, x, addr=0):
+    r = decode(half(x), addr)
+    assert lift(il, r[2])
+    return il.out
+
+def reg(r):
+    return ('reg', 8, r)
+
+# ------- compressed math group (op 01, funct3 100) -------
+
+@pytest.mark.parametrize('x, mnemonic, operands', [
+    (0x8105, 'c.srli', 'a0, a0, 0x1'),
+    (0x907d, 'c.srli', 's0, s0, 0x3f'),
+    (0x8405, 'c.srai', 's0, s0, 0x1'),
+    (0x957d, 'c.srai', 'a0, a0, 0x3f'),
+    (0x997d, 'c.andi', 'a0, a0, -0x1'),
+    (0x8941, 'c.andi', 'a0, a0, 0x10'),
+    (0x8d0d, 'c.sub', 'a0, a0, a1'),
+    (0x8d2d, 'c.xor', 'a0, a0, a1'),
+    (0x8d4d, 'c.or', 'a0, a0, a1'),
+    (0x8d6d, 'c.and', 'a0, a0, a1'),
+    (0x8c1d, 'c.sub', 's0, s0, a5'),
+    (0x9d0d, 'c.subw', 'a0, a0, a1'),
+    (0x9d2d, 'c.addw', 'a0, a0, a1'),
+])
+def test_c_math_text(x, mnemonic, operands):
+    assert text(x) == (mnemonic, operands, 2)
+
+@pytest.mark.parametrize('x', [0x9d41, 0x9d61, 0x9c5d, 0x9c7d])
+def test_c_math_reserved(x):
+    assert decode(half(x), 0) is None
+
+@pytest.mark.parametrize('x, expr', [
+    (0x8105, ('logical_shift_right', 8, reg('a0'), ('const', 8, 1))),
+    (0x957d, ('arith_shift_right', 8, reg('a0'), ('const', 8, 63))),
+    (0x997d, ('and_expr', 8, reg('a0'), ('const', 8, -1))),
+    (0x8d0d, ('sub', 8, reg('a0'), reg('a1'))),
+    (0x8d2d, ('xor_expr', 8, reg('a0'), reg('a1'))),
+    (0x8d4d, ('or_expr', 8, reg('a0'), reg('a1'))),
+    (0x8d6d, ('and_expr', 8, reg('a0'), reg('a1'))),
+    (0x9d0d, ('sign_extend', 8, ('sub', 4, ('low_part', 4, reg('a0')), ('low_part', 4, reg('a1'))))),
+    (0x9d2d, ('sign_extend', 8, ('add', 4, ('low_part', 4, reg('a0')), ('low_part', 4, reg('a1'))))),
+])
+def test_c_math_lift(il, x, expr):
+    assert lifted(il, x) == [('set_reg', 8, 'a0', expr)]
+
+# ------- base and compressed decode / lift -------
+
+def word(x):
+    return struct.pack('<I', x)
+
+def wtext(x, addr=0x1000):
+    r = record(decode(word(x), addr), addr)
+    return r.mnemonic, r.operands
+
+def wlifted(il, x, addr=0x1000):
+    assert lift(il, decode(word(x), addr)[2])
+    return il.out
+
+@pytest.fixture
+def labels(monkeypatch):
+    '''branch lifting without binaryninja, no label is ever found'''
+    from riscv_hacksec import lift as lift_module
+    monkeypatch.setattr(lift_module, 'LowLevelILLabel', lambda: 'label')
+    monkeypatch.setattr(lift_module, 'riscv_arch', lambda: None)
+
+@pytest.mark.parametrize('x, mnemonic, operands', [
+    (0x00c5f533, 'and', 'a0, a1, a2'),
+    (0x00c5c533, 'xor', 'a0, a1, a2'),
+    (0x02c5c533, 'div', 'a0, a1, a2'),
+    (0x00c59533, 'sll', 'a0, a1, a2'),
+    (0x02c5453b, 'divw', 'a0, a0, a2'),
+    (0x02055513, 'srli', 'a0, a0, 0x20'),
+    (0x03f51513, 'slli', 'a0, a0, 0x3f'),
+    (0x01f5151b, 'slliw', 'a0, a0, 0x1f'),
+    (0x43f55513, 'srai', 'a0, a0, 0x3f'),
+    (0x80000537, 'lui', 'a0, 0x80000000'),
+    (0x340fd073, 'csrrwi', 'zero, 31, mscratch'),
+    (0x000280e7, 'jalr', 'ra, t0+0x0'),
+    (0x00008067, 'ret', ''),
+])
+def test_base_text(x, mnemonic, operands):
+    assert wtext(x) == (mnemonic, operands)
+
+@pytest.mark.parametrize('x, mnemonic, operands', [
+    (0x157d, 'c.addi', 'a0, a0, -0x1'),
+    (0x357d, 'c.addiw', 'a0, a0, -0x1'),
+    (0x557d, 'c.li', 'a0, -0x1'),
+    (0x7139, 'c.addi16sp', 'sp, -0x40'),
+    (0x757d, 'c.lui', 'a0, -0x1000'),
+    (0x9282, 'c.jalr', 't0'),
+])
+def test_compressed_text(x, mnemonic, operands):
+    assert text(x) == (mnemonic, operands, 2)
+
+@pytest.mark.parametrize('x', [
+    0x00007503,     # load funct3 111
+    0x00004023,     # store funct3 100 - 111
+    0x00005023,
+    0x00006023,
+    0x00007023,
+    0x44055513,     # srli / srai with another funct7
+    0x06055513,
+    0x60051513,     # clz (Zbb), slli with funct7 0110000
+    0x40051513,     # slli with funct7 0100000
+    0x0405151b,     # slliw with shamt[5]
+    0x4005151b,     # slliw with funct7 0100000
+    0x40b54533,     # xnor (Zbb), not xor
+    0x40b57533,     # andn (Zbb), not and
+    0x40b56533,     # orn (Zbb), not or
+    0x20b52533,     # sh1add (Zba), not slt
+    0x0ab54533,     # min (Zbb), not div
+    0x40b51533,     # sll with funct7 0100000
+    0x60b5153b,     # rolw (Zbb), not sllw
+    0x08b5053b,     # add.uw (Zba), not addw / mulw
+    0x06b5453b,     # divw with funct7 0000011
+])
+def test_reserved_base(x):
+    assert decode(word(x), 0) is None
+
+def test_calls_are_not_returns():
+    # jalr ra, 0(t0) and c.jalr t0 are calls, they don't end the block
+    assert decode(word(0x000280e7), 0)[1].branches == []
+    assert decode(half(0x9282), 0)[1].branches == []
+
+    ret = decode(word(0x00008067), 0)[1].branches
+    assert [b.type for b in ret] == [4]
+
+def not_odd(expr):
+    return ('and_expr', 8, expr, ('const', 8, -2))
+
+def test_jalr_call_lift(il):
+    assert wlifted(il, 0x000280e7) == [('call', not_odd(reg('t0')))]
+
+def test_ret_lift(il):
+    assert wlifted(il, 0x00008067) == [('ret', reg('ra'))]
+
+def test_jalr_jump_lift(il):
+    # jr t0+0x8
+    assert wlifted(il, 0x00828067) == [('jump', not_odd(('add', 8, reg('t0'), ('const', 8, 8))))]
+
+def test_link_registers_are_calls(il, monkeypatch):
+    from riscv_hacksec import lift as lift_module
+    monkeypatch.setattr(lift_module, 'LLIL_TEMP', lambda i: 'temp%d' % i)
+
+    # jalr t1, 0(t0): no branch in the info, a call in the il
+    assert decode(word(0x00028367), 0x1000)[1].branches == []
+    assert wlifted(il, 0x00028367) == [
+        ('set_reg', 8, 'temp0', not_odd(reg('t0'))),
+        ('set_reg', 8, 't1', ('const_pointer', 8, 0x1004)),
+        ('call', ('reg', 8, 'temp0')),
+    ]
+
+    # jal t0, +0x10: a CallDestination in the info, a call in the il
+    il.out = []
+    assert [(int(b.type), b.target) for b in decode(word(0x010002ef), 0x1000)[1].branches] == [(3, 0x1010)]
+    assert wlifted(il, 0x010002ef) == [
+        ('set_reg', 8, 't0', ('const_pointer', 8, 0x1004)),
+        ('call', ('const_pointer', 8, 0x1010)),
+    ]
+
+def test_c_lw_sign_extends(il):
+    assert lifted(il, 0x4188) == [
+        ('set_reg', 8, 'a0', ('sign_extend', 8, ('load', 4, ('add', 8, reg('a1'), ('const', 8, 0)))))]
+
+def test_c_sw_stores_a_word(il):
+    assert lifted(il, 0xc188) == [
+        ('store', 4, ('add', 8, reg('a1'), ('const', 8, 0)), ('low_part', 4, reg('a0')))]
+
+def test_lui_sign_extends(il):
+    assert wlifted(il, 0x80000537) == [('set_reg', 8, 'a0', ('const', 8, -0x80000000))]
+
+def test_x0(il):
+    # writes to x0 are nops, reads are 0
+    assert wlifted(il, 0x00000013) == [('nop',)]
+    il.out = []
+    assert wlifted(il, 0x00b00533) == [('set_reg', 8, 'a0', ('add', 8, ('const', 8, 0), reg('a1')))]
+
+@pytest.mark.parametrize('x, cmp', [
+    (0x00b55463, 'compare_signed_greater_equal'),
+    (0x00b57463, 'compare_unsigned_greater_equal'),
+    (0x00b54463, 'compare_signed_less_than'),
+])
+def test_branch_compare(il, labels, x, cmp):
+    out = wlifted(il, x)
+    assert out[0][0] == 'if_expr'
+    assert out[0][1] == (cmp, 8, reg('a0'), reg('a1'))
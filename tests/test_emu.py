@@ -0,0 +1,70 @@
+import struct
+
+import pytest
+
+from riscv_hacksec.emu import Emulator
+
+EBREAK = 0x00100073
+
+def prog(*items):
+    '''32-bit words and (halfword,) tuples'''
+    return b''.join(struct.pack('<H', x[0]) if type(x) is tuple else struct.pack('<I', x) for x in items)
+
+def load(code, func=None):
+    e = Emulator()
+    e.mem.write_bytes(0x1000, code)
+    if func is not None:
+        e.mem.write_bytes(0x1100, func)
+    return e
+
+# addi a0, zero, 1 / ret
+FUNC = prog(0x00100513, 0x00008067)
+
+# lui t0, 0x1 / addi t0, t0, 0x100
+T0_FUNC = (0x000012b7, 0x10028293)
+
+@pytest.mark.parametrize('call, ret', [
+    (0x000280e7, 0x100c),       # jalr ra, 0(t0)
+    ((0x9282,), 0x100a),        # c.jalr t0
+])
+def test_call_through_register(call, ret):
+    e = load(prog(*T0_FUNC + (call, EBREAK)), FUNC)
+
+    assert e.run(0x1000) == 'ebreak'
+    assert e.pc == ret
+    assert e.reg('a0') == 1
+    assert e.reg('ra') == ret
+    # lui, addi, the call, addi, ret
+    assert e.steps == 5
+
+def test_jump_through_register():
+    # c.jr t0 never comes back, the ebreak after it doesn't run
+    e = load(prog(*T0_FUNC + ((0x8282,), EBREAK)), prog(0x00200513, EBREAK))
+
+    assert e.run(0x1000) == 'ebreak'
+    assert e.pc == 0x1104
+    assert e.reg('a0') == 2
+
+def test_steps_up_to_a_stop():
+    # addi a0, zero, 1 twice, then a load from an unmapped address
+    e = load(prog(0x00100513, 0x00100513, 0x00003503))
+
+    assert e.run(0x1000) == 'fault'
+    assert e.pc == 0x1008
+    assert e.steps == 2
+
+def test_loop():
+    # sum 1..100: a0 += a1, a1 -= 1, bnez a1
+    e = load(prog(0x00000513, 0x06400593, 0x00b50533, 0xfff58593, 0xfe059ce3, EBREAK))
+
+    assert e.run(0x1000) == 'ebreak'
+    assert e.reg('a0') == 5050
+
+def test_block_end():
+    from riscv_hacksec.emu import BLOCK_END
+
+    assert BLOCK_END == {
+        'jal', 'jalr', 'c.j', 'c.jr', 'c.jalr',
+        'beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'c.beqz', 'c.bnez',
+        'ecall', 'ebreak', 'c.ebreak', 'illegal', 'uret', 'sret', 'mret', 'fence.I',
+    }
@@ -0,0 +1,55 @@
+import random
+import struct
+
+from riscv_hacksec import index
+from riscv_hacksec.instr import decode, INFO
+
+def code(seed=1, n=4096):
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(n))
+
+def info_key(h):
+    return h.length, [(int(b.type), b.target) for b in h.branches]
+
+def test_lookup_matches_decode(tmp_path):
+    buf = code()
+    idx = index.load_or_build(str(tmp_path), buf, 0x1000)
+
+    for off in range(0, len(buf) - 4, 2):
+        addr = 0x1000 + off
+        h = idx.info(buf[off:off+4], addr)
+        if h is None:
+            continue
+        r = decode(buf[off:off+4], addr, INFO)
+        assert info_key(h) == (info_key(r[1]) if r is not None else (2, []))
+
+def test_lookup_checks_the_bytes(tmp_path, monkeypatch):
+    # jal ra, +0x10 indexed at 0x1000, another view has addi there
+    buf = struct.pack('<II', 0x010000ef, 0x00000013)
+    idx = index.load_or_build(str(tmp_path), buf, 0x1000)
+    monkeypatch.setattr(index, 'indexes', [])
+    index.attach(idx)
+
+    h = index.lookup(buf, 0x1000)
+    assert info_key(h) == (4, [(3, 0x1010)])
+    assert index.lookup(struct.pack('<I', 0x00100513), 0x1000) is None
+
+    idx.owner = 'view'
+    index.detach_owner('view')
+    assert index.indexes == []
+
+def test_rebuilds_other_versions(tmp_path):
+    buf = code(2, 64)
+    path = index.index_path(str(tmp_path), 0, index.digest(buf))
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 128)
+
+    idx = index.load_or_build(str(tmp_path), buf, 0)
+    assert idx.sha == index.digest(buf)
+
+def test_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(index.sys, 'platform', 'linux')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    a = index.cache_dir('/a/firmware.bndb')
+    assert a.startswith(str(tmp_path))
+    assert a != index.cache_dir('/b/firmware.bndb')
@@ -0,0 +1,137 @@
+import random
+import struct
+import sys
+import threading
+
+import pytest
+
+from conftest import RecordingIL
+
+from riscv_hacksec.cache import DecodeCache
+from riscv_hacksec.instr import decode, INFO, TEXT, IL, ALL
+
+THREADS = 16
+ROUNDS = 3
+
+def corpus(seed=1, n=1500):
+    '''random 32-bit and compressed instructions at distinct addresses'''
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        if rnd.random() < 0.5:
+            d = struct.pack('<I', rnd.getrandbits(32) | 0b11)
+        else:
+            d = struct.pack('<H', rnd.getrandbits(16) & ~0b11 | rnd.randrange(3)) + b'\0\0'
+        out.append((d, 0x1000 + i * 4))
+    return out
+
+def key(r, mode):
+    '''the parts of a decode result mode asks for'''
+    if r is None:
+        return None
+    info = (r[1].length, tuple((int(b.type), b.target) for b in r[1].branches))
+    tok = tuple(t.text for t in r[0]) if mode & TEXT else None
+    lift = r[2] if mode & IL else None
+    return info, tok, lift
+
+def plain(x):
+    '''il expressions with the labels (new objects on every lift) as their type'''
+    if type(x) in (list, tuple):
+        return tuple(plain(y) for y in x)
+    if x is None or type(x) in (int, str):
+        return x
+    return type(x).__name__
+
+def hammer(work, n, seed=0):
+    '''work(rnd, i) from THREADS threads at once over a shuffled range(n),
+    returns the failures it reported'''
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        order = list(range(n))
+        start.wait()
+        for _ in range(ROUNDS):
+            rnd.shuffle(order)
+            for i in order:
+                e = work(rnd, i)
+                if e is not None:
+                    errors.append(e)
+
+    pool = [threading.Thread(target=worker, args=(seed + t,)) for t in range(THREADS)]
+
+    # switch threads often so they interleave inside the cache
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    return errors
+
+def test_decode_cache_threads():
+    items = corpus()
+    modes = (INFO, TEXT, IL, ALL)
+    expect = [{m: key(decode(d, a, m), m) for m in modes} for d, a in items]
+
+    # small, so entries are evicted, merged and invalidated under the readers
+    cache = DecodeCache(size=256)
+
+    def work(rnd, i):
+        d, a = items[i]
+        m = rnd.choice(modes)
+        if key(cache.decode(d, a, m), m) != expect[i][m]:
+            return (a, m)
+        if rnd.random() < 0.01:
+            cache.invalidate(a, 2)
+
+    assert hammer(work, len(items)) == []
+
+    s = cache.stats()
+    assert s['entries'] <= s['size']
+
+def test_callbacks_threads(monkeypatch):
+    pytest.importorskip('binaryninja')
+    from riscv_hacksec.riscv import RISCV
+
+    arch = RISCV()
+    cache = DecodeCache(size=256)
+    monkeypatch.setattr(RISCV, 'decode_cache', cache)
+
+    def info(d, a):
+        h = arch.get_instruction_info(d, a)
+        return h.length, tuple((int(b.type), b.target) for b in h.branches)
+
+    def text(d, a):
+        tok, n = arch.get_instruction_text(d, a)
+        return tuple(t.text for t in tok), n
+
+    def lift(d, a):
+        il = RecordingIL()
+        n = arch.get_instruction_low_level_il(d, a, il)
+        return n, plain(il.out)
+
+    fns = (info, text, lift)
+    items = corpus(2)
+
+    # single threaded on a cold cache
+    expect = []
+    for d, a in items:
+        cache.clear()
+        expect.append([fn(d, a) for fn in fns])
+    cache.clear()
+
+    def work(rnd, i):
+        d, a = items[i]
+        k = rnd.randrange(len(fns))
+        if fns[k](d, a) != expect[i][k]:
+            return (a, fns[k].__name__)
+        if rnd.random() < 0.01:
+            cache.invalidate(a, 2)
+
+    assert hammer(work, len(items)) == []
@@ -0,0 +1,34 @@
+import random
+import struct
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from riscv_hacksec import vector
+from riscv_hacksec.instr import decode
+from riscv_hacksec.sweep import decode_all
+
+def check_sweep(buf, base):
+    out = vector.sweep(buf, base)
+    ref = decode_all(buf, base, text=False)
+
+    assert out['addr'].tolist() == [r.addr for r in ref]
+    assert out['length'].tolist() == [r.length for r in ref]
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_sweep_matches_scalar(seed):
+    rnd = random.Random(seed)
+    check_sweep(bytes(rnd.getrandbits(8) for _ in range(200000)), 0x1000)
+
+def test_sweep_rejects_like_decode():
+    # words the decode table accepts but whose handler rejects them
+    words = [
+        0xc284eed3,     # fcvt.*.s with rs2 = 8
+        0xd2f57553,     # fcvt.d.* with rs2 = 15
+        0x00300073,     # SYSTEM, imm 3
+    ]
+    for x in words:
+        assert decode(struct.pack('<I', x), 0) is None
+
+    check_sweep(b''.join(struct.pack('<I', x) for x in words), 0)
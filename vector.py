@@ -0,0 +1,166 @@
+'''vectorized field extraction for bulk decoding, needs numpy
+
+fields are computed for every candidate position of a code region at once,
+with the same values as the Instr / CInstr accessors, so python objects are
+only needed to render the instructions that are actually shown
+'''
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .instr import BASE_TABLE, CInstr, Instr, INFO, decode_base, decode_compressed, may_reject
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('vectorized decoding needs numpy')
+
+def halfwords(buf):
+    '''the region as little endian halfwords, a trailing odd byte is ignored'''
+    _require_numpy()
+    return np.frombuffer(buf, dtype='<u2', count=len(buf) // 2)
+
+def candidate_words(h):
+    '''32-bit word starting at every halfword, zero padded past the end'''
+    w = h.astype(np.uint32)
+    w[:-1] |= h[1:].astype(np.uint32) << 16
+    return w
+
+def is_compressed(h):
+    return (h & 0b11) != 0b11
+
+def base_fields(w):
+    '''Instr fields for an array of 32-bit words'''
+    w = w.astype(np.int64)
+
+    f = {
+        'base': w & 0b11,
+        'op': (w >> 2) & 0x1f,
+        'opcode': w & 0x7f,
+        'rd': (w >> 7) & 0x1f,
+        'rs1': (w >> 15) & 0x1f,
+        'rs2': (w >> 20) & 0x1f,
+        'funct3': (w >> 12) & 0b111,
+        'funct7': (w >> 25) & 0x7f,
+        'imm_i': (w >> 20) & 0xfff,
+        'imm_s': ((w >> 20) & 0xfe0) | ((w >> 7) & 0x1f),
+        'imm_b': ((w >> 19) & 0x1000) | ((w << 4) & 0x800) | ((w >> 20) & 0x7e0) | ((w >> 7) & 0x1e),
+        'imm_u': w & 0xfffff000,
+        'imm_j': ((w >> 11) & 0x100000) | (w & 0xff000) | ((w >> 9) & 0x800) | ((w >> 20) & 0x7fe),
+    }
+
+    f['imm_i_ext'] = (f['imm_i'] ^ 0x800) - 0x800
+    f['imm_s_ext'] = (f['imm_s'] ^ 0x800) - 0x800
+    f['imm_b_ext'] = (f['imm_b'] ^ 0x1000) - 0x1000
+    f['imm_j_ext'] = (f['imm_j'] ^ 0x100000) - 0x100000
+
+    return f
+
+def compressed_fields(h):
+    '''CInstr fields for an array of halfwords'''
+    h = h.astype(np.int64)
+
+    return {
+        'op': h & 0b11,
+        'rd': (h >> 7) & 0x1f,
+        'rs1': (h >> 7) & 0x1f,
+        'rs2': (h >> 2) & 0x1f,
+        'rd_c': (h >> 2) & 0b111,
+        'rs1_c': (h >> 7) & 0b111,
+        'rs2_c': (h >> 2) & 0b111,
+        'funct2': (h >> 5) & 0b11,
+        'funct3': (h >> 13) & 0b111,
+        'funct4': (h >> 12) & 0xf,
+        'funct6': (h >> 10) & 0x3f,
+        'imm_ci': ((h >> 7) & 0x20) | ((h >> 2) & 0x1f),
+        'imm_css': (h >> 7) & 0x3f,
+        'imm_ciw': (h >> 5) & 0xff,
+        'imm_cl': ((h >> 8) & 0x1c) | ((h >> 5) & 0b11),
+        'imm_cs': ((h >> 8) & 0x1c) | ((h >> 5) & 0b11),
+        'offset': ((h >> 5) & 0xe0) | ((h >> 2) & 0x1f),
+        'jump_target': (h >> 2) & 0x7ff,
+    }
+
+def base_index(w):
+    '''decode_base dispatch index for an array of 32-bit words'''
+    w = w.astype(np.int64)
+    return (((w >> 2) & 0x1f) << 10) | (((w >> 12) & 0b111) << 7) | (w >> 25)
+
+# validity lookups, built on first use
+_tables = {}
+
+def _valid_tables():
+    if not _tables:
+        _tables['base'] = np.array([fn is not None for fn in BASE_TABLE])
+        _tables['recheck'] = np.array([may_reject(fn) for fn in BASE_TABLE])
+        _tables['compressed'] = np.array([
+            x & 0b11 != 0b11 and decode_compressed(CInstr(x), 0, INFO) is not None
+            for x in range(0x10000)
+        ])
+    return _tables
+
+def lengths(h, w=None):
+    '''instruction length in bytes at every halfword position
+
+    invalid and truncated instructions are 2 bytes long, like in
+    RISCV.get_instruction_info
+    '''
+    t = _valid_tables()
+    if w is None:
+        w = candidate_words(h)
+
+    valid = t['base'][base_index(w)]
+
+    # the SYSTEM group and fcvt also look at other fields
+    check = np.nonzero(valid & t['recheck'][base_index(w)])[0]
+    for i in check:
+        valid[i] = decode_base(Instr(int(w[i])), 0, INFO) is not None
+
+    # the last halfword can't start a 32-bit instruction
+    if len(valid):
+        valid[-1] = False
+
+    return np.where(is_compressed(h) | ~valid, 2, 4).astype(np.uint8)
+
+def sweep_starts(lens):
+    '''halfword offsets visited by a linear sweep from the start of the region'''
+    step = (lens // 2).tolist()
+    n = len(step)
+
+    starts = []
+    i = 0
+    while i < n:
+        starts.append(i)
+        i += step[i]
+
+    return np.array(starts, dtype=np.int64)
+
+def sweep(buf, base_addr=0):
+    '''vectorized linear sweep over buf
+
+    returns a dict of arrays with one entry per instruction: addr, length,
+    compressed, the raw word (halfword for compressed instructions) and the
+    base and compressed fields prefixed with 'b_' and 'c_'. fields of the
+    other format are computed as well and should be masked with compressed
+    '''
+    h = halfwords(buf)
+    w = candidate_words(h)
+    lens = lengths(h, w)
+
+    starts = sweep_starts(lens)
+    comp = is_compressed(h[starts])
+    raw = np.where(comp, h[starts], w[starts])
+
+    out = {
+        'addr': base_addr + starts * 2,
+        'length': lens[starts],
+        'compressed': comp,
+        'raw': raw,
+    }
+
+    for k, v in base_fields(w[starts]).items():
+        out['b_' + k] = v
+    for k, v in compressed_fields(h[starts]).items():
+        out['c_' + k] = v
+
+    return out